@@ -0,0 +1,111 @@
+"""
+Script to calibrate password hashing cost on this machine
+Measures hash/verify time per bcrypt cost (and argon2 if argon2-cffi is
+installed) and recommends settings for a target login latency
+
+Usage: python calibrate_passwords.py --target-ms 250 --concurrency 20 --burst-ms 2000
+"""
+import argparse
+import math
+import os
+import statistics
+import time
+
+from services.passwords import build_crypt_context
+
+PASSWORD = "Calibration-Password-123!"
+
+# (time_cost, memory_cost KiB) pairs tried for argon2
+ARGON2_CANDIDATES = [(2, 19456), (2, 65536), (3, 65536), (4, 131072)]
+
+
+def measure(context, samples: int) -> tuple:
+    """Return median (hash_ms, verify_ms) for a CryptContext"""
+    hash_times, verify_times = [], []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hashed = context.hash(PASSWORD)
+        hash_times.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        context.verify(PASSWORD, hashed)
+        verify_times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(hash_times), statistics.median(verify_times)
+
+
+def capacity(verify_ms: float, workers: int, concurrency: int) -> tuple:
+    """Logins per second and worst-case latency of a burst of `concurrency`
+    logins served by `workers` hashing threads"""
+    per_second = workers * 1000 / verify_ms
+    worst_case_ms = math.ceil(concurrency / workers) * verify_ms
+    return per_second, worst_case_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=250, help="acceptable verify time for one login")
+    parser.add_argument("--concurrency", type=int, default=10, help="simultaneous logins to plan for")
+    parser.add_argument("--burst-ms", type=float, default=2000, help="acceptable time to drain such a burst")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="hashing threads")
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"🔬 Calibrating on {os.cpu_count()} CPUs with {args.workers} hashing workers")
+    print(f"   Target verify time: {args.target_ms:.0f} ms, "
+          f"burst of {args.concurrency} logins within {args.burst_ms:.0f} ms\n")
+
+    results = []
+    print(f"{'scheme':<28}{'hash ms':>10}{'verify ms':>11}{'logins/s':>10}{'burst p100 ms':>15}")
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        hash_ms, verify_ms = measure(build_crypt_context(["bcrypt"], bcrypt_rounds=rounds), args.samples)
+        results.append((f"bcrypt rounds={rounds}", {"PASSWORD_SCHEMES": "bcrypt", "BCRYPT_ROUNDS": rounds}, verify_ms))
+        per_second, worst_ms = capacity(verify_ms, args.workers, args.concurrency)
+        print(f"{results[-1][0]:<28}{hash_ms:>10.1f}{verify_ms:>11.1f}{per_second:>10.1f}{worst_ms:>15.0f}")
+
+    from passlib.hash import argon2
+    if argon2.has_backend():
+        for time_cost, memory_cost in ARGON2_CANDIDATES:
+            context = build_crypt_context(
+                ["argon2"], argon2_time_cost=time_cost, argon2_memory_cost=memory_cost,
+                argon2_parallelism=1
+            )
+            hash_ms, verify_ms = measure(context, args.samples)
+            env = {
+                "PASSWORD_SCHEMES": "argon2,bcrypt", "ARGON2_TIME_COST": time_cost,
+                "ARGON2_MEMORY_COST": memory_cost, "ARGON2_PARALLELISM": 1
+            }
+            results.append((f"argon2 t={time_cost} m={memory_cost // 1024}MiB", env, verify_ms))
+            per_second, worst_ms = capacity(verify_ms, args.workers, args.concurrency)
+            print(f"{results[-1][0]:<28}{hash_ms:>10.1f}{verify_ms:>11.1f}{per_second:>10.1f}{worst_ms:>15.0f}")
+    else:
+        print("(argon2 skipped: install argon2-cffi to compare it)")
+
+    # Strongest setting that meets both the single-login and burst targets
+    within_target = [
+        result for result in results
+        if result[2] <= args.target_ms
+        and capacity(result[2], args.workers, args.concurrency)[1] <= args.burst_ms
+    ]
+    if not within_target:
+        print("\n❌ No setting meets the targets; add hashing workers, relax the targets or use faster hardware")
+        return
+    name, env, verify_ms = max(within_target, key=lambda result: result[2])
+    per_second, worst_ms = capacity(verify_ms, args.workers, args.concurrency)
+
+    # Admit only as many queued logins as can finish within the burst budget
+    queue_limit = max(args.workers, int(args.burst_ms / verify_ms) * args.workers)
+
+    print(f"\n✅ Recommended: {name}")
+    print(f"   ~{per_second:.0f} logins/s, a burst of {args.concurrency} finishes in ~{worst_ms:.0f} ms\n")
+    print("📋 Environment settings:")
+    for key, value in env.items():
+        print(f"   {key}={value}")
+    print(f"   PASSWORD_HASH_WORKERS={args.workers}")
+    print(f"   PASSWORD_HASH_QUEUE_LIMIT={queue_limit}")
+    print("\n⚠️  Existing hashes are upgraded to the new settings on each user's next login")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,6 @@ Run this once to set up the admin account
 """
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
-from passlib.context import CryptContext
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -14,7 +13,8 @@ from datetime import datetime
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Imported after load_dotenv so the hashing policy in .env applies
+from services.passwords import hash_password
 
 async def create_admin_user():
     # Connect to MongoDB
@@ -33,7 +33,7 @@ async def create_admin_user():
         "id": str(uuid.uuid4()),
         "email": "admin@3dprintpro.com",
         "username": "admin",
-        "hashed_password": pwd_context.hash("Admin123!"),
+        "hashed_password": await hash_password("Admin123!"),
         "role": "admin",
         "created_at": datetime.utcnow(),
         "is_active": True
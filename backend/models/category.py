@@ -9,6 +9,7 @@ class Category(BaseModel):
     slug: str
     description: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 1  # Incremented on every update, checked against If-Match
 
 class CategoryCreate(BaseModel):
     name: str
@@ -24,3 +25,4 @@ class CategoryResponse(BaseModel):
     slug: str
     description: Optional[str] = None
     created_at: datetime
+    version: int = 0  # Documents created before versioning have none
@@ -1,8 +1,37 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 import uuid
 
+class MeshAnalysis(BaseModel):
+    triangle_count: int
+    bbox_min: List[float]
+    bbox_max: List[float]
+    dimensions: List[float]
+    surface_area: float
+    volume: float  # signed; negative if the normals point inwards
+    unit: str = "millimeter"
+
+class QuoteOption(BaseModel):
+    material: str
+    weight_grams: float
+    print_hours: float
+    price: float
+
+class Quote(BaseModel):
+    currency: str
+    rates: str  # fingerprint of the rate table used
+    quoted_at: datetime
+    options: List[QuoteOption]
+
+class RequoteRequest(BaseModel):
+    # Defaults to every analyzed submission not yet quoted under the current rates
+    submission_ids: Optional[List[str]] = None
+
+class RequoteResult(BaseModel):
+    requoted: int
+    rates: str
+
 class ContactSubmission(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -10,10 +39,18 @@ class ContactSubmission(BaseModel):
     phone: Optional[str] = None
     service_type: str
     message: str
-    file_name: Optional[str] = None
-    file_path: Optional[str] = None
+    file_name: Optional[str] = None  # original name as uploaded
+    file_path: Optional[str] = None  # content-addressed blob, shared by identical files
+    file_size: Optional[int] = None
+    file_sha256: Optional[str] = None
+    mesh: Optional[MeshAnalysis] = None
+    quote: Optional[Quote] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    job_id: Optional[str] = None  # background processing of the uploaded mesh
+    processing_error: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    status: str = "pending"
+    status: str = "pending"  # "pending", "processing", "analyzed" or "failed"
 
 class ContactResponse(BaseModel):
     id: str
@@ -23,3 +60,14 @@ class ContactResponse(BaseModel):
     message: str
     created_at: datetime
     status: str
+    mesh: Optional[MeshAnalysis] = None
+    quote: Optional[Quote] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    job_id: Optional[str] = None
+
+class ContactInboxEntry(ContactResponse):
+    phone: Optional[str] = None
+    file_name: Optional[str] = None
+    file_size: Optional[int] = None
+    processing_error: Optional[str] = None
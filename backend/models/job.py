@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import Any, Optional
+from datetime import datetime
+
+class JobProgress(BaseModel):
+    stage: str
+    step: int
+    steps: int
+    percent: int
+
+class JobResponse(BaseModel):
+    id: str
+    type: str
+    status: str  # "queued", "running", "succeeded" or "failed"
+    submission_id: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    progress: JobProgress
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    run_at: datetime
+    created_at: datetime
+    updated_at: datetime
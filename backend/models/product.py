@@ -13,6 +13,7 @@ class Product(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
+    version: int = 1  # Incremented on every update, checked against If-Match
 
 class ProductCreate(BaseModel):
     name: str
@@ -21,6 +22,20 @@ class ProductCreate(BaseModel):
     image_url: str
     category_ids: List[str] = []
 
+class ProductImportRow(ProductCreate):
+    id: Optional[str] = None  # Existing products are updated, new ids inserted
+    is_active: bool = True
+
+class ProductImportError(BaseModel):
+    row: int
+    error: str
+
+class ProductImportResult(BaseModel):
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[ProductImportError]  # Only the first errors; failed has the total
+
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
@@ -40,3 +55,23 @@ class ProductResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     is_active: bool
+    version: int = 0  # Documents created before versioning have none
+
+class CategoryFacet(BaseModel):
+    category_id: str
+    name: Optional[str] = None  # None if the category no longer exists
+    slug: Optional[str] = None
+    count: int
+
+class PriceBucket(BaseModel):
+    min: float
+    max: float
+    count: int
+
+class ProductFacets(BaseModel):
+    products: List[ProductResponse]
+    total: int
+    category_counts: List[CategoryFacet]
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    price_histogram: List[PriceBucket]
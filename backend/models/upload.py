@@ -0,0 +1,38 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime, timedelta
+import os
+import uuid
+
+UPLOAD_SESSION_TTL_HOURS = int(os.environ.get("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0)
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")
+
+class UploadSession(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    size: int
+    sha256: Optional[str] = None  # expected hash, if the client sent one
+    received: List[List[int]] = []  # [start, end) byte ranges written so far
+    status: str = "open"  # "open", "assembling" or "complete"
+    node: Optional[str] = None  # host whose disk holds the partial file
+    assembling_at: Optional[datetime] = None  # when "assembling" was taken
+    file_path: Optional[str] = None
+    submission_id: Optional[str] = None  # set once attached to a contact submission
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(
+        default_factory=lambda: datetime.utcnow() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    )
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int  # length of the contiguous prefix received
+    received: List[List[int]]
+    status: str
+    sha256: Optional[str] = None
+    expires_at: datetime
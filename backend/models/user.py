@@ -21,6 +21,12 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class UserResponse(BaseModel):
     id: str
     email: str
@@ -1,51 +1,68 @@
-from fastapi import APIRouter, HTTPException, status
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
-from models.user import User, UserCreate, UserLogin, UserResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from models.user import User, UserCreate, UserLogin, UserResponse, RefreshRequest, LogoutRequest
+from services.auth import (
+    cache_user, create_access_token, create_auth_dependencies, create_refresh_token,
+    decode_token, invalidate_user, resolve_token, revoke_token, user_claims
+)
+from services.passwords import HashingOverloaded, verify_and_update_password
+from services.rate_limit import RateLimiter, client_address
 import logging
 import os
 
 logger = logging.getLogger(__name__)
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# JWT settings
-SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-change-in-production")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+# Login attempts allowed per username and per client address in each window
+LOGIN_ATTEMPTS_PER_USERNAME = int(os.environ.get("LOGIN_ATTEMPTS_PER_USERNAME", "5"))
+LOGIN_ATTEMPTS_PER_IP = int(os.environ.get("LOGIN_ATTEMPTS_PER_IP", "20"))
+LOGIN_WINDOW_SECONDS = int(os.environ.get("LOGIN_WINDOW_SECONDS", "60"))
 
 def create_router(db):
     router = APIRouter()
 
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    username_limiter = RateLimiter(LOGIN_ATTEMPTS_PER_USERNAME, LOGIN_WINDOW_SECONDS)
+    ip_limiter = RateLimiter(LOGIN_ATTEMPTS_PER_IP, LOGIN_WINDOW_SECONDS)
+    get_token_claims = create_auth_dependencies(db).get_token_claims
 
-    def get_password_hash(password: str) -> str:
-        return pwd_context.hash(password)
+    @router.post("/auth/login")
+    async def login(user_credentials: UserLogin, request: Request):
+        """Login user.
 
-    def create_access_token(data: dict, expires_delta: timedelta = None):
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + expires_delta
-        else:
-            expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-        return encoded_jwt
+        Attempts are throttled per username and client address before any
+        bcrypt work is queued, and verification runs in a bounded pool that
+        answers 503 instead of queueing without limit.
+        """
+        client_ip = client_address(request)
+        retry_after = ip_limiter.hit(client_ip) or username_limiter.hit(user_credentials.username.lower())
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts. Please try again later.",
+                headers={"Retry-After": str(retry_after)}
+            )
 
-    @router.post("/auth/login")
-    async def login(user_credentials: UserLogin):
-        """Login user"""
         try:
             user = await db.users.find_one({"username": user_credentials.username}, {"_id": 0})
             
-            if not user or not verify_password(user_credentials.password, user["hashed_password"]):
+            valid, new_hash = False, None
+            if user:
+                valid, new_hash = await verify_and_update_password(
+                    user_credentials.password, user["hashed_password"]
+                )
+            if not valid:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Incorrect username or password"
                 )
+
+            if new_hash:
+                # Transparent rehash after a hashing policy change; skipped if
+                # the password was changed concurrently
+                await db.users.update_one(
+                    {"id": user["id"], "hashed_password": user["hashed_password"]},
+                    {"$set": {"hashed_password": new_hash}}
+                )
+                invalidate_user(user["id"])
+                logger.info(f"Password hash upgraded for user: {user['id']}")
             
             if not user.get("is_active", True):
                 raise HTTPException(
@@ -53,22 +70,79 @@ def create_router(db):
                     detail="User account is disabled"
                 )
             
-            # Create access token
-            access_token = create_access_token(
-                data={"sub": user["username"], "role": user["role"], "id": user["id"]}
-            )
+            # Refresh the cached copy the token will be resolved against
+            cache_user(user)
+
+            # Create access and refresh tokens
+            claims = user_claims(user)
             
             return {
-                "access_token": access_token,
+                "access_token": create_access_token(data=claims),
+                "refresh_token": create_refresh_token(data=claims),
                 "token_type": "bearer",
                 "user": UserResponse(**user)
             }
+        except HashingOverloaded:
+            logger.warning("Password hashing pool saturated, rejecting login")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Login is temporarily busy. Please try again.",
+                headers={"Retry-After": "1"}
+            )
         except HTTPException:
             raise
         except Exception as e:
             logger.error(f"Error during login: {str(e)}")
             raise HTTPException(status_code=500, detail="Internal server error")
 
+    @router.post("/auth/refresh")
+    async def refresh(refresh_data: RefreshRequest):
+        """Exchange a refresh token for a new access/refresh token pair.
+
+        The user is re-read here, so role and status changes reach
+        claims-based tokens at the latest one access-token lifetime later.
+        The presented refresh token is revoked first (rotation); a token that
+        was already used, even concurrently on another worker, is rejected.
+        """
+        claims = decode_token(refresh_data.refresh_token, token_type="refresh")
+        if not claims:
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        try:
+            if not await revoke_token(db, claims):
+                raise HTTPException(status_code=401, detail="Invalid refresh token")
+            user = await db.users.find_one({"id": claims.get("id")}, {"_id": 0, "hashed_password": 0})
+            if not user or user.get("username") != claims.get("sub"):
+                raise HTTPException(status_code=401, detail="Invalid refresh token")
+            if not user.get("is_active", True):
+                raise HTTPException(status_code=403, detail="User account is disabled")
+
+            cache_user(user)
+            new_claims = user_claims(user)
+            return {
+                "access_token": create_access_token(data=new_claims),
+                "refresh_token": create_refresh_token(data=new_claims),
+                "token_type": "bearer"
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error refreshing token: {str(e)}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+    @router.post("/auth/logout")
+    async def logout(logout_data: LogoutRequest, claims: dict = Depends(get_token_claims)):
+        """Revoke the current access token and, if given, its refresh token"""
+        try:
+            await revoke_token(db, claims)
+            if logout_data.refresh_token:
+                refresh_claims = decode_token(logout_data.refresh_token, token_type="refresh")
+                if refresh_claims and refresh_claims.get("id") == claims.get("id"):
+                    await revoke_token(db, refresh_claims)
+            return {"message": "Logged out successfully"}
+        except Exception as e:
+            logger.error(f"Error during logout: {str(e)}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+
     @router.post("/auth/register", response_model=UserResponse)
     async def register(user_data: UserCreate):
         """Register new user (disabled for now - admin only creation)"""
@@ -81,7 +155,7 @@ def create_router(db):
     async def get_current_user_info(token: str):
         """Get current user info from token"""
         try:
-            user = verify_token(token, db)
+            user = await resolve_token(db, token)
             if not user:
                 raise HTTPException(status_code=401, detail="Invalid token")
             return UserResponse(**user)
@@ -90,35 +164,3 @@ def create_router(db):
             raise HTTPException(status_code=401, detail="Invalid token")
 
     return router
-
-def verify_token(token: str, db):
-    """Verify JWT token and return user (synchronous wrapper for async call)"""
-    try:
-        import asyncio
-        from jose import JWTError, jwt
-        
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        
-        # Get user from database synchronously
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # If loop is already running, use sync client
-            from pymongo import MongoClient
-            import os
-            sync_client = MongoClient(os.environ['MONGO_URL'])
-            sync_db = sync_client[os.environ['DB_NAME']]
-            user = sync_db.users.find_one({"username": username}, {"_id": 0})
-            sync_client.close()
-            return user
-        else:
-            # If no loop running, use asyncio.run
-            user = asyncio.run(db.users.find_one({"username": username}, {"_id": 0}))
-            return user
-    except JWTError:
-        return None
-    except Exception as e:
-        print(f"Error verifying token: {str(e)}")
-        return None
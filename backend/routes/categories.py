@@ -1,69 +1,94 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import List, Optional
 from models.category import Category, CategoryCreate, CategoryUpdate, CategoryResponse
+from services.pagination import (
+    CREATED_ASC, MAX_PAGE_SIZE, NDJSON_MEDIA_TYPE, InvalidCursor, apply_after, fetch_page, stream_ndjson
+)
+from services.conditional import bump_version, conditional_get, parse_if_match, version_filter
+from services.cache import MISSING, catalog_cache, make_key
+from services.auth import create_auth_dependencies
 import logging
 from datetime import datetime
-from jose import JWTError, jwt
-import os
 
 logger = logging.getLogger(__name__)
-security = HTTPBearer()
 
-SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-change-in-production")
-ALGORITHM = "HS256"
+DEFAULT_PAGE_SIZE = 1000
 
 def create_router(db):
     router = APIRouter()
 
-    async def verify_token_async(token: str):
-        """Verify JWT token and return user"""
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username: str = payload.get("sub")
-            if username is None:
-                return None
-            
-            user = await db.users.find_one({"username": username}, {"_id": 0})
-            return user
-        except JWTError:
-            return None
-        except Exception as e:
-            logger.error(f"Error verifying token: {str(e)}")
-            return None
-
-    async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-        """Verify JWT token and return user"""
-        token = credentials.credentials
-        user_dict = await verify_token_async(token)
-        if not user_dict:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        return user_dict
-
-    async def verify_admin(user: dict = Depends(get_current_user)):
-        """Verify user is admin"""
-        if user.get("role") != "admin":
-            raise HTTPException(status_code=403, detail="Admin access required")
-        return user
+    verify_admin = create_auth_dependencies(db).verify_admin
+
+    async def raise_not_found_or_conflict(category_id: str, expected_version: Optional[int]):
+        """Explain why a guarded write matched nothing (only costs a query on failure)"""
+        if expected_version is not None and await db.categories.count_documents({"id": category_id}, limit=1):
+            raise HTTPException(status_code=412, detail="Category was modified by someone else")
+        raise HTTPException(status_code=404, detail="Category not found")
 
     @router.get("/categories", response_model=List[CategoryResponse])
-    async def get_categories():
-        """Get all categories"""
+    async def get_categories(
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+        output: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+    ):
+        """Get categories ordered by (created_at, id), one keyset page at a time"""
         try:
-            categories = await db.categories.find({}, {"_id": 0}).to_list(1000)
-            return [CategoryResponse(**cat) for cat in categories]
+            headers, not_modified = await conditional_get(db, request, ["categories"])
+            if not_modified:
+                return Response(status_code=304, headers=headers)
+
+            if output == "ndjson":
+                cursor = db.categories.find(apply_after({}, CREATED_ASC, after), {"_id": 0}).sort(CREATED_ASC)
+                if limit:
+                    cursor = cursor.limit(limit)
+                return StreamingResponse(stream_ndjson(cursor), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+            response.headers.update(headers)
+            key = make_key("categories", limit=limit or DEFAULT_PAGE_SIZE, after=after)
+            cached = catalog_cache.get(key)
+            if cached is MISSING:
+                generation = catalog_cache.generation
+                categories, next_cursor = await fetch_page(
+                    db.categories, {}, CREATED_ASC, limit or DEFAULT_PAGE_SIZE, after
+                )
+                cached = ([CategoryResponse(**cat) for cat in categories], next_cursor)
+                catalog_cache.set(key, cached, tags=["categories"], since=generation)
+
+            category_responses, next_cursor = cached
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return category_responses
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error fetching categories: {str(e)}")
             raise HTTPException(status_code=500, detail="Internal server error")
 
     @router.get("/categories/{category_id}", response_model=CategoryResponse)
-    async def get_category(category_id: str):
+    async def get_category(category_id: str, request: Request, response: Response):
         """Get category by ID"""
         try:
-            category = await db.categories.find_one({"id": category_id}, {"_id": 0})
-            if not category:
-                raise HTTPException(status_code=404, detail="Category not found")
-            return CategoryResponse(**category)
+            headers, not_modified = await conditional_get(db, request, ["categories"])
+            if not_modified:
+                return Response(status_code=304, headers=headers)
+
+            key = make_key("category", id=category_id)
+            category_response = catalog_cache.get(key)
+            if category_response is MISSING:
+                generation = catalog_cache.generation
+                category = await db.categories.find_one({"id": category_id}, {"_id": 0})
+                if not category:
+                    raise HTTPException(status_code=404, detail="Category not found")
+                category_response = CategoryResponse(**category)
+                catalog_cache.set(key, category_response, tags=[f"category:{category_id}"], since=generation)
+
+            response.headers.update(headers)
+            return category_response
         except HTTPException:
             raise
         except Exception as e:
@@ -80,11 +105,6 @@ def create_router(db):
             # Create slug from name
             slug = category_data.name.lower().replace(" ", "-").replace("á", "a").replace("é", "e").replace("í", "i").replace("ó", "o").replace("ú", "u")
             
-            # Check if slug already exists
-            existing = await db.categories.find_one({"slug": slug})
-            if existing:
-                raise HTTPException(status_code=400, detail="Category with this name already exists")
-            
             category = Category(
                 name=category_data.name,
                 slug=slug,
@@ -92,9 +112,13 @@ def create_router(db):
             )
             
             await db.categories.insert_one(category.model_dump())
+            await bump_version(db, "categories")
             logger.info(f"Category created: {category.id}")
             
             return CategoryResponse(**category.model_dump())
+        except DuplicateKeyError:
+            # The unique slug index rejects existing names atomically
+            raise HTTPException(status_code=400, detail="Category with this name already exists")
         except HTTPException:
             raise
         except Exception as e:
@@ -105,28 +129,51 @@ def create_router(db):
     async def update_category(
         category_id: str,
         category_data: CategoryUpdate,
+        if_match: Optional[str] = Header(None),
         admin: dict = Depends(verify_admin)
     ):
-        """Update category (Admin only)"""
+        """Update category (Admin only).
+
+        Send the category's ``version`` in If-Match to reject the update with
+        412 if someone else changed the category in the meantime.
+        """
         try:
-            category = await db.categories.find_one({"id": category_id}, {"_id": 0})
-            if not category:
-                raise HTTPException(status_code=404, detail="Category not found")
-            
+            try:
+                expected_version = parse_if_match(if_match)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            update_filter = {"id": category_id}
+            if expected_version is not None:
+                update_filter.update(version_filter(expected_version))
+
             update_data = {k: v for k, v in category_data.model_dump().items() if v is not None}
             
             # Update slug if name changed
             if "name" in update_data:
                 update_data["slug"] = update_data["name"].lower().replace(" ", "-").replace("á", "a").replace("é", "e").replace("í", "i").replace("ó", "o").replace("ú", "u")
             
-            if update_data:
-                await db.categories.update_one(
-                    {"id": category_id},
-                    {"$set": update_data}
-                )
-            
-            updated_category = await db.categories.find_one({"id": category_id}, {"_id": 0})
+            if not update_data:
+                updated_category = await db.categories.find_one(update_filter, {"_id": 0})
+                if not updated_category:
+                    await raise_not_found_or_conflict(category_id, expected_version)
+                return CategoryResponse(**updated_category)
+
+            updated_category = await db.categories.find_one_and_update(
+                update_filter,
+                {"$set": update_data, "$inc": {"version": 1}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if not updated_category:
+                await raise_not_found_or_conflict(category_id, expected_version)
+
+            await bump_version(db, "categories")
+            # Also drops cached products embedding this category
+            catalog_cache.invalidate(f"category:{category_id}")
             return CategoryResponse(**updated_category)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Category with this name already exists")
         except HTTPException:
             raise
         except Exception as e:
@@ -136,19 +183,31 @@ def create_router(db):
     @router.delete("/categories/{category_id}")
     async def delete_category(
         category_id: str,
+        if_match: Optional[str] = Header(None),
         admin: dict = Depends(verify_admin)
     ):
-        """Delete category (Admin only)"""
+        """Delete category (Admin only), optionally guarded by If-Match"""
         try:
-            result = await db.categories.delete_one({"id": category_id})
+            try:
+                expected_version = parse_if_match(if_match)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            delete_filter = {"id": category_id}
+            if expected_version is not None:
+                delete_filter.update(version_filter(expected_version))
+
+            result = await db.categories.delete_one(delete_filter)
             if result.deleted_count == 0:
-                raise HTTPException(status_code=404, detail="Category not found")
+                await raise_not_found_or_conflict(category_id, expected_version)
             
             # Remove category from all products
             await db.products.update_many(
                 {"category_ids": category_id},
-                {"$pull": {"category_ids": category_id}}
+                {"$pull": {"category_ids": category_id}, "$inc": {"version": 1}}
             )
+            await bump_version(db, "categories", "products")
+            catalog_cache.invalidate(f"category:{category_id}")
             
             return {"message": "Category deleted successfully"}
         except HTTPException:
@@ -1,19 +1,96 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Optional
-import os
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from functools import partial
 from pathlib import Path
-from models.contact import ContactSubmission, ContactResponse
+from typing import List, Optional
+from datetime import datetime, timezone
+import asyncio
+import mimetypes
+import os
+import re
+import uuid
+from models.contact import (
+    ContactSubmission, ContactResponse, ContactInboxEntry, Quote, RequoteRequest, RequoteResult
+)
+from services.auth import create_auth_dependencies
+from services.conditional import file_response
+from services.pipeline import enqueue_upload_processing, needs_processing
+from services.preview import PREVIEW_MEDIA_TYPE, preview_key
+from services.quoting import RATES_FINGERPRINT, requote_submissions
+from services.search import fetch_search_page, search_pipeline
+from services.sniffing import SNIFF_BYTES, check_file, check_prefix
+from services.storage import content_disposition, discard, storage_response
+from services.thumbnails import (
+    DEFAULT_THUMBNAIL_SIZE, DEFAULT_THUMBNAIL_VIEW, THUMBNAIL_FORMATS, THUMBNAIL_SIZES, THUMBNAIL_VIEWS,
+    thumbnail_key
+)
+from services.uploads import (
+    ALLOWED_EXTENSIONS, UPLOAD_SESSIONS_COLLECTION, blob_key, release_blob, save_upload, store_blob,
+    temp_upload_path
+)
+from services.pagination import (
+    CREATED_DESC, CSV_MEDIA_TYPE, MAX_PAGE_SIZE, NDJSON_MEDIA_TYPE, InvalidCursor, apply_after, csv_text,
+    fetch_page, iter_batches, stream_csv, stream_ndjson
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = Path("/app/backend/uploads")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+DEFAULT_PAGE_SIZE = 100
+REQUOTE_BATCH_SIZE = 1000
+QUOTE_PROJECTION = {"_id": 0, "id": 1, "mesh": 1, "file_sha256": 1, "quote": 1}
+FILE_PROJECTION = {"_id": 0, "file_name": 1, "file_path": 1, "file_sha256": 1, "thumbnail_url": 1, "preview_url": 1}
+# Customer files are private to staff, but never change
+DOWNLOAD_CACHE_CONTROL = "private, max-age=31536000, immutable"
+INBOX_EXPORT_FIELDS = [
+    "id", "created_at", "status", "name", "email", "phone", "service_type", "message",
+    "file_name", "file_size", "processing_error",
+]
+# A search that is a whole address; the text index would split it into
+# terms ("ana", "example", "com") matching anyone sharing one of them
+EMAIL_SEARCH_RE = re.compile(r"^([^@\s]+)@([^@\s]+\.[^@\s]+)$")
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Submissions store naive UTC times
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def inbox_query(
+    status: Optional[List[str]], service_type: Optional[List[str]],
+    created_from: Optional[datetime], created_to: Optional[datetime]
+) -> dict:
+    """Filter for the admin inbox. Each list matches any of its values; the
+    dates bound created_at, from inclusive and to exclusive."""
+    query = {}
+    if status:
+        query["status"] = {"$in": status}
+    if service_type:
+        query["service_type"] = {"$in": service_type}
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = _utc(created_from)
+        if created_to:
+            query["created_at"]["$lt"] = _utc(created_to)
+    return query
+
+
+def email_search(q: str) -> Optional[str]:
+    """The address ``q`` names, if it is one, normalized like stored
+    addresses (EmailStr lowercases the domain)"""
+    match = EMAIL_SEARCH_RE.match(q.strip())
+    if not match:
+        return None
+    return f"{match.group(1)}@{match.group(2).lower()}"
+
 
 def create_router(db):
     """Factory function to create router with database dependency"""
     router = APIRouter()
+    verify_admin = create_auth_dependencies(db).verify_admin
 
     @router.post("/contact", response_model=ContactResponse)
     async def create_contact_submission(
@@ -22,55 +99,113 @@ def create_router(db):
         phone: Optional[str] = Form(None),
         service_type: str = Form(...),
         message: str = Form(...),
-        file: Optional[UploadFile] = File(None)
+        file: Optional[UploadFile] = File(None),
+        upload_id: Optional[str] = Form(None)
     ):
         """
-        Create a new contact submission with optional file upload
+        Create a new contact submission with optional file upload, either
+        sent inline or as the id of a completed resumable upload
         """
         try:
+            submission_id = str(uuid.uuid4())
             file_name = None
             file_path = None
+            file_size = None
+            file_sha256 = None
             
+            if file and upload_id:
+                raise HTTPException(status_code=400, detail="Send either a file or an upload_id, not both")
+
+            # Attach a completed resumable upload; each can be used only once
+            if upload_id:
+                session = await db[UPLOAD_SESSIONS_COLLECTION].find_one_and_update(
+                    {"id": upload_id, "status": "complete", "submission_id": None},
+                    {"$set": {"submission_id": submission_id}},
+                    projection={"_id": 0}
+                )
+                if not session:
+                    raise HTTPException(status_code=400, detail="Upload not found, not complete or already used")
+                file_name = session["filename"]
+                file_path = session["file_path"]
+                file_size = session["size"]
+                file_sha256 = session["sha256"]
+
             # Handle file upload if provided
             if file:
                 # Validate file extension
-                allowed_extensions = ['.stl', '.obj', '.3mf', '.step', '.stp']
                 file_ext = os.path.splitext(file.filename)[1].lower()
                 
-                if file_ext not in allowed_extensions:
+                if file_ext not in ALLOWED_EXTENSIONS:
                     raise HTTPException(
                         status_code=400, 
-                        detail=f"File type {file_ext} not allowed. Allowed types: {', '.join(allowed_extensions)}"
+                        detail=f"File type {file_ext} not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
                     )
                 
-                # Generate unique filename using uuid directly
-                import uuid
-                unique_id = str(uuid.uuid4())
-                file_name = f"{unique_id}_{file.filename}"
-                file_path = str(UPLOAD_DIR / file_name)
+                file_name = os.path.basename(file.filename)
+
+                # Refuse content that doesn't match the extension before copying it
+                check_prefix(file_name, await file.read(SNIFF_BYTES), file.size)
+                await file.seek(0)
                 
-                # Save file
-                with open(file_path, "wb") as buffer:
-                    content = await file.read()
-                    buffer.write(content)
+                # Stream to disk in chunks, refusing files over the size limit,
+                # then store it once per distinct content
+                stored = await save_upload(file, temp_upload_path(), validate=partial(check_file, file_name))
+                try:
+                    file_path = str(await store_blob(db, stored.path, stored.sha256, stored.size))
+                except BaseException:
+                    await asyncio.to_thread(discard, stored.path)
+                    raise
+                file_size = stored.size
+                file_sha256 = stored.sha256
                 
                 logger.info(f"File saved: {file_path}")
             
+            # Meshes are analyzed in the background; the job id lets the
+            # client follow along
+            job_id = str(uuid.uuid4()) if needs_processing(file_name) else None
+            
             # Create contact submission
             contact = ContactSubmission(
+                id=submission_id,
                 name=name,
                 email=email,
                 phone=phone,
                 service_type=service_type,
                 message=message,
                 file_name=file_name,
-                file_path=file_path
+                file_path=file_path,
+                file_size=file_size,
+                file_sha256=file_sha256,
+                job_id=job_id,
+                status="processing" if job_id else "pending"
             )
             
             # Save to database
-            result = await db.contact_submissions.insert_one(contact.model_dump())
+            try:
+                result = await db.contact_submissions.insert_one(contact.model_dump())
+            except Exception:
+                # Hand the file reference back
+                if upload_id:
+                    await db[UPLOAD_SESSIONS_COLLECTION].update_one(
+                        {"id": upload_id}, {"$set": {"submission_id": None}}
+                    )
+                elif file_sha256:
+                    await release_blob(db, file_sha256)
+                raise
             logger.info(f"Contact submission created: {contact.id}")
             
+            if job_id:
+                try:
+                    await enqueue_upload_processing(db, contact.id, file_name, file_path, file_sha256, job_id)
+                except Exception as e:
+                    # The submission itself is saved; staff can still open the file
+                    logger.error(f"Could not queue processing for {contact.id}: {str(e)}")
+                    await db.contact_submissions.update_one(
+                        {"id": contact.id}, {"$set": {"status": "pending", "job_id": None}}
+                    )
+                    contact.status = "pending"
+                    contact.job_id = None
+            
             return ContactResponse(
                 id=contact.id,
                 name=contact.name,
@@ -78,7 +213,12 @@ def create_router(db):
                 service_type=contact.service_type,
                 message=contact.message,
                 created_at=contact.created_at,
-                status=contact.status
+                status=contact.status,
+                mesh=contact.mesh,
+                quote=contact.quote,
+                thumbnail_url=contact.thumbnail_url,
+                preview_url=contact.preview_url,
+                job_id=contact.job_id
             )
         
         except HTTPException as he:
@@ -88,21 +228,248 @@ def create_router(db):
             raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
     @router.get("/contact")
-    async def get_contact_submissions():
+    async def get_contact_submissions(
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+        output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+        admin: dict = Depends(verify_admin)
+    ):
         """
-        Get all contact submissions
+        Get contact submissions, newest first, one keyset page at a time
+        (admin only). Pass the X-Next-Cursor response header back as
+        ``after`` to continue.
         """
         try:
-            submissions = await db.contact_submissions.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
-            return [ContactResponse(**submission) for submission in submissions]
+            async def to_responses(batch):
+                return [ContactResponse(**submission) for submission in batch]
+
+            if output == "ndjson":
+                cursor = db.contact_submissions.find(
+                    apply_after({}, CREATED_DESC, after), {"_id": 0}
+                ).sort(CREATED_DESC)
+                if limit:
+                    cursor = cursor.limit(limit)
+                return StreamingResponse(stream_ndjson(cursor, to_responses), media_type=NDJSON_MEDIA_TYPE)
+
+            submissions, next_cursor = await fetch_page(
+                db.contact_submissions, {}, CREATED_DESC, limit or DEFAULT_PAGE_SIZE, after
+            )
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return await to_responses(submissions)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.error(f"Error fetching contact submissions: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+    @router.get("/contact/inbox", response_model=List[ContactInboxEntry])
+    async def get_contact_inbox(
+        response: Response,
+        status: Optional[List[str]] = Query(None),
+        service_type: Optional[List[str]] = Query(None),
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        q: Optional[str] = Query(None, min_length=1),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+        admin: dict = Depends(verify_admin)
+    ):
+        """
+        Work through submissions (Admin only), filtered by status, service
+        type and creation date, with ``q`` searching message and email (an
+        address is matched exactly). Newest first, or by relevance when
+        searching; pass the X-Next-Cursor response header back as ``after``
+        to continue.
+        """
+        try:
+            query = inbox_query(status, service_type, created_from, created_to)
+            email = email_search(q) if q else None
+            if email:
+                query["email"] = email
+            if q and not email:
+                submissions, next_cursor = await fetch_search_page(
+                    db.contact_submissions, q, query, limit or DEFAULT_PAGE_SIZE, after
+                )
+            else:
+                submissions, next_cursor = await fetch_page(
+                    db.contact_submissions, query, CREATED_DESC, limit or DEFAULT_PAGE_SIZE, after
+                )
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return [ContactInboxEntry(**submission) for submission in submissions]
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error fetching contact inbox: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    @router.get("/contact/export")
+    async def export_contact_submissions(
+        status: Optional[List[str]] = Query(None),
+        service_type: Optional[List[str]] = Query(None),
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        q: Optional[str] = Query(None, min_length=1),
+        output: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+        admin: dict = Depends(verify_admin)
+    ):
+        """
+        Stream every submission matching the inbox filters as CSV or NDJSON
+        (Admin only), read from the cursor in batches
+        """
+        query = inbox_query(status, service_type, created_from, created_to)
+        email = email_search(q) if q else None
+        if email:
+            query["email"] = email
+        if q and not email:
+            # Ranking the whole history may not fit in the sort's memory limit
+            cursor = db.contact_submissions.aggregate(search_pipeline(q, query), allowDiskUse=True)
+        else:
+            cursor = db.contact_submissions.find(query, {"_id": 0}).sort(CREATED_DESC)
+        if output == "csv":
+            return StreamingResponse(
+                stream_csv(cursor, INBOX_EXPORT_FIELDS, to_cell=csv_text),
+                media_type=CSV_MEDIA_TYPE,
+                headers={"Content-Disposition": 'attachment; filename="contact_submissions.csv"'}
+            )
+        return StreamingResponse(
+            stream_ndjson(cursor),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"Content-Disposition": 'attachment; filename="contact_submissions.ndjson"'}
+        )
+
+    @router.post("/contact/requote", response_model=RequoteResult)
+    async def requote_contact_submissions(
+        body: RequoteRequest,
+        admin: dict = Depends(verify_admin)
+    ):
+        """
+        Re-quote submissions after a rate change (Admin only). Quotes are
+        cached per file hash, so each distinct file is priced once.
+        """
+        try:
+            if body.submission_ids is not None:
+                query = {"id": {"$in": body.submission_ids}}
+            else:
+                query = {"mesh": {"$ne": None}, "quote.rates": {"$ne": RATES_FINGERPRINT}}
+            cursor = db.contact_submissions.find(query, QUOTE_PROJECTION)
+
+            requoted = 0
+            async for batch in iter_batches(cursor, REQUOTE_BATCH_SIZE):
+                requoted += len(await requote_submissions(db, batch))
+            logger.info(f"Re-quoted {requoted} submissions with rates {RATES_FINGERPRINT}")
+            return RequoteResult(requoted=requoted, rates=RATES_FINGERPRINT)
+        except Exception as e:
+            logger.error(f"Error re-quoting contact submissions: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    @router.get("/contact/{submission_id}/quote", response_model=Quote)
+    async def get_contact_quote(submission_id: str):
+        """
+        Get the instant quote for a submission's uploaded model, computing it
+        if the rates changed since it was last quoted
+        """
+        try:
+            submission = await db.contact_submissions.find_one({"id": submission_id}, QUOTE_PROJECTION)
+            if not submission:
+                raise HTTPException(status_code=404, detail="Submission not found")
+            if not submission.get("mesh"):
+                raise HTTPException(status_code=409, detail="Submission has no analyzed model to quote yet")
+
+            quote = submission.get("quote")
+            if not quote or quote.get("rates") != RATES_FINGERPRINT:
+                quote = (await requote_submissions(db, [submission]))[submission_id]
+            return Quote(**quote)
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            logger.error(f"Error quoting contact submission: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    @router.get("/contact/{submission_id}/thumbnail")
+    async def get_contact_thumbnail(
+        request: Request,
+        submission_id: str,
+        view: str = Query(DEFAULT_THUMBNAIL_VIEW, pattern=f"^({'|'.join(THUMBNAIL_VIEWS)})$"),
+        size: int = DEFAULT_THUMBNAIL_SIZE,
+        output: Optional[str] = Query(None, alias="format", pattern=f"^({'|'.join(THUMBNAIL_FORMATS)})$"),
+        accept: Optional[str] = Header(None)
+    ):
+        """
+        Get a rendered preview of a submission's model. WebP is served to
+        clients that accept it unless ``format`` says otherwise.
+        """
+        if size not in THUMBNAIL_SIZES:
+            raise HTTPException(
+                status_code=400, detail=f"size must be one of {', '.join(map(str, THUMBNAIL_SIZES))}"
+            )
+        fmt = output or ("webp" if accept and "image/webp" in accept else "png")
+
+        submission = await db.contact_submissions.find_one({"id": submission_id}, FILE_PROJECTION)
+        if not submission:
+            raise HTTPException(status_code=404, detail="Submission not found")
+        response = None
+        if submission.get("thumbnail_url"):
+            sha256 = submission["file_sha256"]
+            response = await storage_response(
+                request, thumbnail_key(sha256, view, size, fmt), THUMBNAIL_FORMATS[fmt],
+                f'"{sha256}-{view}-{size}-{fmt}"', headers={"Vary": "Accept"}
+            )
+        if response is None:
+            raise HTTPException(status_code=404, detail="Thumbnail not available")
+        return response
+
+    @router.get("/contact/{submission_id}/preview")
+    async def get_contact_preview(request: Request, submission_id: str):
+        """
+        Get the reduced glTF (GLB) mesh of a submission's model for the 3D
+        viewer. Supports Range requests for progressive or resumed loading.
+        """
+        submission = await db.contact_submissions.find_one({"id": submission_id}, FILE_PROJECTION)
+        if not submission:
+            raise HTTPException(status_code=404, detail="Submission not found")
+        response = None
+        if submission.get("preview_url"):
+            sha256 = submission["file_sha256"]
+            response = await storage_response(request, preview_key(sha256), PREVIEW_MEDIA_TYPE, f'"{sha256}-preview"')
+        if response is None:
+            raise HTTPException(status_code=404, detail="Preview not available")
+        return response
+
+    @router.get("/contact/{submission_id}/file")
+    async def download_contact_file(request: Request, submission_id: str, admin: dict = Depends(verify_admin)):
+        """
+        Download the file attached to a submission (admin only). With S3
+        storage this redirects to a short-lived presigned URL.
+        """
+        submission = await db.contact_submissions.find_one({"id": submission_id}, FILE_PROJECTION)
+        if not submission:
+            raise HTTPException(status_code=404, detail="Submission not found")
+        file_name = submission.get("file_name")
+        media_type = mimetypes.guess_type(file_name or "")[0] or "application/octet-stream"
+
+        response = None
+        if submission.get("file_sha256"):
+            response = await storage_response(
+                request, blob_key(submission["file_sha256"]), media_type, f'"{submission["file_sha256"]}"',
+                DOWNLOAD_CACHE_CONTROL, filename=file_name
+            )
+        elif submission.get("file_path") and os.path.isfile(submission["file_path"]):
+            # Saved before files were stored by content
+            response = file_response(
+                request, Path(submission["file_path"]), media_type, f'"{submission_id}"', DOWNLOAD_CACHE_CONTROL,
+                headers={"Content-Disposition": content_disposition(file_name)}
+            )
+        if response is None:
+            raise HTTPException(status_code=404, detail="Submission has no file")
+        return response
+
     @router.get("/contact/{submission_id}")
-    async def get_contact_submission(submission_id: str):
+    async def get_contact_submission(submission_id: str, admin: dict = Depends(verify_admin)):
         """
-        Get a specific contact submission by ID
+        Get a specific contact submission by ID (admin only)
         """
         try:
             submission = await db.contact_submissions.find_one({"id": submission_id}, {"_id": 0})
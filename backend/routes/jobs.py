@@ -0,0 +1,76 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import os
+from models.job import JobResponse
+from services.jobs import JOBS_COLLECTION, TERMINAL_STATUSES
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_PROJECTION = {"_id": 0, "payload": 0, "worker": 0, "lease_until": 0}
+# How often the event stream checks the job, and sends a keep-alive comment
+JOB_EVENTS_POLL_SECONDS = float(os.environ.get("JOB_EVENTS_POLL_SECONDS", "1"))
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+
+def create_router(db):
+    """Factory function to create router with database dependency"""
+    router = APIRouter()
+
+    async def find_job(job_id: str) -> dict:
+        job = await db[JOBS_COLLECTION].find_one({"id": job_id}, JOB_PROJECTION)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    @router.get("/jobs/{job_id}", response_model=JobResponse)
+    async def get_job(job_id: str):
+        """
+        Get a background job's status and progress
+        """
+        try:
+            return JobResponse(**await find_job(job_id))
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            logger.error(f"Error fetching job: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    @router.get("/jobs/{job_id}/events")
+    async def stream_job_events(job_id: str, request: Request):
+        """
+        Server-sent events: a ``job`` event each time the job changes,
+        ending once it has succeeded or failed
+        """
+        job = await find_job(job_id)
+
+        async def events():
+            current = job
+            last_update = None
+            idle = 0.0
+            while True:
+                if current["updated_at"] != last_update:
+                    last_update = current["updated_at"]
+                    idle = 0.0
+                    yield f"event: job\ndata: {JobResponse(**current).model_dump_json()}\n\n"
+                    if current["status"] in TERMINAL_STATUSES:
+                        return
+                elif idle >= JOB_EVENTS_KEEPALIVE_SECONDS:
+                    idle = 0.0
+                    yield ": keep-alive\n\n"
+
+                await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+                idle += JOB_EVENTS_POLL_SECONDS
+                if await request.is_disconnected():
+                    return
+                current = await db[JOBS_COLLECTION].find_one({"id": job_id}, JOB_PROJECTION)
+                if not current:
+                    return
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    return router
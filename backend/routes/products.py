@@ -1,106 +1,370 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, HTTPException, Depends, File, Header, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from typing import List, Optional
-from models.product import Product, ProductCreate, ProductUpdate, ProductResponse
+from models.product import (
+    Product, ProductCreate, ProductUpdate, ProductResponse,
+    ProductImportRow, ProductImportError, ProductImportResult, ProductFacets
+)
+from services.pagination import (
+    CREATED_ASC, CSV_MEDIA_TYPE, MAX_PAGE_SIZE, NDJSON_MEDIA_TYPE, InvalidCursor,
+    apply_after, encode_cursor, fetch_page, stream_csv, stream_ndjson
+)
+from services.bulk_io import detect_format, iter_models, next_batch
+from services.auth import create_auth_dependencies
+from services.search import SEARCH_SORT, fetch_search_page, search_pipeline
+from services.facets import DEFAULT_PRICE_BUCKETS, product_facets_pipeline
+from services.conditional import bump_version, conditional_get, parse_if_match, version_filter
+from services.cache import MISSING, catalog_cache, make_key
 from datetime import datetime
+import asyncio
 import logging
-from jose import JWTError, jwt
-import os
+import uuid
 
 logger = logging.getLogger(__name__)
-security = HTTPBearer()
-
-SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-change-in-production")
-ALGORITHM = "HS256"
-
-async def verify_token_async(token: str, db):
-    """Verify JWT token and return user"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        
-        user = await db.users.find_one({"username": username}, {"_id": 0})
-        return user
-    except JWTError:
-        return None
-    except Exception as e:
-        logger.error(f"Error verifying token: {str(e)}")
-        return None
+
+DEFAULT_PAGE_SIZE = 1000
+
+# Product responses embed category details, so both collections version them
+PRODUCT_SOURCES = ("products", "categories")
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+EXPORT_FIELDS = [
+    "id", "name", "description", "price", "image_url", "category_ids",
+    "is_active", "created_at", "updated_at"
+]
 
 def create_router(db):
     router = APIRouter()
 
-    async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-        """Verify JWT token and return user"""
-        token = credentials.credentials
-        user_dict = await verify_token_async(token, db)
-        if not user_dict:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        return user_dict
+    verify_admin = create_auth_dependencies(db).verify_admin
+
+    async def populate_categories_bulk(products: List[dict], db):
+        """Populate category details for many products with a single query"""
+        category_ids = {cid for product in products for cid in product.get("category_ids") or []}
+        categories_by_id = {}
+        if category_ids:
+            async for category in db.categories.find(
+                {"id": {"$in": list(category_ids)}},
+                {"_id": 0}
+            ):
+                categories_by_id[category["id"]] = category
 
-    async def verify_admin(user: dict = Depends(get_current_user)):
-        """Verify user is admin"""
-        if user.get("role") != "admin":
-            raise HTTPException(status_code=403, detail="Admin access required")
-        return user
+        for product in products:
+            product["categories"] = [
+                categories_by_id[cid]
+                for cid in product.get("category_ids") or []
+                if cid in categories_by_id
+            ]
+        return products
 
     async def populate_categories(product: dict, db):
         """Populate category details for a product"""
-        if product.get("category_ids"):
-            categories = await db.categories.find(
-                {"id": {"$in": product["category_ids"]}},
-                {"_id": 0}
-            ).to_list(100)
-            product["categories"] = categories
-        else:
-            product["categories"] = []
+        await populate_categories_bulk([product], db)
         return product
 
+    async def raise_not_found_or_conflict(product_id: str, expected_version: Optional[int]):
+        """Explain why a guarded write matched nothing (only costs a query on failure)"""
+        if expected_version is not None and await db.products.count_documents({"id": product_id}, limit=1):
+            raise HTTPException(status_code=412, detail="Product was modified by someone else")
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    def cache_tags(products: List[dict]) -> set:
+        """Tags for a cached product entry: its products and embedded categories"""
+        tags = {f"product:{product['id']}" for product in products}
+        tags.update(f"category:{cid}" for product in products for cid in product.get("category_ids") or [])
+        return tags
+
     @router.get("/products", response_model=List[ProductResponse])
     async def get_products(
+        request: Request,
+        response: Response,
         search: Optional[str] = None,
         category_id: Optional[str] = None,
-        active_only: bool = True
+        active_only: bool = True,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+        output: str = Query("json", alias="format", pattern="^(json|ndjson)$")
     ):
-        """Get all products with optional search and category filter"""
+        """Get products with optional search and category filter.
+
+        Results are ordered by (created_at, id), or by relevance when searching.
+        The ``X-Next-Cursor`` response header holds the ``after`` value for the
+        next page. ``format=ndjson`` streams every matching product instead of
+        returning a single page.
+        """
         try:
+            headers, not_modified = await conditional_get(db, request, PRODUCT_SOURCES)
+            if not_modified:
+                return Response(status_code=304, headers=headers)
+
             query = {}
             
             if active_only:
                 query["is_active"] = True
             
-            if search:
-                query["$or"] = [
-                    {"name": {"$regex": search, "$options": "i"}},
-                    {"description": {"$regex": search, "$options": "i"}}
-                ]
-            
             if category_id:
                 query["category_ids"] = category_id
+
+            async def to_responses(batch: List[dict]):
+                # Populate categories for the whole batch in one round-trip
+                await populate_categories_bulk(batch, db)
+                return [ProductResponse(**prod) for prod in batch]
+
+            if output == "ndjson":
+                if search:
+                    pipeline = search_pipeline(search, query, after)
+                    if limit:
+                        pipeline.append({"$limit": limit})
+                    cursor = db.products.aggregate(pipeline)
+                else:
+                    cursor = db.products.find(apply_after(query, CREATED_ASC, after), {"_id": 0}).sort(CREATED_ASC)
+                    if limit:
+                        cursor = cursor.limit(limit)
+                return StreamingResponse(
+                    stream_ndjson(cursor, to_responses), media_type=NDJSON_MEDIA_TYPE, headers=headers
+                )
+
+            response.headers.update(headers)
+            key = make_key(
+                "products", search=search, category_id=category_id, active_only=active_only,
+                limit=limit or DEFAULT_PAGE_SIZE, after=after
+            )
+            cached = catalog_cache.get(key)
+            if cached is MISSING:
+                generation = catalog_cache.generation
+                if search:
+                    products, next_cursor = await fetch_search_page(
+                        db.products, search, query, limit or DEFAULT_PAGE_SIZE, after
+                    )
+                else:
+                    products, next_cursor = await fetch_page(
+                        db.products, query, CREATED_ASC, limit or DEFAULT_PAGE_SIZE, after
+                    )
+                cached = (await to_responses(products), next_cursor)
+                catalog_cache.set(key, cached, tags={"products"} | cache_tags(products), since=generation)
+
+            product_responses, next_cursor = cached
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
             
-            products = await db.products.find(query, {"_id": 0}).to_list(1000)
-            
-            # Populate categories for each product
-            for product in products:
-                await populate_categories(product, db)
-            
-            return [ProductResponse(**prod) for prod in products]
+            return product_responses
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error fetching products: {str(e)}")
             raise HTTPException(status_code=500, detail="Internal server error")
 
+    @router.get("/products/facets", response_model=ProductFacets)
+    async def get_product_facets(
+        request: Request,
+        response: Response,
+        search: Optional[str] = None,
+        category_id: Optional[str] = None,
+        active_only: bool = True,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+        buckets: int = Query(DEFAULT_PRICE_BUCKETS, ge=1, le=100)
+    ):
+        """Get a product page together with per-category counts and price facets.
+
+        Accepts the same filters and paging as GET /products and computes
+        everything in a single $facet aggregation.
+        """
+        try:
+            headers, not_modified = await conditional_get(db, request, PRODUCT_SOURCES)
+            if not_modified:
+                return Response(status_code=304, headers=headers)
+            response.headers.update(headers)
+
+            key = make_key(
+                "facets", search=search, category_id=category_id, active_only=active_only,
+                limit=limit or DEFAULT_PAGE_SIZE, after=after, buckets=buckets
+            )
+            cached = catalog_cache.get(key)
+            if cached is MISSING:
+                generation = catalog_cache.generation
+                query = {}
+                if active_only:
+                    query["is_active"] = True
+                if category_id:
+                    query["category_ids"] = category_id
+
+                page_size = limit or DEFAULT_PAGE_SIZE
+                pipeline = product_facets_pipeline(query, page_size, search, after, buckets)
+                result = (await db.products.aggregate(pipeline).to_list(1))[0]
+
+                products = result["products"]
+                next_cursor = None
+                if len(products) > page_size:
+                    products = products[:page_size]
+                    next_cursor = encode_cursor(products[-1], SEARCH_SORT if search else CREATED_ASC)
+                for product in products:
+                    # $lookup returns categories in collection order; match category_ids
+                    by_id = {category["id"]: category for category in product["categories"]}
+                    product["categories"] = [by_id[cid] for cid in product["category_ids"] if cid in by_id]
+
+                price = result["price"][0] if result["price"] else {}
+                facets = ProductFacets(
+                    products=[ProductResponse(**product) for product in products],
+                    total=result["total"][0]["count"] if result["total"] else 0,
+                    category_counts=result["category_counts"],
+                    price_min=price.get("min"),
+                    price_max=price.get("max"),
+                    price_histogram=result["price_histogram"]
+                )
+                cached = (facets, next_cursor)
+                # Category names appear in the counts, so any category write invalidates
+                catalog_cache.set(
+                    key, cached, tags={"products", "categories"} | cache_tags(products), since=generation
+                )
+
+            facets, next_cursor = cached
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return facets
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error fetching product facets: {str(e)}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+    @router.post("/products/import", response_model=ProductImportResult)
+    async def import_products(
+        file: UploadFile = File(...),
+        input_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+        admin: dict = Depends(verify_admin)
+    ):
+        """Bulk upsert products from a CSV or NDJSON file (Admin only).
+
+        Rows are validated one by one and written with unordered bulk_write in
+        batches. Rows with an ``id`` update that product's fields present in
+        the row, the rest are inserted. In CSV files ``category_ids`` holds "|"-separated ids.
+        """
+        fmt = input_format or detect_format(file.filename, file.content_type)
+        if not fmt:
+            raise HTTPException(
+                status_code=400,
+                detail="Could not detect file format. Pass format=csv or format=ndjson"
+            )
+
+        result = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+        written_ids = []
+
+        def record_error(row_number: int, message: str):
+            result["failed"] += 1
+            if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                result["errors"].append(ProductImportError(row=row_number, error=message))
+
+        async def flush(batch: list):
+            """Write one batch of (row_number, product_id, operation) tuples"""
+            try:
+                bulk_result = await db.products.bulk_write([op for _, _, op in batch], ordered=False)
+                inserted, updated, write_errors = bulk_result.upserted_count, bulk_result.matched_count, []
+            except BulkWriteError as e:
+                details = e.details
+                inserted, updated = details.get("nUpserted", 0), details.get("nMatched", 0)
+                write_errors = details.get("writeErrors", [])
+
+            result["inserted"] += inserted
+            result["updated"] += updated
+            failed = set()
+            for write_error in write_errors:
+                failed.add(write_error["index"])
+                record_error(batch[write_error["index"]][0], write_error.get("errmsg", "Write failed"))
+            written_ids.extend(product_id for i, (_, product_id, _) in enumerate(batch) if i not in failed)
+
+        try:
+            now = datetime.utcnow()
+            rows = iter_models(file.file, fmt, ProductImportRow)
+            # Parsing and validation run in a thread, a batch at a time, so a
+            # large file doesn't hold up the event loop between writes
+            while parsed := await asyncio.to_thread(next_batch, rows, IMPORT_BATCH_SIZE):
+                batch = []
+                for row_number, row, error in parsed:
+                    if error:
+                        record_error(row_number, error)
+                        continue
+
+                    product_id = row.id or str(uuid.uuid4())
+                    # Only the columns a row has overwrite an existing product;
+                    # defaults for the rest apply to new products only
+                    fields = row.model_dump(exclude={"id"}, exclude_unset=True)
+                    fields["updated_at"] = now
+                    defaults = {
+                        key: value for key, value in row.model_dump(exclude={"id"}).items() if key not in fields
+                    }
+                    batch.append((row_number, product_id, UpdateOne(
+                        {"id": product_id},
+                        {
+                            "$set": fields,
+                            "$setOnInsert": {**defaults, "id": product_id, "created_at": now},
+                            "$inc": {"version": 1},
+                        },
+                        upsert=True
+                    )))
+                if batch:
+                    await flush(batch)
+        except Exception as e:
+            logger.error(f"Error importing products: {str(e)}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+        finally:
+            # Earlier batches may have been written even if a later one failed
+            if written_ids:
+                await bump_version(db, "products")
+                catalog_cache.invalidate(*(f"product:{product_id}" for product_id in written_ids))
+
+        logger.info(
+            f"Products imported: {result['inserted']} inserted, "
+            f"{result['updated']} updated, {result['failed']} failed"
+        )
+        return ProductImportResult(**result)
+
+    @router.get("/products/export")
+    async def export_products(
+        output: str = Query("ndjson", alias="format", pattern="^(csv|ndjson)$"),
+        admin: dict = Depends(verify_admin)
+    ):
+        """Stream every product as NDJSON or CSV (Admin only)"""
+        cursor = db.products.find({}, {"_id": 0}).sort(CREATED_ASC)
+        if output == "csv":
+            return StreamingResponse(
+                stream_csv(cursor, EXPORT_FIELDS),
+                media_type=CSV_MEDIA_TYPE,
+                headers={"Content-Disposition": 'attachment; filename="products.csv"'}
+            )
+        return StreamingResponse(
+            stream_ndjson(cursor),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"Content-Disposition": 'attachment; filename="products.ndjson"'}
+        )
+
     @router.get("/products/{product_id}", response_model=ProductResponse)
-    async def get_product(product_id: str):
+    async def get_product(product_id: str, request: Request, response: Response):
         """Get product by ID"""
         try:
-            product = await db.products.find_one({"id": product_id}, {"_id": 0})
-            if not product:
-                raise HTTPException(status_code=404, detail="Product not found")
-            
-            await populate_categories(product, db)
-            return ProductResponse(**product)
+            headers, not_modified = await conditional_get(db, request, PRODUCT_SOURCES)
+            if not_modified:
+                return Response(status_code=304, headers=headers)
+
+            key = make_key("product", id=product_id)
+            product_response = catalog_cache.get(key)
+            if product_response is MISSING:
+                generation = catalog_cache.generation
+                product = await db.products.find_one({"id": product_id}, {"_id": 0})
+                if not product:
+                    raise HTTPException(status_code=404, detail="Product not found")
+                
+                await populate_categories(product, db)
+                product_response = ProductResponse(**product)
+                catalog_cache.set(key, product_response, tags=cache_tags([product]), since=generation)
+
+            response.headers.update(headers)
+            return product_response
         except HTTPException:
             raise
         except Exception as e:
@@ -116,6 +380,7 @@ def create_router(db):
         try:
             product = Product(**product_data.model_dump())
             await db.products.insert_one(product.model_dump())
+            await bump_version(db, "products")
             logger.info(f"Product created: {product.id}")
             
             product_dict = product.model_dump()
@@ -129,24 +394,38 @@ def create_router(db):
     async def update_product(
         product_id: str,
         product_data: ProductUpdate,
+        if_match: Optional[str] = Header(None),
         admin: dict = Depends(verify_admin)
     ):
-        """Update product (Admin only)"""
+        """Update product (Admin only).
+
+        Send the product's ``version`` in If-Match to reject the update with
+        412 if someone else changed the product in the meantime.
+        """
         try:
-            product = await db.products.find_one({"id": product_id}, {"_id": 0})
-            if not product:
-                raise HTTPException(status_code=404, detail="Product not found")
-            
+            try:
+                expected_version = parse_if_match(if_match)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            update_filter = {"id": product_id}
+            if expected_version is not None:
+                update_filter.update(version_filter(expected_version))
+
             update_data = {k: v for k, v in product_data.model_dump().items() if v is not None}
             update_data["updated_at"] = datetime.utcnow()
             
-            if update_data:
-                await db.products.update_one(
-                    {"id": product_id},
-                    {"$set": update_data}
-                )
-            
-            updated_product = await db.products.find_one({"id": product_id}, {"_id": 0})
+            updated_product = await db.products.find_one_and_update(
+                update_filter,
+                {"$set": update_data, "$inc": {"version": 1}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if not updated_product:
+                await raise_not_found_or_conflict(product_id, expected_version)
+
+            await bump_version(db, "products")
+            catalog_cache.invalidate(f"product:{product_id}")
             await populate_categories(updated_product, db)
             return ProductResponse(**updated_product)
         except HTTPException:
@@ -158,13 +437,25 @@ def create_router(db):
     @router.delete("/products/{product_id}")
     async def delete_product(
         product_id: str,
+        if_match: Optional[str] = Header(None),
         admin: dict = Depends(verify_admin)
     ):
-        """Delete product (Admin only)"""
+        """Delete product (Admin only), optionally guarded by If-Match"""
         try:
-            result = await db.products.delete_one({"id": product_id})
+            try:
+                expected_version = parse_if_match(if_match)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            delete_filter = {"id": product_id}
+            if expected_version is not None:
+                delete_filter.update(version_filter(expected_version))
+
+            result = await db.products.delete_one(delete_filter)
             if result.deleted_count == 0:
-                raise HTTPException(status_code=404, detail="Product not found")
+                await raise_not_found_or_conflict(product_id, expected_version)
+            await bump_version(db, "products")
+            catalog_cache.invalidate(f"product:{product_id}")
             
             return {"message": "Product deleted successfully"}
         except HTTPException:
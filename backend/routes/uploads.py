@@ -0,0 +1,195 @@
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from pymongo import ReturnDocument
+from functools import partial
+from typing import Optional
+from datetime import datetime
+import asyncio
+import os
+from models.upload import UploadSession, UploadSessionCreate, UploadSessionResponse
+from services.sniffing import SNIFF_BYTES, check_file, check_prefix, sniff_stream
+from services.uploads import (
+    ALLOWED_EXTENSIONS, MAX_UPLOAD_BYTES, UPLOAD_NODE, UPLOAD_SESSIONS_COLLECTION, UploadTooLarge, create_partial,
+    hash_file, merge_ranges, parse_content_range, partial_path, received_offset, store_blob, unfinished_filter,
+    write_range
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+def create_router(db):
+    """Factory function to create router with database dependency.
+
+    Resumable upload protocol: POST /uploads opens a session for a file of
+    known size, PUT /uploads/{id} with a Content-Range writes any byte range
+    (in any order, in parallel, or again after a failure), GET or HEAD
+    /uploads/{id} reports what has arrived, and POST /uploads/{id}/complete
+    moves the assembled file into content-addressed storage. The session id is then passed to
+    POST /contact as ``upload_id``.
+    """
+    router = APIRouter()
+    sessions = db[UPLOAD_SESSIONS_COLLECTION]
+
+    def to_response(session: dict, response: Optional[Response] = None) -> UploadSessionResponse:
+        offset = received_offset(session["received"])
+        if response is not None:
+            response.headers["Upload-Offset"] = str(offset)
+        return UploadSessionResponse(
+            offset=offset,
+            **{**session, "received": merge_ranges(session["received"])}
+        )
+
+    async def get_open_session(upload_id: str) -> dict:
+        session = await sessions.find_one({"id": upload_id}, {"_id": 0})
+        if not session or session["expires_at"] <= datetime.utcnow():
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        if session["status"] != "open":
+            raise HTTPException(status_code=409, detail="Upload session is no longer accepting data")
+        return session
+
+    @router.post("/uploads", response_model=UploadSessionResponse, status_code=201)
+    async def create_upload_session(body: UploadSessionCreate, response: Response):
+        """
+        Open a resumable upload session
+        """
+        try:
+            file_ext = os.path.splitext(body.filename)[1].lower()
+            if file_ext not in ALLOWED_EXTENSIONS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"File type {file_ext} not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
+                )
+            if body.size > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge(MAX_UPLOAD_BYTES)
+
+            session = UploadSession(
+                filename=os.path.basename(body.filename),
+                size=body.size,
+                sha256=body.sha256.lower() if body.sha256 else None,
+                node=UPLOAD_NODE
+            )
+            await asyncio.to_thread(create_partial, partial_path(session.id), session.size)
+            await sessions.insert_one(session.model_dump())
+            logger.info(f"Upload session created: {session.id}")
+
+            response.headers["Location"] = f"/api/uploads/{session.id}"
+            return to_response(session.model_dump(), response)
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            logger.error(f"Error creating upload session: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    @router.put("/uploads/{upload_id}", response_model=UploadSessionResponse)
+    async def upload_range(
+        upload_id: str,
+        request: Request,
+        response: Response,
+        content_range: Optional[str] = Header(None)
+    ):
+        """
+        Write one byte range of the file. Ranges may overlap, arrive out of
+        order or be sent concurrently; resending a range overwrites it.
+        """
+        try:
+            session = await get_open_session(upload_id)
+            try:
+                start, end = parse_content_range(content_range, session["size"])
+                stream = request.stream()
+                # Sniff the file from its first bytes, refusing the range
+                # before the rest of it is read
+                prefix_bytes = min(SNIFF_BYTES, session["size"])
+                if start == 0 and end >= prefix_bytes:
+                    check = partial(check_prefix, session["filename"], size=session["size"])
+                    stream = sniff_stream(stream, check, prefix_bytes)
+                await write_range(stream, partial_path(upload_id), start, end)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            session = await sessions.find_one_and_update(
+                {"id": upload_id, "status": "open"},
+                {"$push": {"received": [start, end]}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if not session:
+                raise HTTPException(status_code=409, detail="Upload session is no longer accepting data")
+            return to_response(session, response)
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            logger.error(f"Error writing upload range: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    @router.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"], response_model=UploadSessionResponse)
+    async def get_upload_session(upload_id: str, response: Response):
+        """
+        Report the ranges received so far; Upload-Offset is where a
+        sequential client should resume
+        """
+        session = await sessions.find_one({"id": upload_id}, {"_id": 0})
+        if not session:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        return to_response(session, response)
+
+    @router.post("/uploads/{upload_id}/complete", response_model=UploadSessionResponse)
+    async def complete_upload(upload_id: str, response: Response):
+        """
+        Check that every byte arrived (and matches the expected SHA-256, if
+        one was given), that the content is a valid file of its type, and
+        move the file into content-addressed storage
+        """
+        try:
+            session = await sessions.find_one({"id": upload_id}, {"_id": 0})
+            if session and session["status"] == "complete":
+                return to_response(session, response)
+            now = datetime.utcnow()
+            if not session or session["expires_at"] <= now:
+                raise HTTPException(status_code=404, detail="Upload session not found")
+
+            if merge_ranges(session["received"]) != [[0, session["size"]]]:
+                raise HTTPException(status_code=409, detail="Upload is missing byte ranges")
+
+            # Only one request gets to assemble the file; one that died
+            # while assembling is taken over once it is stale
+            if not await sessions.find_one_and_update(
+                {**unfinished_filter(now), "id": upload_id},
+                {"$set": {"status": "assembling", "assembling_at": now}}
+            ):
+                raise HTTPException(status_code=409, detail="Upload session is already being completed")
+
+            reset = {"status": "open", "assembling_at": None}
+            try:
+                part = partial_path(upload_id)
+                if not await asyncio.to_thread(part.exists):
+                    # Consumed by an assembly that died before recording it
+                    await asyncio.to_thread(create_partial, part, session["size"])
+                    reset["received"] = []
+                    raise HTTPException(status_code=409, detail="Upload is missing byte ranges")
+                sha256 = await asyncio.to_thread(hash_file, part)
+                if session["sha256"] and sha256 != session["sha256"]:
+                    # Keep the session open so the client can resend the ranges
+                    reset["received"] = []
+                    raise HTTPException(status_code=422, detail="Uploaded file does not match its SHA-256")
+                await asyncio.to_thread(check_file, session["filename"], part, session["size"])
+
+                # The session holds this reference until a submission takes it over
+                file_path = await store_blob(db, part, sha256, session["size"])
+            except BaseException:
+                await sessions.update_one({"id": upload_id}, {"$set": reset})
+                raise
+
+            session = await sessions.find_one_and_update(
+                {"id": upload_id},
+                {"$set": {"status": "complete", "sha256": sha256, "file_path": str(file_path)}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            logger.info(f"Upload complete: {file_path}")
+            return to_response(session, response)
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            logger.error(f"Error completing upload: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    return router
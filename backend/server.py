@@ -1,7 +1,7 @@
 import os
 
 os.makedirs("uploads", exist_ok=True)
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -11,6 +11,7 @@ from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List
 import uuid
+import asyncio
 from datetime import datetime, timezone
 
 
@@ -74,20 +75,42 @@ from routes.contact import create_router as create_contact_router
 from routes.auth import create_router as create_auth_router
 from routes.products import create_router as create_products_router
 from routes.categories import create_router as create_categories_router
+from routes.uploads import create_router as create_uploads_router
+from routes.jobs import create_router as create_jobs_router
+from services.indexes import ensure_indexes
+from services.cache import catalog_cache
+from services.change_streams import watch_catalog_changes
+from services.auth import create_auth_dependencies, sync_revocations_forever
+from services.uploads import UploadSizeLimitMiddleware, purge_expired_uploads_forever
+from services.jobs import JobPool, run_job_worker
+
+verify_admin = create_auth_dependencies(db).verify_admin
+
+@api_router.get("/cache/stats")
+async def get_cache_stats(admin: dict = Depends(verify_admin)):
+    """Cache sizes and hit rates for this worker (Admin only)"""
+    return {"catalog": catalog_cache.stats()}
 
 contact_router = create_contact_router(db)
 auth_router = create_auth_router(db)
 products_router = create_products_router(db)
 categories_router = create_categories_router(db)
+uploads_router = create_uploads_router(db)
+jobs_router = create_jobs_router(db)
 
 api_router.include_router(contact_router, tags=["contact"])
 api_router.include_router(auth_router, tags=["auth"])
 api_router.include_router(products_router, tags=["products"])
 api_router.include_router(categories_router, tags=["categories"])
+api_router.include_router(uploads_router, tags=["uploads"])
+api_router.include_router(jobs_router, tags=["jobs"])
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Refuse oversized uploads while they stream in rather than after spooling
+app.add_middleware(UploadSizeLimitMiddleware, path_prefixes=("/api/contact", "/api/uploads"))
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -103,6 +126,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes(db)
+
+@app.on_event("startup")
+async def start_catalog_watcher():
+    # Invalidates this worker's catalog cache on writes made by other workers
+    app.state.catalog_watcher = asyncio.create_task(watch_catalog_changes(db, catalog_cache))
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    app.state.revocation_sync = asyncio.create_task(sync_revocations_forever(db))
+
+@app.on_event("startup")
+async def start_upload_purge():
+    app.state.upload_purge = asyncio.create_task(purge_expired_uploads_forever(db))
+
+@app.on_event("startup")
+async def start_job_worker():
+    # Post-processes uploads; CPU-heavy steps run in the worker processes
+    app.state.job_pool = JobPool()
+    app.state.job_worker = asyncio.create_task(run_job_worker(db, app.state.job_pool))
+
+@app.on_event("shutdown")
+async def stop_catalog_watcher():
+    app.state.catalog_watcher.cancel()
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    app.state.revocation_sync.cancel()
+
+@app.on_event("shutdown")
+async def stop_upload_purge():
+    app.state.upload_purge.cancel()
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    # Requeues the jobs still running here so another worker resumes them
+    app.state.job_worker.cancel()
+    await asyncio.gather(app.state.job_worker, return_exceptions=True)
+    app.state.job_pool.shutdown()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
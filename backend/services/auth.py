@@ -0,0 +1,225 @@
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import JWTError, jwt
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple, Optional
+from services.cache import MISSING, TTLCache
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+security = HTTPBearer()
+
+# "lookup" resolves every request's user from Mongo (through user_cache);
+# "claims" trusts the signed role/id claims and only checks revocation, so
+# role or status changes take effect when the short-lived token is refreshed.
+AUTH_MODE = os.environ.get("AUTH_MODE", "lookup")
+
+# JWT settings
+SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-change-in-production")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get(
+    "ACCESS_TOKEN_EXPIRE_MINUTES", "15" if AUTH_MODE == "claims" else str(60 * 24)
+))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+REVOKED_TOKENS_COLLECTION = "revoked_tokens"
+REVOCATION_SYNC_SECONDS = float(os.environ.get("REVOCATION_SYNC_SECONDS", "30"))
+
+# Users by id. Password hashes are never cached.
+USER_PROJECTION = {"_id": 0, "hashed_password": 0}
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("AUTH_USER_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("AUTH_USER_CACHE_TTL", "60")),
+)
+
+
+class RevocationList:
+    """In-memory set of revoked token ids, mirrored from Mongo.
+
+    Only tokens that have not expired yet are kept, which keeps the set
+    small: with short access tokens it holds roughly the logouts of the
+    last refresh period.
+    """
+
+    def __init__(self):
+        self._expiry_by_jti: dict = {}
+        self._synced_until: Optional[datetime] = None
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._expiry_by_jti
+
+    def add(self, jti: str, expires_at: datetime):
+        self._expiry_by_jti[jti] = expires_at
+
+    async def sync(self, db):
+        """Pull revocations recorded by any worker since the last sync"""
+        now = datetime.utcnow()
+        query = {"expires_at": {"$gt": now}}
+        if self._synced_until:
+            # Overlap a little to tolerate clock skew between workers
+            query["revoked_at"] = {"$gte": self._synced_until - timedelta(seconds=5)}
+        async for doc in db[REVOKED_TOKENS_COLLECTION].find(query, {"_id": 0, "jti": 1, "expires_at": 1}):
+            self._expiry_by_jti[doc["jti"]] = doc["expires_at"]
+        self._synced_until = now
+
+        expired = [jti for jti, expires_at in self._expiry_by_jti.items() if expires_at <= now]
+        for jti in expired:
+            del self._expiry_by_jti[jti]
+
+
+revoked_tokens = RevocationList()
+
+
+def _encode(data: dict, token_type: str, expires_delta: timedelta) -> str:
+    to_encode = data.copy()
+    now = datetime.utcnow()
+    to_encode.update({
+        "type": token_type,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + expires_delta,
+    })
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    return _encode(data, "access", expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def create_refresh_token(data: dict) -> str:
+    return _encode(data, "refresh", timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+
+def user_claims(user: dict) -> dict:
+    return {"sub": user["username"], "role": user["role"], "id": user["id"]}
+
+
+def decode_token(token: str, token_type: str = "access") -> Optional[dict]:
+    """Return the token's claims, or None if the signature or expiry is
+    invalid, the token was revoked, or it is not of the expected type"""
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    # Tokens issued before token types existed are access tokens
+    if claims.get("type", "access") != token_type or revoked_tokens.is_revoked(claims.get("jti")):
+        return None
+    return claims
+
+
+async def revoke_token(db, claims: dict) -> bool:
+    """Revoke a token everywhere; other workers pick it up on their next sync.
+
+    Returns False if the token was already revoked, so exactly one of several
+    concurrent callers (on any worker) wins, e.g. when rotating a refresh token.
+    """
+    jti = claims.get("jti")
+    if not jti:
+        return False
+    expires_at = datetime.utcfromtimestamp(claims["exp"])
+    revoked_tokens.add(jti, expires_at)
+    try:
+        result = await db[REVOKED_TOKENS_COLLECTION].update_one(
+            {"jti": jti},
+            {"$setOnInsert": {"jti": jti, "expires_at": expires_at, "revoked_at": datetime.utcnow()}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # A concurrent upsert inserted it first (jti is unique)
+        return False
+    return result.upserted_id is not None
+
+
+async def sync_revocations_forever(db):
+    """Background task keeping this worker's revocation set current"""
+    while True:
+        try:
+            await revoked_tokens.sync(db)
+        except PyMongoError as e:
+            logger.error(f"Could not sync revoked tokens: {str(e)}")
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+
+
+def cache_user(user: dict, since: Optional[int] = None):
+    """Store a freshly read user document, minus its password hash"""
+    user = {k: v for k, v in user.items() if k not in USER_PROJECTION}
+    user_cache.set(("user", user["id"]), user, tags=[f"user:{user['id']}"], since=since)
+
+
+def invalidate_user(user_id: str):
+    """Forget a cached user after its role, status or credentials change"""
+    user_cache.invalidate(f"user:{user_id}")
+
+
+async def get_user(db, user_id: str) -> Optional[dict]:
+    """Look a user up by id through the short-TTL cache"""
+    user = user_cache.get(("user", user_id))
+    if user is not MISSING:
+        return user
+    generation = user_cache.generation
+    user = await db.users.find_one({"id": user_id}, USER_PROJECTION)
+    if user:
+        cache_user(user, since=generation)
+    return user
+
+
+async def resolve_claims(db, claims: dict) -> Optional[dict]:
+    """Return the user a decoded token was issued to"""
+    user_id = claims.get("id")
+    if user_id:
+        user = await get_user(db, user_id)
+    else:
+        # Tokens issued before the id claim was relied on
+        user = await db.users.find_one({"username": claims.get("sub")}, USER_PROJECTION)
+    if not user or user.get("username") != claims.get("sub"):
+        return None
+    return user
+
+
+async def resolve_token(db, token: str) -> Optional[dict]:
+    """Decode a JWT once and return the user it was issued to"""
+    claims = decode_token(token)
+    return await resolve_claims(db, claims) if claims else None
+
+
+class AuthDependencies(NamedTuple):
+    get_token_claims: Callable
+    get_current_user: Callable
+    verify_admin: Callable
+
+
+def create_auth_dependencies(db) -> AuthDependencies:
+    """Build the FastAPI dependencies shared by every router"""
+
+    async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)):
+        """Verify the bearer token and return its claims"""
+        claims = decode_token(credentials.credentials)
+        if not claims:
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        return claims
+
+    async def get_current_user(claims: dict = Depends(get_token_claims)):
+        """Return the authenticated user, from the claims alone in claims mode"""
+        if AUTH_MODE == "claims":
+            if not claims.get("id"):
+                raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+            return {"id": claims["id"], "username": claims.get("sub"), "role": claims.get("role")}
+
+        user = await resolve_claims(db, claims)
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        if not user.get("is_active", True):
+            raise HTTPException(status_code=403, detail="User account is disabled")
+        return user
+
+    async def verify_admin(user: dict = Depends(get_current_user)):
+        """Verify user is admin"""
+        if user.get("role") != "admin":
+            raise HTTPException(status_code=403, detail="Admin access required")
+        return user
+
+    return AuthDependencies(get_token_claims, get_current_user, verify_admin)
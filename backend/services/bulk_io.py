@@ -0,0 +1,90 @@
+from pydantic import BaseModel, ValidationError
+from typing import Iterator, List, Optional, Tuple, Type
+import codecs
+import csv
+import itertools
+import json
+
+# Import formats accepted by the bulk endpoints, keyed by file extension
+FORMATS_BY_EXTENSION = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """Guess csv/ndjson from an upload's file name or content type"""
+    name = (filename or "").lower()
+    for extension, fmt in FORMATS_BY_EXTENSION.items():
+        if name.endswith(extension):
+            return fmt
+    content_type = (content_type or "").lower()
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return None
+
+
+def _clean_csv_row(row: dict) -> dict:
+    cleaned = {}
+    for key, value in row.items():
+        if key is None or value is None or value == "":
+            # Extra cells and empty cells fall back to model defaults
+            continue
+        if key == "category_ids":
+            cleaned[key] = [item for item in value.split("|") if item]
+        else:
+            cleaned[key] = value
+    return cleaned
+
+
+def iter_rows(fileobj, fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Read an uploaded CSV or NDJSON file one row at a time.
+
+    Yields ``(row_number, data, error)`` with exactly one of data/error set,
+    so a malformed line is reported without aborting the whole import.
+    Row numbers are 1-based data rows (the CSV header is not counted).
+    """
+    text = codecs.getreader("utf-8-sig")(fileobj)
+
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row_number, row in enumerate(reader, start=1):
+            yield row_number, _clean_csv_row(row), None
+        return
+
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {str(e)}"
+            continue
+        if not isinstance(data, dict):
+            yield row_number, None, "Expected a JSON object"
+            continue
+        yield row_number, data, None
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
+
+
+def iter_models(fileobj, fmt: str, model: Type[BaseModel]) -> Iterator[Tuple[int, Optional[BaseModel], Optional[str]]]:
+    """``iter_rows`` with each row validated as ``model``; invalid rows
+    become errors like malformed ones"""
+    for row_number, data, error in iter_rows(fileobj, fmt):
+        if error is None:
+            try:
+                yield row_number, model(**data), None
+                continue
+            except ValidationError as e:
+                error = format_validation_error(e)
+        yield row_number, None, error
+
+
+def next_batch(rows: Iterator, size: int) -> List:
+    """Take up to ``size`` items from ``rows``. Reading and parsing the
+    upload blocks, so callers run this in a thread."""
+    return list(itertools.islice(rows, size))
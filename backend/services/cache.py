@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional, Tuple
+import os
+import time
+
+MISSING = object()
+
+
+def make_key(namespace: str, **params) -> tuple:
+    """Normalize query parameters into a hashable cache key.
+
+    Parameters left at None are dropped so ``?search=`` and no search share
+    an entry, and ordering is fixed so equivalent URLs hit the same key.
+    """
+    return (namespace,) + tuple(sorted((k, v) for k, v in params.items() if v is not None))
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+    Entries carry tags so writes can invalidate exactly the entries built
+    from the data they touched. Not thread-safe; meant to be used from the
+    event loop only.
+
+    A read that misses should note ``generation`` before querying the
+    database and pass it to ``set(since=...)``: if a write invalidated any of
+    the entry's tags while the query was in flight, the value may predate
+    that write and is not stored.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, frozenset]]" = OrderedDict()
+        self._tags: dict = {}
+        # Generation at which each tag was last invalidated, oldest first,
+        # bounded by forgetting the oldest tags (sets older than them are skipped)
+        self._invalidated_at: "OrderedDict[str, int]" = OrderedDict()
+        self._forgotten_at = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value or MISSING"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = (), since: Optional[int] = None) -> bool:
+        """Store a value; returns False if it was read before a write that
+        invalidated one of its tags (``since`` is the generation at read time)"""
+        tags = frozenset(tags)
+        if since is not None and self._invalidated_since(since, tags):
+            return False
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+        return True
+
+    def invalidate(self, *tags: str) -> int:
+        """Drop every entry carrying any of the tags; returns how many were dropped"""
+        self.generation += 1
+        keys = set()
+        for tag in tags:
+            keys.update(self._tags.get(tag, ()))
+            self._invalidated_at[tag] = self.generation
+            self._invalidated_at.move_to_end(tag)
+        while len(self._invalidated_at) > self.maxsize:
+            _, self._forgotten_at = self._invalidated_at.popitem(last=False)
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self.generation += 1
+        self._invalidated_at.clear()
+        self._forgotten_at = self.generation
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _invalidated_since(self, generation: int, tags: frozenset) -> bool:
+        if generation < self._forgotten_at:
+            return True
+        return any(self._invalidated_at.get(tag, 0) > generation for tag in tags)
+
+    def _remove(self, key: Hashable):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# Shared by the products and categories routers. Tags used:
+#   "products" / "categories"   every list and version entry of that collection
+#   "product:<id>"              one product's detail entry
+#   "category:<id>"             the category's detail entry and every product
+#                               entry that embeds the category
+catalog_cache = TTLCache(
+    maxsize=int(os.environ.get("CATALOG_CACHE_SIZE", "512")),
+    ttl=float(os.environ.get("CATALOG_CACHE_TTL", "30")),
+)
@@ -0,0 +1,97 @@
+from pymongo.errors import OperationFailure, PyMongoError
+from services.auth import invalidate_user, user_cache
+from services.conditional import VERSIONS_COLLECTION
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Users are watched too, so a disabled or demoted account loses access on
+# every worker at once rather than when its cached copy expires
+WATCHED_COLLECTIONS = ["products", "categories", VERSIONS_COLLECTION, "users"]
+
+# Server error codes
+CHANGE_STREAMS_UNSUPPORTED = 40573  # standalone mongod, no oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+CHANGE_STREAM_FATAL = 280
+
+MAX_BACKOFF_SECONDS = 30
+
+
+def apply_change(cache, change: dict):
+    """Invalidate the cache entries affected by one change event"""
+    operation = change["operationType"]
+    collection = change.get("ns", {}).get("coll")
+
+    if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+        cache.clear()
+        user_cache.clear()
+        return
+
+    if collection == "users":
+        doc = change.get("fullDocument")
+        if doc and "id" in doc:
+            invalidate_user(doc["id"])
+        else:
+            user_cache.clear()
+        return
+
+    if collection == VERSIONS_COLLECTION:
+        # Every catalog write bumps its collection version, so this covers
+        # list and version entries for writes made by other workers
+        cache.invalidate(change["documentKey"]["_id"])
+        return
+
+    doc = change.get("fullDocument")
+    if not doc or "id" not in doc:
+        # Deletes only carry the Mongo _id, which cache tags don't know about
+        cache.clear()
+        return
+
+    if collection == "products":
+        cache.invalidate(f"product:{doc['id']}")
+    elif collection == "categories":
+        cache.invalidate(f"category:{doc['id']}")
+
+
+async def watch_catalog_changes(db, cache):
+    """Keep a per-process catalog cache, and the user cache, coherent with
+    writes from any worker or script.
+
+    Reconnects with exponential backoff and resumes from the last seen
+    resume token. If the token can't be resumed the whole cache is dropped,
+    since events may have been missed.
+    """
+    pipeline = [{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}}}]
+    resume_token = None
+    backoff = 1
+
+    while True:
+        try:
+            async with db.watch(
+                pipeline, full_document="updateLookup", resume_after=resume_token
+            ) as stream:
+                backoff = 1
+                async for change in stream:
+                    apply_change(cache, change)
+                    resume_token = stream.resume_token
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                logger.warning(
+                    "Change streams need a replica set; catalog and user caches rely on TTL expiry only"
+                )
+                return
+            if e.code in (CHANGE_STREAM_HISTORY_LOST, CHANGE_STREAM_FATAL):
+                logger.warning(f"Cannot resume catalog change stream, clearing cache: {str(e)}")
+                resume_token = None
+                cache.clear()
+                user_cache.clear()
+            else:
+                logger.error(f"Catalog change stream failed: {str(e)}")
+        except PyMongoError as e:
+            logger.error(f"Catalog change stream disconnected: {str(e)}")
+
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
@@ -0,0 +1,184 @@
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+from services.cache import MISSING, catalog_cache
+import hashlib
+import re
+
+# One document per catalog collection: {_id: name, version: int, updated_at: datetime}
+VERSIONS_COLLECTION = "collection_versions"
+
+# Clients and CDNs may store catalog responses but must revalidate them
+CACHE_CONTROL = "public, no-cache"
+# For files named by their content, which never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FILE_RANGE_CHUNK = 1024 * 1024
+BYTE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$", re.IGNORECASE)
+
+
+async def bump_version(db, *collections: str):
+    """Record a write to the given collections, invalidating their ETags
+    and every cached list or version entry built from them"""
+    now = datetime.utcnow()
+    for name in collections:
+        await db[VERSIONS_COLLECTION].update_one(
+            {"_id": name},
+            {"$inc": {"version": 1}, "$set": {"updated_at": now}},
+            upsert=True,
+        )
+    catalog_cache.invalidate(*collections)
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Read the expected document version from an If-Match header.
+
+    Write endpoints accept the ``version`` field of the document, optionally
+    quoted (``3``, ``"3"`` or ``W/"3"``). Returns None when the header is
+    absent or ``*``; raises ValueError if it is not a version number.
+    """
+    if value is None or value.strip() == "*":
+        return None
+    tag = value.strip().removeprefix("W/").strip('"')
+    if not tag.isdigit():
+        raise ValueError("If-Match must contain the document version")
+    return int(tag)
+
+
+def version_filter(expected: int) -> dict:
+    """Match documents at the expected version (documents predating the
+    version field report and match version 0)"""
+    if expected == 0:
+        return {"version": {"$exists": False}}
+    return {"version": expected}
+
+
+async def get_versions(db, collections: Iterable[str]) -> dict:
+    """Fetch the current version documents, defaulting unseen collections to 0"""
+    names = sorted(collections)
+    key = ("versions", tuple(names))
+    versions = catalog_cache.get(key)
+    if versions is not MISSING:
+        return versions
+
+    generation = catalog_cache.generation
+    versions = {name: {"version": 0, "updated_at": None} for name in names}
+    async for doc in db[VERSIONS_COLLECTION].find({"_id": {"$in": names}}):
+        versions[doc["_id"]] = {"version": doc.get("version", 0), "updated_at": doc.get("updated_at")}
+    catalog_cache.set(key, versions, tags=names, since=generation)
+    return versions
+
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def validators(request: Request, versions: dict) -> Tuple[str, Optional[datetime]]:
+    """Derive a strong ETag and Last-Modified time for a catalog representation.
+
+    The ETag covers the versions of every collection the body is built from
+    plus the path and query, since each query string is its own representation.
+    """
+    parts = [f"{name}:{versions[name]['version']}" for name in sorted(versions)]
+    parts.append(request.url.path)
+    parts.append(request.url.query)
+    etag = '"' + hashlib.sha1("|".join(parts).encode()).hexdigest() + '"'
+
+    timestamps = [v["updated_at"] for v in versions.values() if v["updated_at"]]
+    return etag, max(timestamps) if timestamps else None
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since (RFC 9110 13.2.2)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # If-None-Match uses weak comparison
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+
+async def conditional_get(db, request: Request, collections: Iterable[str]) -> Tuple[dict, bool]:
+    """Return the validator headers for a catalog response and whether the
+    client's cached copy is still current (so a 304 can be sent)."""
+    etag, last_modified = validators(request, await get_versions(db, collections))
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers, is_not_modified(request, etag, last_modified)
+
+
+def parse_range(value: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Read a Range header as an inclusive (first, last) byte pair.
+
+    Returns None when the whole file should be sent: no header, or one this
+    does not handle (another unit, several ranges), which may be ignored.
+    Raises ValueError if the range lies outside the file.
+    """
+    match = BYTE_RANGE_RE.match(value.strip()) if value else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # The final N bytes
+        if int(last) == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - int(last), 0), size - 1
+    start, end = int(first), int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _read_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    # Starlette iterates plain generators in its threadpool
+    with open(path, "rb") as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(FILE_RANGE_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(
+    request: Request, path: Path, media_type: str, etag: str,
+    cache_control: str = IMMUTABLE_CACHE_CONTROL, headers: Optional[dict] = None
+) -> Response:
+    """Serve a stored file with validators, answering If-None-Match with a
+    304 and a single-range Range request (guarded by If-Range) with a 206"""
+    size = path.stat().st_size
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes", **(headers or {})}
+    if is_not_modified(request, etag, None):
+        return Response(status_code=304, headers=headers)
+
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
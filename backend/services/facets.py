@@ -0,0 +1,76 @@
+from typing import List, Optional
+from services.pagination import CREATED_ASC, apply_after
+from services.search import SEARCH_LANGUAGE, SEARCH_SORT
+
+DEFAULT_PRICE_BUCKETS = 10
+
+
+def product_facets_pipeline(
+    query: dict,
+    limit: int,
+    search: Optional[str] = None,
+    after: Optional[str] = None,
+    price_buckets: int = DEFAULT_PRICE_BUCKETS,
+) -> List[dict]:
+    """Build one aggregation returning a product page plus its facets.
+
+    Every facet sees the same filtered set, so the counts always agree with
+    the listing. The page is keyset-paginated like GET /products and fetches
+    ``limit + 1`` rows so the caller can tell whether a next page exists.
+    """
+    match = dict(query)
+    pipeline = []
+    sort_spec = CREATED_ASC
+    if search:
+        match["$text"] = {"$search": search, "$language": SEARCH_LANGUAGE}
+        sort_spec = SEARCH_SORT
+    pipeline.append({"$match": match})
+    if search:
+        pipeline.append({"$addFields": {"score": {"$meta": "textScore"}}})
+
+    products = []
+    if after:
+        products.append({"$match": apply_after({}, sort_spec, after)})
+    products.extend([
+        {"$sort": dict(sort_spec)},
+        {"$limit": limit + 1},
+        {"$project": {"_id": 0}},
+        {"$lookup": {
+            "from": "categories",
+            "localField": "category_ids",
+            "foreignField": "id",
+            "as": "categories",
+        }},
+        {"$project": {"categories._id": 0}},
+    ])
+
+    pipeline.append({"$facet": {
+        "products": products,
+        "total": [{"$count": "count"}],
+        "category_counts": [
+            {"$unwind": "$category_ids"},
+            {"$group": {"_id": "$category_ids", "count": {"$sum": 1}}},
+            {"$lookup": {
+                "from": "categories",
+                "localField": "_id",
+                "foreignField": "id",
+                "as": "category",
+            }},
+            {"$project": {
+                "_id": 0,
+                "category_id": "$_id",
+                "name": {"$arrayElemAt": ["$category.name", 0]},
+                "slug": {"$arrayElemAt": ["$category.slug", 0]},
+                "count": 1,
+            }},
+            {"$sort": {"count": -1, "category_id": 1}},
+        ],
+        "price": [
+            {"$group": {"_id": None, "min": {"$min": "$price"}, "max": {"$max": "$price"}}},
+        ],
+        "price_histogram": [
+            {"$bucketAuto": {"groupBy": "$price", "buckets": price_buckets}},
+            {"$project": {"_id": 0, "min": "$_id.min", "max": "$_id.max", "count": 1}},
+        ],
+    }})
+    return pipeline
@@ -0,0 +1,131 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+from services.search import CONTACT_TEXT_INDEX, PRODUCT_TEXT_INDEX
+from services.auth import REVOKED_TOKENS_COLLECTION
+from services.jobs import JOBS_COLLECTION
+from services.uploads import UPLOAD_BLOBS_COLLECTION, UPLOAD_SESSIONS_COLLECTION
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Every index the application relies on, per collection. Anything found in
+# the database that is not declared here is reported as drift.
+INDEXES = {
+    "products": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("is_active", ASCENDING), ("category_ids", ASCENDING)], name="is_active_category_ids"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+        PRODUCT_TEXT_INDEX,
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("slug", ASCENDING)], name="slug_unique", unique=True),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+    ],
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    REVOKED_TOKENS_COLLECTION: [
+        IndexModel([("jti", ASCENDING)], name="jti_unique", unique=True),
+        # Mongo drops revocations once the token would have expired anyway
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("revoked_at", ASCENDING)], name="revoked_at"),
+    ],
+    "contact_submissions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        # Admin inbox filters, each followed by the listing order
+        IndexModel(
+            [("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="status_created_at_id"
+        ),
+        IndexModel(
+            [("service_type", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="service_type_created_at_id"
+        ),
+        # Searches for a whole address
+        IndexModel([("email", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="email_created_at_id"),
+        CONTACT_TEXT_INDEX,
+    ],
+    UPLOAD_SESSIONS_COLLECTION: [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)], name="status_expires_at"),
+    ],
+    UPLOAD_BLOBS_COLLECTION: [
+        IndexModel([("refcount", ASCENDING), ("last_referenced_at", ASCENDING)], name="refcount_last_referenced_at"),
+    ],
+    JOBS_COLLECTION: [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Claiming: due queued jobs and running jobs with lapsed leases
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+        IndexModel([("submission_id", ASCENDING)], name="submission_id"),
+    ],
+}
+
+
+def _is_text(spec: dict) -> bool:
+    return any(direction == "text" for direction in dict(spec["key"]).values())
+
+
+def _differences(declared: dict, existing: dict) -> list:
+    """List the ways an existing index differs from its declaration"""
+    differences = []
+    if _is_text(declared):
+        # Text indexes are stored as _fts/_ftsx keys, so compare their options
+        expected_weights = declared.get("weights") or {
+            field: 1 for field, direction in declared["key"].items() if direction == "text"
+        }
+        if existing.get("weights") != expected_weights:
+            differences.append(f"weights {existing.get('weights')} != {expected_weights}")
+        if existing.get("default_language", "english") != declared.get("default_language", "english"):
+            differences.append(f"default_language {existing.get('default_language')} != {declared.get('default_language')}")
+    elif list(existing["key"]) != list(declared["key"].items()):
+        differences.append(f"key {list(existing['key'])} != {list(declared['key'].items())}")
+    if bool(existing.get("unique")) != bool(declared.get("unique")):
+        differences.append(f"unique {bool(existing.get('unique'))} != {bool(declared.get('unique'))}")
+    return differences
+
+
+async def verify_indexes(db) -> dict:
+    """Compare declared indexes with the database and log any drift.
+
+    Returns the declared indexes that are missing, keyed by collection.
+    """
+    missing = {}
+    for collection_name, models in INDEXES.items():
+        existing = await db[collection_name].index_information()
+        declared = {model.document["name"]: model.document for model in models}
+
+        for name, spec in declared.items():
+            if name not in existing:
+                missing.setdefault(collection_name, []).append(name)
+                continue
+            differences = _differences(spec, existing[name])
+            if differences:
+                logger.warning(f"Index drift on {collection_name}.{name}: {'; '.join(differences)}")
+
+        for name in existing:
+            if name != "_id_" and name not in declared:
+                logger.warning(f"Index drift on {collection_name}: undeclared index {name}")
+    return missing
+
+
+async def ensure_indexes(db):
+    """Create missing indexes at startup and report drift on existing ones"""
+    try:
+        missing = await verify_indexes(db)
+    except PyMongoError as e:
+        logger.error(f"Could not inspect indexes: {str(e)}")
+        return
+
+    for collection_name, names in missing.items():
+        for model in INDEXES[collection_name]:
+            if model.document["name"] not in names:
+                continue
+            try:
+                await db[collection_name].create_indexes([model])
+                logger.info(f"Index created: {collection_name}.{model.document['name']}")
+            except OperationFailure as e:
+                # Typically duplicate values blocking a unique index
+                logger.error(f"Could not create index {collection_name}.{model.document['name']}: {str(e)}")
@@ -0,0 +1,275 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "jobs"
+
+# CPU-bound steps run in these processes; the event loop only orchestrates
+JOB_PROCESSES = int(os.environ.get("JOB_PROCESSES", str(os.cpu_count() or 1)))
+# Jobs this server process runs at once (each mostly waits on the pool)
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", str(JOB_PROCESSES)))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1"))
+# A claimed job is owned by its worker until the lease runs out. Leases are
+# renewed while the job runs, so only a crashed worker's jobs are retaken.
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.environ.get("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.environ.get("JOB_RETRY_MAX_SECONDS", "600"))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobFailed(Exception):
+    """Raised by a handler for failures that retrying will not fix"""
+
+
+class JobPool:
+    """Process pool for CPU-bound job steps.
+
+    Processes are spawned, not forked, since the server has Motor's and
+    asyncio's threads running. If a process dies (say the OOM killer takes
+    it on a huge mesh) the pool is replaced and the step fails, so its job
+    is retried like any other failure.
+    """
+
+    def __init__(self, processes: int = JOB_PROCESSES):
+        self.processes = processes
+        self._executor = self._create()
+
+    def _create(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+
+    async def run(self, fn: Callable, *args):
+        executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            if executor is self._executor:
+                logger.error("Job process pool broke; starting a new one")
+                self._executor = self._create()
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class JobContext:
+    """What a handler gets: the job, a way to report progress and a way to
+    run blocking functions in the process pool"""
+
+    def __init__(self, db, job: dict, pool: JobPool):
+        self.db = db
+        self.job = job
+        self.payload = job["payload"]
+        self._pool = pool
+
+    async def progress(self, stage: str, index: int, total: int):
+        """Record that the job is on ``stage``, step ``index`` of ``total``"""
+        await self.db[JOBS_COLLECTION].update_one(
+            {"id": self.job["id"], "worker": self.job["worker"]},
+            {"$set": {
+                "progress": {"stage": stage, "step": index, "steps": total, "percent": round(100 * index / total)},
+                "updated_at": datetime.utcnow(),
+            }},
+        )
+
+    async def run_cpu(self, fn: Callable, *args):
+        """Run a picklable top-level function in the process pool"""
+        return await self._pool.run(fn, *args)
+
+
+JobHandler = Callable[[JobContext], Awaitable[Optional[dict]]]
+FailureHook = Callable[[object, dict, str], Awaitable[None]]
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+JOB_FAILURE_HOOKS: Dict[str, FailureHook] = {}
+
+
+def job_handler(job_type: str, on_failure: Optional[FailureHook] = None):
+    """Register an async handler for a job type; its return value is stored
+    as the job's result. ``on_failure(db, job, error)`` runs once the job
+    has failed for good, e.g. to update the record it was working on."""
+    def register(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[job_type] = handler
+        if on_failure:
+            JOB_FAILURE_HOOKS[job_type] = on_failure
+        return handler
+    return register
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff, jittered so a batch of failures spreads out"""
+    ceiling = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+async def enqueue_job(
+    db, job_type: str, payload: dict, submission_id: Optional[str] = None,
+    stages: Optional[List[str]] = None, max_attempts: int = JOB_MAX_ATTEMPTS, job_id: Optional[str] = None
+) -> str:
+    """Queue a job and return its id"""
+    now = datetime.utcnow()
+    job_id = job_id or str(uuid.uuid4())
+    await db[JOBS_COLLECTION].insert_one({
+        "id": job_id,
+        "type": job_type,
+        "payload": payload,
+        "submission_id": submission_id,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": now,
+        "lease_until": None,
+        "worker": None,
+        "progress": {"stage": "queued", "step": 0, "steps": len(stages or []) or 1, "percent": 0},
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    })
+    return job_id
+
+
+async def claim_job(db, worker_id: str) -> Optional[dict]:
+    """Atomically take the next due job, or one whose worker's lease lapsed
+    while it still has attempts left"""
+    now = datetime.utcnow()
+    return await db[JOBS_COLLECTION].find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_at": {"$lte": now}},
+            {
+                "status": "running",
+                "lease_until": {"$lte": now},
+                "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+            },
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "worker": worker_id,
+                "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def fail_lapsed_jobs(db):
+    """Fail the jobs whose lease lapsed on their last attempt. Their worker
+    died mid-run (say the OOM killer took it), so retrying would only repeat
+    that until someone notices."""
+    now = datetime.utcnow()
+    query = {
+        "status": "running",
+        "lease_until": {"$lte": now},
+        "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+    }
+    error = "Lease expired: the worker running the job stopped"
+    while job := await db[JOBS_COLLECTION].find_one_and_update(
+        query,
+        {"$set": {"status": "failed", "error": error, "lease_until": None, "updated_at": now}},
+        projection={"_id": 0},
+    ):
+        logger.error(f"Job {job['id']} ({job['type']}) failed: lease expired on attempt {job['attempts']}")
+        failure_hook = JOB_FAILURE_HOOKS.get(job["type"])
+        if failure_hook:
+            await failure_hook(db, job, error)
+
+
+async def _renew_lease(db, job: dict):
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        await db[JOBS_COLLECTION].update_one(
+            {"id": job["id"], "worker": job["worker"], "status": "running"},
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}},
+        )
+
+
+async def _finish(db, job: dict, update: dict):
+    update["updated_at"] = datetime.utcnow()
+    # Only the current owner may settle the job
+    await db[JOBS_COLLECTION].update_one(
+        {"id": job["id"], "worker": job["worker"], "status": "running"}, {"$set": update}
+    )
+
+
+async def run_job(db, job: dict, pool: JobPool):
+    """Run one claimed job to success, a scheduled retry or failure"""
+    handler = JOB_HANDLERS.get(job["type"])
+    renewal = asyncio.create_task(_renew_lease(db, job))
+    try:
+        if handler is None:
+            raise JobFailed(f"No handler for job type {job['type']}")
+        result = await handler(JobContext(db, job, pool))
+    except asyncio.CancelledError:
+        # Shutting down: let another worker pick it up straight away
+        await _finish(db, job, {"status": "queued", "run_at": datetime.utcnow(), "lease_until": None})
+        raise
+    except Exception as e:
+        permanent = isinstance(e, JobFailed) or job["attempts"] >= job["max_attempts"]
+        logger.error(f"Job {job['id']} ({job['type']}) attempt {job['attempts']} failed: {str(e)}")
+        if permanent:
+            await _finish(db, job, {"status": "failed", "error": str(e), "lease_until": None})
+            failure_hook = JOB_FAILURE_HOOKS.get(job["type"])
+            if failure_hook:
+                await failure_hook(db, job, str(e))
+        else:
+            retry_at = datetime.utcnow() + timedelta(seconds=retry_delay(job["attempts"]))
+            await _finish(db, job, {"status": "queued", "run_at": retry_at, "error": str(e), "lease_until": None})
+    else:
+        await _finish(db, job, {
+            "status": "succeeded",
+            "result": result,
+            "error": None,
+            "lease_until": None,
+            "progress": {**job["progress"], "stage": "done", "step": job["progress"]["steps"], "percent": 100},
+        })
+    finally:
+        renewal.cancel()
+
+
+async def run_job_worker(db, pool: JobPool):
+    """Background task claiming and running jobs, JOB_CONCURRENCY at a time"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    slots = asyncio.Semaphore(JOB_CONCURRENCY)
+    running = set()
+    try:
+        while True:
+            await slots.acquire()
+            try:
+                job = await claim_job(db, worker_id)
+            except Exception as e:
+                logger.error(f"Could not claim a job: {str(e)}")
+                job = None
+            if job is None:
+                slots.release()
+                try:
+                    await fail_lapsed_jobs(db)
+                except Exception as e:
+                    logger.error(f"Could not fail lapsed jobs: {str(e)}")
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+
+            task = asyncio.create_task(run_job(db, job, pool))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
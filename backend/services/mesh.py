@@ -0,0 +1,310 @@
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import os
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+import numpy as np
+
+# Every loader returns triangles as an (N, 3, 3) float array: triangle,
+# corner, xyz. Binary STL is mapped straight from disk without copying; the
+# text formats are parsed into arrays once and measured the same way.
+# These functions block and are CPU bound, so call them off the event loop.
+
+# File extensions load_mesh understands
+MESH_EXTENSIONS = ['.stl', '.obj', '.3mf']
+
+# Triangles measured per step. Small enough that the per-step temporaries
+# stay in CPU cache, which matters more than the number of steps.
+ANALYSIS_CHUNK = 65536
+
+STL_HEADER_BYTES = 84
+STL_RECORD = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attributes", "<u2"),
+])
+
+THREEMF_CORE_NS = "http://schemas.microsoft.com/3dmanufacturing/core/2015/02"
+THREEMF_PRODUCTION_NS = "http://schemas.microsoft.com/3dmanufacturing/production/2015/06"
+THREEMF_MODEL_REL = "http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"
+THREEMF_DEFAULT_MODEL = "3D/3dmodel.model"
+
+ASCII_STL_VERTEX_RE = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+
+
+class MeshError(ValueError):
+    """The file is not a mesh this module can read"""
+
+
+# ---- STL ----
+
+def is_binary_stl(size: int, header: bytes) -> bool:
+    """Binary STLs are exactly 84 + 50 * count bytes. ASCII files start with
+    "solid", but so do many binary headers, so the size decides."""
+    if size < STL_HEADER_BYTES or len(header) < STL_HEADER_BYTES:
+        return False
+    count = int.from_bytes(header[80:84], "little")
+    return size == STL_HEADER_BYTES + count * STL_RECORD.itemsize
+
+
+def load_binary_stl(path: Path) -> np.ndarray:
+    count = (os.path.getsize(path) - STL_HEADER_BYTES) // STL_RECORD.itemsize
+    if count == 0:
+        return np.empty((0, 3, 3), dtype=np.float32)
+    records = np.memmap(path, dtype=STL_RECORD, mode="r", offset=STL_HEADER_BYTES, shape=(count,))
+    return records["vertices"]
+
+
+def load_ascii_stl(path: Path) -> np.ndarray:
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.lstrip().startswith(b"solid"):
+        raise MeshError("Not an STL file")
+    vertices = ASCII_STL_VERTEX_RE.findall(data)
+    if len(vertices) % 3:
+        raise MeshError("ASCII STL has an incomplete facet")
+    try:
+        return np.array(vertices, dtype=np.float64).reshape(-1, 3, 3)
+    except ValueError as e:
+        raise MeshError(f"Invalid ASCII STL vertex: {e}")
+
+
+def load_stl(path: Path) -> np.ndarray:
+    with open(path, "rb") as f:
+        header = f.read(STL_HEADER_BYTES)
+    if is_binary_stl(os.path.getsize(path), header):
+        return load_binary_stl(path)
+    return load_ascii_stl(path)
+
+
+# ---- OBJ ----
+
+def _obj_index(token: bytes, vertex_count: int) -> int:
+    # "v", "v/vt", "v//vn" or "v/vt/vn"; 1-based, negative counts from the end
+    index = int(token.split(b"/", 1)[0])
+    return index - 1 if index > 0 else vertex_count + index
+
+
+def load_obj(path: Path) -> np.ndarray:
+    """Read vertices and faces; polygons are fan-triangulated"""
+    vertices = []
+    faces = []
+    with open(path, "rb") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == b"v":
+                vertices.append(parts[1:4])
+            elif parts[0] == b"f":
+                try:
+                    corners = [_obj_index(token, len(vertices)) for token in parts[1:]]
+                except ValueError:
+                    raise MeshError(f"Invalid OBJ face: {line.strip()[:80]!r}")
+                for i in range(1, len(corners) - 1):
+                    faces.append((corners[0], corners[i], corners[i + 1]))
+    if not faces:
+        raise MeshError("OBJ file has no faces")
+    try:
+        points = np.array(vertices, dtype=np.float64)
+    except ValueError as e:
+        raise MeshError(f"Invalid OBJ vertex: {e}")
+    indices = np.array(faces, dtype=np.int64)
+    if indices.min() < 0 or indices.max() >= len(points):
+        raise MeshError("OBJ face refers to a missing vertex")
+    return points[indices]
+
+
+# ---- 3MF ----
+
+def _parse_transform(value: Optional[str]) -> Optional[np.ndarray]:
+    """3MF transforms are 12 numbers: a 3x3 matrix then a translation, applied
+    to row vectors (p' = p @ M + t). Returned as a 4x3 matrix."""
+    if not value:
+        return None
+    numbers = np.array(value.split(), dtype=np.float64)
+    if numbers.size != 12:
+        raise MeshError(f"Invalid 3MF transform: {value}")
+    return numbers.reshape(4, 3)
+
+
+def _apply_transform(triangles: np.ndarray, transform: Optional[np.ndarray]) -> np.ndarray:
+    if transform is None:
+        return triangles
+    return triangles @ transform[:3] + transform[3]
+
+
+def threemf_model_path(archive: zipfile.ZipFile) -> str:
+    """The root model part named by _rels/.rels, or the conventional path"""
+    try:
+        rels = ET.fromstring(archive.read("_rels/.rels"))
+    except (KeyError, ET.ParseError):
+        return THREEMF_DEFAULT_MODEL
+    for rel in rels:
+        if rel.get("Type") == THREEMF_MODEL_REL:
+            return rel.get("Target", THREEMF_DEFAULT_MODEL).lstrip("/")
+    return THREEMF_DEFAULT_MODEL
+
+
+def _read_threemf_part(archive: zipfile.ZipFile, part: str) -> Tuple[Dict[str, tuple], list, str]:
+    """Return ({object id: ("mesh", triangles) | ("components", [...])},
+    build items, unit) for one model part"""
+    core = f"{{{THREEMF_CORE_NS}}}"
+    production_path = f"{{{THREEMF_PRODUCTION_NS}}}path"
+    try:
+        root = ET.fromstring(archive.read(part))
+    except KeyError:
+        raise MeshError(f"3MF package has no model part {part}")
+    except ET.ParseError as e:
+        raise MeshError(f"Invalid 3MF model XML: {e}")
+
+    objects = {}
+    for obj in root.iter(f"{core}object"):
+        mesh = obj.find(f"{core}mesh")
+        if mesh is not None:
+            vertices = [
+                (v.get("x"), v.get("y"), v.get("z"))
+                for v in mesh.iterfind(f"{core}vertices/{core}vertex")
+            ]
+            triangles = [
+                (t.get("v1"), t.get("v2"), t.get("v3"))
+                for t in mesh.iterfind(f"{core}triangles/{core}triangle")
+            ]
+            try:
+                points = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+                indices = np.array(triangles, dtype=np.int64).reshape(-1, 3)
+            except (TypeError, ValueError) as e:
+                raise MeshError(f"Invalid 3MF mesh in object {obj.get('id')}: {e}")
+            if indices.size and (indices.min() < 0 or indices.max() >= len(points)):
+                raise MeshError(f"3MF object {obj.get('id')} refers to a missing vertex")
+            objects[obj.get("id")] = ("mesh", points[indices])
+        else:
+            components = [
+                (c.get("objectid"), _parse_transform(c.get("transform")), c.get(production_path))
+                for c in obj.iterfind(f"{core}components/{core}component")
+            ]
+            objects[obj.get("id")] = ("components", components)
+
+    items = [
+        (item.get("objectid"), _parse_transform(item.get("transform")), item.get(production_path))
+        for item in root.iterfind(f"{core}build/{core}item")
+    ]
+    return objects, items, root.get("unit", "millimeter")
+
+
+def load_3mf(path: Path) -> Tuple[np.ndarray, str]:
+    """Return the build's triangles in world coordinates, and the unit"""
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise MeshError("3MF file is not a valid ZIP package")
+
+    with archive:
+        root_part = threemf_model_path(archive)
+        parts = {}
+
+        def part_objects(part: str) -> dict:
+            if part not in parts:
+                parts[part] = _read_threemf_part(archive, part)[0]
+            return parts[part]
+
+        def resolve(object_id: str, part: str, depth: int = 0) -> np.ndarray:
+            if depth > 32:
+                raise MeshError("3MF components nest too deeply")
+            kind, value = part_objects(part).get(object_id, (None, None))
+            if kind is None:
+                raise MeshError(f"3MF object {object_id} not found in {part}")
+            if kind == "mesh":
+                return value
+            pieces = [
+                _apply_transform(resolve(child, (child_part or part).lstrip("/"), depth + 1), transform)
+                for child, transform, child_part in value
+            ]
+            return np.concatenate(pieces) if pieces else np.empty((0, 3, 3))
+
+        objects, items, unit = _read_threemf_part(archive, root_part)
+        parts[root_part] = objects
+        pieces = [
+            _apply_transform(resolve(object_id, (item_part or root_part).lstrip("/")), transform)
+            for object_id, transform, item_part in items
+        ]
+    if not pieces:
+        raise MeshError("3MF build has no items")
+    return np.concatenate(pieces), unit
+
+
+# ---- Loading and measuring ----
+
+def load_mesh(path: Path, filename: Optional[str] = None) -> Tuple[np.ndarray, str]:
+    """Load a mesh as (N, 3, 3) triangles plus its unit of length, picking
+    the parser from ``filename`` (or the path) extension"""
+    ext = os.path.splitext(filename or str(path))[1].lower()
+    if ext == ".stl":
+        return load_stl(path), "millimeter"
+    if ext == ".obj":
+        return load_obj(path), "millimeter"
+    if ext == ".3mf":
+        return load_3mf(path)
+    raise MeshError(f"Mesh analysis does not support {ext or 'this'} files")
+
+
+def measure(triangles: np.ndarray) -> dict:
+    """Triangle count, bounding box, surface area and signed volume.
+
+    Triangles are processed in cache-sized chunks, each transposed into
+    nine contiguous coordinate columns so every step is a flat vectorized
+    loop; a memory-mapped file is read once. Volume is the sum of signed
+    tetrahedron volumes against a reference point on the mesh (which keeps
+    precision for models far from the origin); it is negative when the
+    triangles wind inwards and only meaningful for closed meshes.
+    """
+    count = len(triangles)
+    if count == 0:
+        raise MeshError("Mesh has no triangles")
+
+    origin = np.asarray(triangles[0, 0], dtype=np.float64)
+    offsets = np.tile(origin, 3)[:, None]
+    lower = np.full(3, np.inf)
+    upper = np.full(3, -np.inf)
+    area = 0.0
+    volume = 0.0
+    for start in range(0, count, ANALYSIS_CHUNK):
+        chunk = np.asarray(triangles[start:start + ANALYSIS_CHUNK]).reshape(-1, 9)
+        columns = np.empty((9, len(chunk)))
+        np.subtract(chunk.T, offsets, out=columns)
+        ax, ay, az, bx, by, bz, cx, cy, cz = columns
+        lower = np.minimum(lower, [columns[axis::3].min() for axis in range(3)])
+        upper = np.maximum(upper, [columns[axis::3].max() for axis in range(3)])
+
+        # |(b - a) x (c - a)| / 2
+        ux, uy, uz = bx - ax, by - ay, bz - az
+        vx, vy, vz = cx - ax, cy - ay, cz - az
+        nx = uy * vz - uz * vy
+        ny = uz * vx - ux * vz
+        nz = ux * vy - uy * vx
+        area += 0.5 * np.sqrt(nx * nx + ny * ny + nz * nz).sum()
+
+        # a . (b x c) / 6
+        volume += (
+            ax * (by * cz - bz * cy) + ay * (bz * cx - bx * cz) + az * (bx * cy - by * cx)
+        ).sum() / 6.0
+
+    if not (np.isfinite(lower).all() and np.isfinite(upper).all()):
+        raise MeshError("Mesh has non-finite coordinates")
+    lower += origin
+    upper += origin
+    return {
+        "triangle_count": int(count),
+        "bbox_min": lower.tolist(),
+        "bbox_max": upper.tolist(),
+        "dimensions": (upper - lower).tolist(),
+        "surface_area": float(area),
+        "volume": float(volume),
+    }
+
+
+def analyze_mesh(path: Path, filename: Optional[str] = None) -> dict:
+    """Load and measure a mesh file; raises MeshError if it can't be read"""
+    triangles, unit = load_mesh(path, filename)
+    return {**measure(triangles), "unit": unit}
@@ -0,0 +1,144 @@
+from fastapi.encoders import jsonable_encoder
+from bson import json_util
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+import base64
+import csv
+import io
+import json
+
+# Sort specs are lists of (field, direction) pairs; the last field must be unique
+CREATED_ASC = [("created_at", 1), ("id", 1)]
+CREATED_DESC = [("created_at", -1), ("id", -1)]
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+STREAM_BATCH_SIZE = 200
+MAX_PAGE_SIZE = 1000
+# Cells starting with these are run as formulas by spreadsheet applications
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class InvalidCursor(ValueError):
+    """Raised when an ``after`` cursor cannot be decoded"""
+
+
+def encode_cursor(doc: dict, sort_spec: List[Tuple[str, int]]) -> str:
+    """Encode the sort key of a document into an opaque cursor"""
+    values = [doc.get(field) for field, _ in sort_spec]
+    raw = json_util.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_spec: List[Tuple[str, int]]) -> list:
+    """Decode a cursor produced by encode_cursor, raising InvalidCursor if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(sort_spec):
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def keyset_filter(sort_spec: List[Tuple[str, int]], values: list) -> dict:
+    """Build a filter matching documents strictly after the given sort key"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort_spec):
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort_spec[:i])}
+        clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def apply_after(query: dict, sort_spec: List[Tuple[str, int]], after: Optional[str]) -> dict:
+    """Restrict a query to documents after the cursor, if one was given"""
+    if not after:
+        return query
+    keyset = keyset_filter(sort_spec, decode_cursor(after, sort_spec))
+    return {"$and": [query, keyset]} if query else keyset
+
+
+async def fetch_page(
+    collection,
+    query: dict,
+    sort_spec: List[Tuple[str, int]],
+    limit: int,
+    after: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one keyset page and the cursor for the next one (None on the last page)"""
+    docs = await collection.find(
+        apply_after(query, sort_spec, after), {"_id": 0}
+    ).sort(sort_spec).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_spec)
+    return docs, next_cursor
+
+
+async def iter_batches(cursor, batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+    """Group documents from a Motor cursor into lists of at most batch_size"""
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def stream_ndjson(
+    cursor,
+    transform: Optional[Callable[[List[dict]], Any]] = None,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    """Yield one JSON line per document straight from a Motor cursor.
+
+    ``transform`` is awaited once per batch and must return the items to
+    serialize, which lets callers enrich documents without per-row queries.
+    """
+    async for batch in iter_batches(cursor.batch_size(batch_size), batch_size):
+        items = await transform(batch) if transform else batch
+        yield "".join(
+            json.dumps(jsonable_encoder(item)) + "\n" for item in items
+        ).encode()
+
+
+def csv_value(value: Any) -> Any:
+    """Flatten a document value into a CSV cell (lists are joined with "|")"""
+    if isinstance(value, (list, tuple)):
+        return "|".join(str(item) for item in value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def csv_text(value: Any) -> Any:
+    """Like csv_value, but text that a spreadsheet would evaluate is quoted
+    with a leading apostrophe; use it for data typed in by the public"""
+    value = csv_value(value)
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def stream_csv(
+    cursor,
+    fieldnames: List[str],
+    batch_size: int = STREAM_BATCH_SIZE,
+    to_cell: Callable[[Any], Any] = csv_value,
+) -> AsyncIterator[bytes]:
+    """Yield a CSV header and then one encoded chunk per batch from a Motor cursor"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    yield buffer.getvalue().encode()
+
+    async for batch in iter_batches(cursor.batch_size(batch_size), batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows({field: to_cell(doc.get(field)) for field in fieldnames} for doc in batch)
+        yield buffer.getvalue().encode()
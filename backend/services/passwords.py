@@ -0,0 +1,72 @@
+from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import asyncio
+import os
+
+# Hashing policy. The first scheme hashes new passwords; hashes made with any
+# other listed scheme or with different cost settings still verify and are
+# upgraded on the user's next successful login. Use calibrate_passwords.py
+# to pick costs for the current hardware.
+PASSWORD_SCHEMES = os.environ.get("PASSWORD_SCHEMES", "bcrypt").split(",")
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", "4"))
+
+
+def build_crypt_context(
+    schemes: Optional[List[str]] = None,
+    bcrypt_rounds: int = BCRYPT_ROUNDS,
+    argon2_time_cost: int = ARGON2_TIME_COST,
+    argon2_memory_cost: int = ARGON2_MEMORY_COST,
+    argon2_parallelism: int = ARGON2_PARALLELISM,
+) -> CryptContext:
+    """Build a CryptContext for the given policy (argon2 needs argon2-cffi)"""
+    schemes = [scheme.strip() for scheme in (schemes or PASSWORD_SCHEMES)]
+    settings = {"schemes": schemes, "deprecated": "auto"}
+    if "bcrypt" in schemes:
+        settings["bcrypt__rounds"] = bcrypt_rounds
+    if "argon2" in schemes:
+        settings["argon2__time_cost"] = argon2_time_cost
+        settings["argon2__memory_cost"] = argon2_memory_cost
+        settings["argon2__parallelism"] = argon2_parallelism
+    return CryptContext(**settings)
+
+
+# Password hashing
+pwd_context = build_crypt_context()
+
+# bcrypt releases the GIL while hashing, so a small thread pool keeps it off
+# the event loop without a process pool's pickling overhead.
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash/verify calls allowed to be running or waiting for a worker at once
+HASH_QUEUE_LIMIT = int(os.environ.get("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = 0
+
+
+class HashingOverloaded(Exception):
+    """Raised instead of queueing when the hashing pool is saturated"""
+
+
+async def _run_in_pool(fn, *args):
+    global _pending
+    if _pending >= HASH_QUEUE_LIMIT:
+        raise HashingOverloaded()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and, if its hash predates the current policy,
+    also return a replacement hash (otherwise None)"""
+    return await _run_in_pool(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def hash_password(password: str) -> str:
+    return await _run_in_pool(pwd_context.hash, password)
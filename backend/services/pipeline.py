@@ -0,0 +1,130 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import os
+from services.jobs import JobContext, JobFailed, enqueue_job, job_handler
+from services.mesh import MESH_EXTENSIONS, MeshError, analyze_mesh
+from services.preview import PREVIEW_MEDIA_TYPE, build_preview
+from services.quoting import requote_submissions
+from services.storage import LocalCopy, local_path, storage
+from services.thumbnails import THUMBNAIL_FORMATS, render_thumbnails
+from services.uploads import UPLOAD_BLOBS_COLLECTION, blob_key
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_JOB = "process_upload"
+
+
+async def analyze_stage(ctx: JobContext, source: LocalCopy) -> Optional[dict]:
+    """Mesh analysis, computed once per distinct content and kept on the blob"""
+    payload = ctx.payload
+    blob = await ctx.db[UPLOAD_BLOBS_COLLECTION].find_one({"_id": payload["sha256"]}, {"mesh": 1})
+    mesh = blob.get("mesh") if blob else None
+    if not mesh:
+        try:
+            mesh = await ctx.run_cpu(analyze_mesh, await source.path(), payload["file_name"])
+        except MeshError as e:
+            raise JobFailed(f"Could not analyze {payload['file_name']}: {str(e)}")
+        await ctx.db[UPLOAD_BLOBS_COLLECTION].update_one({"_id": payload["sha256"]}, {"$set": {"mesh": mesh}})
+    await ctx.db.contact_submissions.update_one({"id": payload["submission_id"]}, {"$set": {"mesh": mesh}})
+    return mesh
+
+
+async def quote_stage(ctx: JobContext, source: LocalCopy) -> Optional[dict]:
+    """Instant quote from the analysis, cached per content and rate table"""
+    submission = await ctx.db.contact_submissions.find_one(
+        {"id": ctx.payload["submission_id"]}, {"_id": 0, "id": 1, "mesh": 1, "file_sha256": 1}
+    )
+    quotes = await requote_submissions(ctx.db, [submission] if submission else [])
+    return quotes.get(ctx.payload["submission_id"])
+
+
+async def _store_outputs(keys: List[str], content_types: Dict[str, str]):
+    """Move files a job step wrote locally into storage"""
+    await asyncio.gather(*(
+        storage.put(key, local_path(key), content_types.get(os.path.splitext(key)[1].lstrip(".")))
+        for key in keys
+    ))
+
+
+async def thumbnail_stage(ctx: JobContext, source: LocalCopy) -> Optional[dict]:
+    """Render the preview images once per content; the blob lists them"""
+    payload = ctx.payload
+    blob = await ctx.db[UPLOAD_BLOBS_COLLECTION].find_one({"_id": payload["sha256"]}, {"thumbnails": 1})
+    if not (blob and blob.get("thumbnails")):
+        keys = await ctx.run_cpu(render_thumbnails, str(await source.path()), payload["file_name"], payload["sha256"])
+        await _store_outputs(keys, THUMBNAIL_FORMATS)
+        await ctx.db[UPLOAD_BLOBS_COLLECTION].update_one({"_id": payload["sha256"]}, {"$set": {"thumbnails": keys}})
+    thumbnail_url = f"/api/contact/{payload['submission_id']}/thumbnail"
+    await ctx.db.contact_submissions.update_one(
+        {"id": payload["submission_id"]}, {"$set": {"thumbnail_url": thumbnail_url}}
+    )
+    return {"thumbnail_url": thumbnail_url}
+
+
+async def preview_stage(ctx: JobContext, source: LocalCopy) -> Optional[dict]:
+    """Reduced, quantized copy of the mesh for the 3D viewer, built once per
+    content. A mesh that cannot be reduced just goes without a preview."""
+    payload = ctx.payload
+    blob = await ctx.db[UPLOAD_BLOBS_COLLECTION].find_one({"_id": payload["sha256"]}, {"preview": 1})
+    preview = blob.get("preview") if blob else None
+    if not preview:
+        try:
+            preview = await ctx.run_cpu(build_preview, str(await source.path()), payload["file_name"], payload["sha256"])
+        except MeshError as e:
+            logger.warning(f"No preview for {payload['file_name']}: {str(e)}")
+            return None
+        await storage.put(preview["key"], local_path(preview["key"]), PREVIEW_MEDIA_TYPE)
+        await ctx.db[UPLOAD_BLOBS_COLLECTION].update_one({"_id": payload["sha256"]}, {"$set": {"preview": preview}})
+    preview_url = f"/api/contact/{payload['submission_id']}/preview"
+    await ctx.db.contact_submissions.update_one(
+        {"id": payload["submission_id"]}, {"$set": {"preview_url": preview_url}}
+    )
+    return {**preview, "preview_url": preview_url}
+
+
+# Steps run for every uploaded mesh, in order. Each is safe to rerun, since
+# a failed job is retried from the first stage. They share one local copy of
+# the file, fetched only if some step has to read it.
+UPLOAD_STAGES: Dict[str, Callable[[JobContext, LocalCopy], Awaitable[Optional[dict]]]] = {
+    "analyze": analyze_stage,
+    "quote": quote_stage,
+    "thumbnail": thumbnail_stage,
+    "preview": preview_stage,
+}
+
+
+async def mark_submission_failed(db, job: dict, error: str):
+    await db.contact_submissions.update_one(
+        {"id": job["payload"]["submission_id"]}, {"$set": {"status": "failed", "processing_error": error}}
+    )
+
+
+@job_handler(UPLOAD_JOB, on_failure=mark_submission_failed)
+async def process_upload(ctx: JobContext) -> dict:
+    results = {}
+    async with LocalCopy(storage, blob_key(ctx.payload["sha256"])) as source:
+        for index, (stage, run_stage) in enumerate(UPLOAD_STAGES.items()):
+            await ctx.progress(stage, index, len(UPLOAD_STAGES))
+            results[stage] = await run_stage(ctx, source)
+    await ctx.db.contact_submissions.update_one(
+        {"id": ctx.payload["submission_id"]}, {"$set": {"status": "analyzed", "processing_error": None}}
+    )
+    return results
+
+
+def needs_processing(file_name: Optional[str]) -> bool:
+    return bool(file_name) and os.path.splitext(file_name)[1].lower() in MESH_EXTENSIONS
+
+
+async def enqueue_upload_processing(
+    db, submission_id: str, file_name: str, file_path: str, sha256: str, job_id: Optional[str] = None
+) -> str:
+    """Queue the post-processing of a submission's uploaded mesh"""
+    return await enqueue_job(
+        db, UPLOAD_JOB,
+        {"submission_id": submission_id, "file_name": file_name, "file_path": file_path, "sha256": sha256},
+        submission_id=submission_id,
+        stages=list(UPLOAD_STAGES),
+        job_id=job_id,
+    )
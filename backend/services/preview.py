@@ -0,0 +1,200 @@
+from pathlib import Path
+from typing import Tuple
+import json
+import os
+import struct
+import numpy as np
+from services.mesh import MeshError, load_mesh
+from services.quoting import UNIT_MM
+from services.storage import local_path
+
+# The 3D preview is a reduced copy of the uploaded mesh, made once per file
+# content and stored as previews/ab/<sha256>.glb. Corners are welded into indexed
+# vertices, then clustered on a grid until the mesh fits PREVIEW_MAX_TRIANGLES,
+# and positions are stored as 16-bit integers (KHR_mesh_quantization) that the
+# node transform maps back to metres. Normals are left out: glTF viewers
+# compute flat ones, which suit machined parts anyway. Blocking and CPU bound;
+# the upload job runs it in its process pool.
+PREVIEW_MEDIA_TYPE = "model/gltf-binary"
+
+PREVIEW_MAX_TRIANGLES = int(os.environ.get("PREVIEW_MAX_TRIANGLES", "100000"))
+# Grid steps per axis for stored positions; the largest uint16 value
+QUANTIZE_STEPS = 65535
+# Coarser grids tried before settling for the last result
+MAX_CLUSTER_PASSES = 8
+# Cells across the longest side, at the least, on the first pass
+MIN_CLUSTER_CELLS = 16
+PREVIEW_COLOR = [0.024, 0.714, 0.831, 1.0]  # the site's cyan, linear RGBA
+
+GLB_MAGIC = b"glTF"
+GLB_JSON_CHUNK = b"JSON"
+GLB_BIN_CHUNK = b"BIN\x00"
+GL_UNSIGNED_SHORT = 5123
+GL_UNSIGNED_INT = 5125
+GL_ARRAY_BUFFER = 34962
+GL_ELEMENT_ARRAY_BUFFER = 34963
+GL_TRIANGLES = 4
+# Models are Z-up, glTF is Y-up
+Z_UP_TO_Y_UP = np.array([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, -1.0, 0.0]])
+
+
+def preview_key(sha256: str) -> str:
+    return f"previews/{sha256[:2]}/{sha256}.glb"
+
+
+def _drop_degenerate(faces: np.ndarray) -> np.ndarray:
+    a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+    return faces[(a != b) & (b != c) & (a != c)]
+
+
+def _drop_duplicates(faces: np.ndarray, vertex_count: int) -> np.ndarray:
+    """Remove repeated triangles; the same vertices in the same winding order
+    count as the same triangle whichever corner they start from"""
+    shift = faces.argmin(axis=1)[:, None]
+    canonical = np.take_along_axis(faces, (shift + np.arange(3)) % 3, axis=1).astype(np.int64)
+    if vertex_count < 2 ** 21:
+        keys = (canonical[:, 0] * vertex_count + canonical[:, 1]) * vertex_count + canonical[:, 2]
+        _, first = np.unique(keys, return_index=True)
+    else:
+        _, first = np.unique(canonical, axis=0, return_index=True)
+    return faces[np.sort(first)]
+
+
+def weld(triangles: np.ndarray, lower: np.ndarray, extent: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Index a triangle soup, merging corners that quantize to the same grid
+    point. Returns (positions relative to ``lower`` (v, 3), faces (f, 3))."""
+    step = QUANTIZE_STEPS + 1
+    keys = None
+    for axis in range(3):
+        column = np.asarray(triangles[:, :, axis], dtype=np.float64).ravel()
+        q = np.rint((column - lower[axis]) / extent[axis] * QUANTIZE_STEPS).astype(np.int64)
+        np.clip(q, 0, QUANTIZE_STEPS, out=q)
+        keys = q if keys is None else keys * step + q
+    unique, faces = np.unique(keys, return_inverse=True)
+    grid = np.stack([unique // step ** 2, unique // step % step, unique % step], axis=1)
+    return grid * (extent / QUANTIZE_STEPS), _drop_degenerate(faces.reshape(-1, 3))
+
+
+def cluster(positions: np.ndarray, faces: np.ndarray, cell: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge the vertices in each cube of side ``cell`` into their mean,
+    dropping the triangles that collapse or coincide, and unused vertices"""
+    cells = (positions // cell).astype(np.int64)
+    span = int(cells.max()) + 1
+    _, vertex_cluster = np.unique((cells[:, 0] * span + cells[:, 1]) * span + cells[:, 2], return_inverse=True)
+    counts = np.bincount(vertex_cluster)
+    merged = np.stack([
+        np.bincount(vertex_cluster, weights=positions[:, axis]) / counts for axis in range(3)
+    ], axis=1)
+
+    clustered = _drop_degenerate(vertex_cluster[faces])
+    clustered = _drop_duplicates(clustered, len(merged))
+    used, faces = np.unique(clustered, return_inverse=True)
+    return merged[used], faces.reshape(-1, 3)
+
+
+def _surface_area(positions: np.ndarray, faces: np.ndarray) -> float:
+    a, b, c = (positions[faces[:, corner]] for corner in range(3))
+    return float(np.linalg.norm(np.cross(b - a, c - a), axis=1).sum() / 2)
+
+
+def decimate(triangles: np.ndarray, max_triangles: int = PREVIEW_MAX_TRIANGLES) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Reduce a triangle soup to at most ``max_triangles`` indexed triangles.
+
+    The first grid cell is sized so that a surface of this area, covered by
+    one vertex per cell and two triangles per vertex, just fits (capped for
+    soups whose area says little about their shape); each pass that still
+    has too many triangles grows the cell by the excess.
+    Returns (origin, positions relative to it, faces).
+    """
+    corners = triangles.reshape(-1, 3)
+    lower = np.array([corners[:, axis].min() for axis in range(3)], dtype=np.float64)
+    upper = np.array([corners[:, axis].max() for axis in range(3)], dtype=np.float64)
+    extent = np.maximum(upper - lower, 1e-9)
+    positions, faces = weld(triangles, lower, extent)
+
+    if len(faces) > max_triangles:
+        cell = min(np.sqrt(2 * _surface_area(positions, faces) / max_triangles), extent.max() / MIN_CLUSTER_CELLS)
+        for _ in range(MAX_CLUSTER_PASSES):
+            reduced_positions, reduced_faces = cluster(positions, faces, cell)
+            if len(reduced_faces) <= max_triangles:
+                break
+            cell *= np.sqrt(len(reduced_faces) / max_triangles) * 1.05
+        positions, faces = reduced_positions, reduced_faces
+    if not len(faces):
+        raise MeshError("Mesh has no triangles with any area")
+    return lower, positions, faces
+
+
+def _padded(data: bytes, fill: bytes) -> bytes:
+    return data + fill * (-len(data) % 4)
+
+
+def encode_glb(origin: np.ndarray, positions: np.ndarray, faces: np.ndarray, unit: str = "millimeter") -> bytes:
+    """A single-mesh binary glTF with quantized positions and indices"""
+    extent = np.maximum(positions.max(axis=0), 1e-9)
+    quantized = np.zeros((len(positions), 4), dtype="<u2")  # padded to the 4-byte vertex stride
+    quantized[:, :3] = np.clip(np.rint(positions / extent * QUANTIZE_STEPS), 0, QUANTIZE_STEPS)
+    # 65535 is the primitive restart value, so it cannot be a uint16 index
+    index_type = GL_UNSIGNED_SHORT if len(positions) < 65535 else GL_UNSIGNED_INT
+    indices = faces.astype("<u2" if index_type == GL_UNSIGNED_SHORT else "<u4").ravel()
+
+    vertex_bytes = quantized.tobytes()
+    binary = _padded(vertex_bytes + indices.tobytes(), b"\x00")
+
+    metres = UNIT_MM.get(unit, 1.0) / 1000.0
+    matrix = np.eye(4)
+    matrix[:3, :3] = Z_UP_TO_Y_UP @ np.diag(extent / QUANTIZE_STEPS * metres)
+    matrix[:3, 3] = Z_UP_TO_Y_UP @ (origin * metres)
+
+    document = {
+        "asset": {"version": "2.0", "generator": "preview"},
+        "extensionsUsed": ["KHR_mesh_quantization"],
+        "extensionsRequired": ["KHR_mesh_quantization"],
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "matrix": matrix.T.ravel().tolist()}],  # column-major
+        "meshes": [{"primitives": [{
+            "attributes": {"POSITION": 0}, "indices": 1, "material": 0, "mode": GL_TRIANGLES,
+        }]}],
+        "materials": [{
+            "pbrMetallicRoughness": {"baseColorFactor": PREVIEW_COLOR, "metallicFactor": 0.0, "roughnessFactor": 0.7},
+            "doubleSided": True,
+        }],
+        "accessors": [
+            {
+                "bufferView": 0, "componentType": GL_UNSIGNED_SHORT, "count": len(positions), "type": "VEC3",
+                "min": quantized[:, :3].min(axis=0).tolist(), "max": quantized[:, :3].max(axis=0).tolist(),
+            },
+            {"bufferView": 1, "componentType": index_type, "count": len(indices), "type": "SCALAR"},
+        ],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": len(vertex_bytes), "byteStride": 8,
+             "target": GL_ARRAY_BUFFER},
+            {"buffer": 0, "byteOffset": len(vertex_bytes), "byteLength": indices.nbytes,
+             "target": GL_ELEMENT_ARRAY_BUFFER},
+        ],
+        "buffers": [{"byteLength": len(binary)}],
+    }
+    content = _padded(json.dumps(document, separators=(",", ":")).encode(), b" ")
+
+    chunks = (
+        struct.pack("<I", len(content)) + GLB_JSON_CHUNK + content
+        + struct.pack("<I", len(binary)) + GLB_BIN_CHUNK + binary
+    )
+    return GLB_MAGIC + struct.pack("<II", 2, 12 + len(chunks)) + chunks
+
+
+def build_preview(file_path: str, file_name: str, sha256: str) -> dict:
+    """Write the preview to a local file, ready to be stored; returns its
+    storage key, triangle count and size in bytes"""
+    triangles, unit = load_mesh(Path(file_path), file_name)
+    origin, positions, faces = decimate(triangles)
+    content = encode_glb(origin, positions, faces, unit)
+
+    key = preview_key(sha256)
+    path = local_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    temp.write_bytes(content)
+    os.replace(temp, path)
+    return {"key": key, "triangles": len(faces), "bytes": len(content)}
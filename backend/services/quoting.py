@@ -0,0 +1,152 @@
+from pymongo import UpdateOne
+from typing import Dict, List
+from datetime import datetime
+import hashlib
+import json
+import os
+import numpy as np
+from services.uploads import UPLOAD_BLOBS_COLLECTION
+
+# Rate table, one profile per material offered. Override any of it with a
+# JSON object in QUOTE_RATES, e.g. {"materials": {"pla": {"price_per_kg": 30}}}.
+#   density            g/cm³
+#   price_per_kg       material cost
+#   infill             fraction of the interior that is printed
+#   shell_thickness    mm of solid wall under the surface
+#   layer_height       mm
+#   flow_rate          mm³ of material deposited per second
+#   layer_seconds      per-layer overhead (travel, recoating)
+#   hourly_rate        machine time
+DEFAULT_RATES = {
+    "currency": "USD",
+    "setup_fee": 5.0,
+    "minimum_price": 15.0,
+    "materials": {
+        "pla": {
+            "density": 1.24, "price_per_kg": 25.0, "infill": 0.2, "shell_thickness": 1.2,
+            "layer_height": 0.2, "flow_rate": 8.0, "layer_seconds": 4.0, "hourly_rate": 3.0,
+        },
+        "petg": {
+            "density": 1.27, "price_per_kg": 30.0, "infill": 0.2, "shell_thickness": 1.2,
+            "layer_height": 0.2, "flow_rate": 6.0, "layer_seconds": 4.0, "hourly_rate": 3.5,
+        },
+        "abs": {
+            "density": 1.04, "price_per_kg": 28.0, "infill": 0.25, "shell_thickness": 1.6,
+            "layer_height": 0.2, "flow_rate": 7.0, "layer_seconds": 4.0, "hourly_rate": 4.0,
+        },
+        "resin": {
+            "density": 1.12, "price_per_kg": 70.0, "infill": 1.0, "shell_thickness": 0.0,
+            "layer_height": 0.05, "flow_rate": 40.0, "layer_seconds": 8.0, "hourly_rate": 5.0,
+        },
+    },
+}
+
+# Millimetres per model unit (3MF files declare theirs; STL/OBJ are mm)
+UNIT_MM = {"micron": 0.001, "millimeter": 1.0, "centimeter": 10.0, "meter": 1000.0, "inch": 25.4, "foot": 304.8}
+
+PROFILE_FIELDS = (
+    "density", "price_per_kg", "infill", "shell_thickness", "layer_height", "flow_rate", "layer_seconds", "hourly_rate"
+)
+
+
+def load_rates() -> dict:
+    rates = json.loads(json.dumps(DEFAULT_RATES))
+    overrides = json.loads(os.environ.get("QUOTE_RATES") or "{}")
+    for material, profile in overrides.pop("materials", {}).items():
+        rates["materials"][material] = {**rates["materials"].get(material, {}), **profile}
+    rates.update(overrides)
+    return rates
+
+
+RATES = load_rates()
+
+
+def rates_fingerprint(rates: dict) -> str:
+    """Identifies a rate table; cached quotes made with other rates are stale"""
+    return hashlib.sha1(json.dumps(rates, sort_keys=True).encode()).hexdigest()[:16]
+
+
+RATES_FINGERPRINT = rates_fingerprint(RATES)
+
+
+def quote_meshes(meshes: List[dict], rates: dict = RATES) -> List[dict]:
+    """Quote every material in ``rates`` for each mesh analysis at once.
+
+    Geometry becomes (n, 1) columns and the material profiles (1, m) rows,
+    so one broadcast computes the whole n x m table of estimates. Printed
+    material is a solid shell under the surface plus the infill fraction
+    of what remains inside; time is extrusion at the profile's flow rate
+    plus a fixed overhead per layer.
+    """
+    materials = list(rates["materials"])
+    profiles = {
+        field: np.array([[rates["materials"][name][field] for name in materials]], dtype=np.float64)
+        for field in PROFILE_FIELDS
+    }
+    scale = np.array([UNIT_MM.get(mesh.get("unit", "millimeter"), 1.0) for mesh in meshes])
+    volume = (np.abs([mesh["volume"] for mesh in meshes]) * scale ** 3)[:, None]  # mm³
+    area = (np.array([mesh["surface_area"] for mesh in meshes]) * scale ** 2)[:, None]  # mm²
+    height = (np.array([mesh["dimensions"][2] for mesh in meshes]) * scale)[:, None]  # mm
+
+    shell = np.minimum(area * profiles["shell_thickness"], volume)
+    printed = shell + (volume - shell) * profiles["infill"]  # mm³
+    weight = printed / 1000.0 * profiles["density"]  # g
+    layers = np.ceil(height / profiles["layer_height"])
+    seconds = printed / profiles["flow_rate"] + layers * profiles["layer_seconds"]
+    hours = seconds / 3600.0
+    price = rates["setup_fee"] + weight / 1000.0 * profiles["price_per_kg"] + hours * profiles["hourly_rate"]
+    price = np.maximum(np.round(price, 2), rates["minimum_price"])
+
+    quoted_at = datetime.utcnow()
+    return [
+        {
+            "currency": rates["currency"],
+            "rates": rates_fingerprint(rates),
+            "quoted_at": quoted_at,
+            "options": [
+                {
+                    "material": material,
+                    "weight_grams": round(float(weight[i, j]), 1),
+                    "print_hours": round(float(hours[i, j]), 2),
+                    "price": float(price[i, j]),
+                }
+                for j, material in enumerate(materials)
+            ],
+        }
+        for i in range(len(meshes))
+    ]
+
+
+async def quotes_by_hash(db, meshes: Dict[str, dict]) -> Dict[str, dict]:
+    """Quotes for the given {sha256: mesh analysis}, reusing the ones cached
+    on each blob under the current rates and storing any new ones"""
+    quotes = {}
+    async for blob in db[UPLOAD_BLOBS_COLLECTION].find(
+        {"_id": {"$in": list(meshes)}, "quote.rates": RATES_FINGERPRINT}, {"quote": 1}
+    ):
+        quotes[blob["_id"]] = blob["quote"]
+
+    stale = [sha for sha in meshes if sha not in quotes]
+    if stale:
+        fresh = quote_meshes([meshes[sha] for sha in stale])
+        quotes.update(zip(stale, fresh))
+        await db[UPLOAD_BLOBS_COLLECTION].bulk_write(
+            [UpdateOne({"_id": sha}, {"$set": {"quote": quote}}) for sha, quote in zip(stale, fresh)],
+            ordered=False,
+        )
+    return quotes
+
+
+
+async def requote_submissions(db, submissions: List[dict]) -> Dict[str, dict]:
+    """Quote analyzed submissions under the current rates and store the
+    results; returns {submission id: quote}"""
+    submissions = [s for s in submissions if s.get("mesh") and s.get("file_sha256")]
+    if not submissions:
+        return {}
+    quotes = await quotes_by_hash(db, {s["file_sha256"]: s["mesh"] for s in submissions})
+    await db.contact_submissions.bulk_write(
+        [UpdateOne({"id": s["id"]}, {"$set": {"quote": quotes[s["file_sha256"]]}}) for s in submissions],
+        ordered=False,
+    )
+    return {s["id"]: quotes[s["file_sha256"]] for s in submissions}
@@ -0,0 +1,77 @@
+from fastapi import Request
+from collections import OrderedDict
+from typing import Hashable
+import ipaddress
+import math
+import os
+import time
+
+# Proxies (addresses or CIDR ranges, comma-separated) whose X-Forwarded-For
+# is believed, e.g. the ingress controller's pod range. Behind a proxy every
+# request otherwise comes from the proxy, so all clients share one per-address
+# limit. Uvicorn only rewrites the peer address for --forwarded-allow-ips
+# (127.0.0.1 by default); either list the ingress there or here, not neither.
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(value.strip(), strict=False)
+    for value in os.environ.get("TRUSTED_PROXIES", "").split(",")
+    if value.strip()
+]
+
+
+class RateLimiter:
+    """Fixed-window counter allowing ``limit`` hits per key every ``window`` seconds.
+
+    Keys are kept in LRU order and capped at ``maxsize`` so a flood of
+    distinct usernames or addresses can't grow memory without bound.
+    """
+
+    def __init__(self, limit: int, window: float, maxsize: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self._windows: "OrderedDict[Hashable, list]" = OrderedDict()
+
+    def hit(self, key: Hashable) -> float:
+        """Count a hit for key. Returns 0 if allowed, otherwise the seconds
+        until the key's window resets."""
+        now = time.monotonic()
+        entry = self._windows.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            entry = [now, 0]
+            self._windows[key] = entry
+        self._windows.move_to_end(key)
+        while len(self._windows) > self.maxsize:
+            self._windows.popitem(last=False)
+
+        if entry[1] >= self.limit:
+            return math.ceil(entry[0] + self.window - now) or 1
+        entry[1] += 1
+        return 0
+
+
+def _is_trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_address(request: Request) -> str:
+    """The address a request came from, looking through trusted proxies.
+
+    X-Forwarded-For is read right to left, since each proxy appends the
+    address it received from; the first hop that is not a trusted proxy is
+    the client. Entries further left are client-supplied and ignored.
+    """
+    address = request.client.host if request.client else "unknown"
+    if not _is_trusted(address):
+        return address
+    hops = [hop.strip() for value in request.headers.getlist("x-forwarded-for") for hop in value.split(",")]
+    for hop in reversed(hops):
+        if not hop:
+            continue
+        address = hop
+        if not _is_trusted(hop):
+            break
+    return address
@@ -0,0 +1,66 @@
+from pymongo import IndexModel, TEXT
+from typing import List, Optional, Tuple
+from services.pagination import apply_after, encode_cursor
+
+# Version 3 text indexes are diacritic-insensitive, so "impresión" and
+# "impresion" match, and the spanish language enables Snowball stemming.
+SEARCH_LANGUAGE = "spanish"
+PRODUCT_TEXT_INDEX = IndexModel(
+    [("name", TEXT), ("description", TEXT)],
+    name="products_text",
+    default_language=SEARCH_LANGUAGE,
+    weights={"name": 10, "description": 1},
+    textIndexVersion=3,
+)
+
+# Staff search leads by what they wrote and who they are
+CONTACT_TEXT_INDEX = IndexModel(
+    [("message", TEXT), ("email", TEXT)],
+    name="contact_submissions_text",
+    default_language=SEARCH_LANGUAGE,
+    weights={"email": 5, "message": 1},
+    textIndexVersion=3,
+)
+
+# Relevance first, then the regular listing order as a unique tie-breaker
+SEARCH_SORT = [("score", -1), ("created_at", 1), ("id", 1)]
+
+
+def search_pipeline(search: str, query: dict, after: Optional[str] = None) -> List[dict]:
+    """Build an aggregation ranking matches by text score.
+
+    The score is materialised as a field so keyset pagination can continue
+    from (score, created_at, id) the same way plain listings do.
+    """
+    match = {"$text": {"$search": search, "$language": SEARCH_LANGUAGE}}
+    match.update(query)
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if after:
+        pipeline.append({"$match": apply_after({}, SEARCH_SORT, after)})
+    pipeline.extend([
+        {"$sort": dict(SEARCH_SORT)},
+        {"$project": {"_id": 0}},
+    ])
+    return pipeline
+
+
+async def fetch_search_page(
+    collection,
+    search: str,
+    query: dict,
+    limit: int,
+    after: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one page of search results and the cursor for the next one"""
+    pipeline = search_pipeline(search, query, after)
+    pipeline.append({"$limit": limit + 1})
+    docs = await collection.aggregate(pipeline).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], SEARCH_SORT)
+    return docs, next_cursor
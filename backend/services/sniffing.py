@@ -0,0 +1,180 @@
+from fastapi import HTTPException
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+import os
+import zipfile
+from services.mesh import STL_HEADER_BYTES, STL_RECORD, is_binary_stl, threemf_model_path
+from services.uploads import MAX_UPLOAD_BYTES
+
+# Cheap checks that an upload's content matches its extension, so a renamed
+# archive or a truncated model is refused before it is stored and analyzed.
+# check_prefix looks only at the first SNIFF_BYTES and runs while the body is
+# still arriving; check_file adds what needs the finished file (its exact
+# size, the ZIP central directory, the last few bytes) without reading it all.
+
+SNIFF_BYTES = 4096
+TAIL_BYTES = 1024
+
+ZIP_LOCAL_HEADER = b"PK\x03\x04"
+STEP_MAGIC = b"ISO-10303-21;"
+STEP_END = b"END-ISO-10303-21;"
+UTF8_BOM = b"\xef\xbb\xbf"
+# Statement keywords of the OBJ format, including free-form geometry
+OBJ_KEYWORDS = {
+    b"v", b"vt", b"vn", b"vp", b"f", b"fo", b"l", b"p", b"g", b"o", b"s", b"mg", b"usemtl", b"mtllib",
+    b"usemap", b"maplib", b"cstype", b"deg", b"bmat", b"step", b"curv", b"curv2", b"surf", b"parm",
+    b"trim", b"hole", b"scrv", b"sp", b"end", b"con", b"call", b"csh", b"shadow_obj", b"trace_obj",
+    b"ctech", b"stech", b"bevel", b"c_interp", b"d_interp", b"lod",
+}
+# Bytes found in text files: printable ASCII, common whitespace and
+# anything above 0x7f (UTF-8 or a legacy code page)
+TEXT_BYTES = bytes({7, 8, 9, 10, 11, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+
+
+class InvalidUpload(HTTPException):
+    """422 for a file whose content is not what its extension says"""
+
+    def __init__(self, filename: str, reason: str):
+        ext = os.path.splitext(filename)[1].lower().lstrip(".").upper()
+        super().__init__(status_code=422, detail=f"Not a valid {ext} file: {reason}")
+
+
+def _is_text(data: bytes) -> bool:
+    return not data.translate(None, TEXT_BYTES)
+
+
+def _complete_lines(prefix: bytes, whole: bool) -> list:
+    """Lines of the prefix, without a last line the prefix may have cut off"""
+    lines = prefix.splitlines()
+    if lines and not whole and not prefix.endswith((b"\n", b"\r")):
+        lines.pop()
+    return lines
+
+
+def _check_stl(prefix: bytes, size: Optional[int], enough: bool) -> Optional[str]:
+    count = int.from_bytes(prefix[80:84], "little") if len(prefix) >= STL_HEADER_BYTES else None
+    # An exact size match makes it binary even if the header says "solid"
+    if count and size is not None and is_binary_stl(size, prefix):
+        return None
+    if prefix.lstrip().startswith(b"solid") and _is_text(prefix):
+        if enough and b"facet" not in prefix:
+            return "ASCII STL has no facets"
+        return None
+    if count is None:
+        return "too short for a binary STL and not an ASCII one"
+    if count == 0:
+        return "binary STL has no triangles"
+    expected = STL_HEADER_BYTES + count * STL_RECORD.itemsize
+    if size is None:
+        # The total is checked once the whole file is in
+        return None if expected <= MAX_UPLOAD_BYTES else f"binary STL header claims {count} triangles"
+    return f"binary STL header claims {count} triangles ({expected} bytes) but the file is {size} bytes"
+
+
+def _check_obj(prefix: bytes, whole: bool) -> Optional[str]:
+    if not _is_text(prefix):
+        return "contains binary data"
+    continued = False
+    for line in _complete_lines(prefix, whole):
+        statement = line.strip()
+        # A trailing backslash joins the next line to this statement
+        if continued or not statement or statement.startswith(b"#"):
+            continued = statement.endswith(b"\\")
+            continue
+        continued = statement.endswith(b"\\")
+        if statement.split()[0] not in OBJ_KEYWORDS:
+            return f"unknown statement {statement.split()[0][:32].decode('latin-1')!r}"
+    return None
+
+
+def _check_step(prefix: bytes, enough: bool) -> Optional[str]:
+    text = prefix.removeprefix(UTF8_BOM).lstrip()
+    if not text.startswith(STEP_MAGIC):
+        return "missing the ISO-10303-21 header"
+    if not _is_text(prefix):
+        return "contains binary data"
+    if enough and b"HEADER;" not in text:
+        return "missing the HEADER section"
+    return None
+
+
+def check_prefix(filename: str, prefix: bytes, size: Optional[int] = None):
+    """Check the first bytes of an upload (``SNIFF_BYTES`` of them, or the
+    whole file if it is shorter). ``size`` is the file's total size when
+    known. Raises InvalidUpload; extensions without a check pass."""
+    ext = os.path.splitext(filename)[1].lower()
+    whole = size is not None and len(prefix) >= size
+    enough = whole or len(prefix) >= SNIFF_BYTES
+    if ext == ".stl":
+        reason = _check_stl(prefix, size, enough)
+    elif ext == ".obj":
+        reason = _check_obj(prefix, whole)
+    elif ext == ".3mf":
+        reason = None if prefix.startswith(ZIP_LOCAL_HEADER) else "not a ZIP package"
+    elif ext in (".step", ".stp"):
+        reason = _check_step(prefix, enough)
+    else:
+        reason = None
+    if reason:
+        raise InvalidUpload(filename, reason)
+
+
+def _check_3mf_package(path: Path) -> Optional[str]:
+    # ZipFile reads only the end record and central directory; of the
+    # entries themselves just the small _rels/.rels part is inflated
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = set(archive.namelist())
+            model = threemf_model_path(archive)
+            if model not in names:
+                return f"package has no model part {model}"
+            info = archive.getinfo(model)
+            if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                return "model part uses an unsupported compression method"
+            if info.file_size == 0:
+                return "model part is empty"
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, EOFError, NotImplementedError) as e:
+        return f"damaged ZIP package ({e})"
+    return None
+
+
+def check_file(filename: str, path: Path, size: int):
+    """Check a finished upload: the prefix checks with the exact size, then
+    the 3MF central directory or the end of a text file (truncation).
+    Blocking; run it in a thread. Raises InvalidUpload."""
+    with open(path, "rb") as source:
+        prefix = source.read(SNIFF_BYTES)
+        source.seek(max(size - TAIL_BYTES, 0))
+        tail = source.read()
+    check_prefix(filename, prefix, size)
+
+    ext = os.path.splitext(filename)[1].lower()
+    reason = None
+    if ext == ".3mf":
+        reason = _check_3mf_package(path)
+    elif ext == ".stl" and not is_binary_stl(size, prefix):
+        reason = None if b"endsolid" in tail else "ASCII STL is truncated (no endsolid)"
+    elif ext in (".step", ".stp"):
+        reason = None if STEP_END in tail else "STEP file is truncated (no END-ISO-10303-21)"
+    if reason:
+        raise InvalidUpload(filename, reason)
+
+
+async def sniff_stream(
+    stream: AsyncIterator[bytes], check: Callable[[bytes], None], prefix_bytes: int = SNIFF_BYTES
+) -> AsyncIterator[bytes]:
+    """Pass a request body through, holding it back until its first
+    ``prefix_bytes`` have been given to ``check``"""
+    buffered = bytearray()
+    async for data in stream:
+        if buffered is None:
+            yield data
+            continue
+        buffered += data
+        if len(buffered) >= prefix_bytes:
+            check(bytes(buffered[:prefix_bytes]))
+            yield bytes(buffered)
+            buffered = None
+    if buffered:
+        check(bytes(buffered))
+        yield bytes(buffered)
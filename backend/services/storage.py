@@ -0,0 +1,240 @@
+from fastapi import Request, Response
+from fastapi.responses import RedirectResponse
+from boto3.s3.transfer import TransferConfig
+from botocore.client import Config
+from botocore.exceptions import ClientError
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+import asyncio
+import os
+import shutil
+import uuid
+import boto3
+from services.conditional import IMMUTABLE_CACHE_CONTROL, file_response
+
+# Uploaded files and everything derived from them (thumbnails, previews) are
+# stored under keys such as objects/ab/cd/<sha256>. LocalStorage keeps them
+# under UPLOAD_DIR on this node. S3Storage keeps them in a bucket that every
+# API node shares (AWS, or MinIO and other S3-compatible stores through
+# S3_ENDPOINT_URL) and hands out presigned URLs, so downloads bypass the app.
+# Pick one with STORAGE_BACKEND=local|s3. UPLOAD_DIR is also where uploads
+# are assembled and where jobs write their output before storing it.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR", "/app/backend/uploads"))
+# Local copies of stored files fetched for processing
+SCRATCH_DIR = UPLOAD_DIR / "scratch"
+
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+S3_PREFIX = os.environ.get("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+S3_REGION = os.environ.get("S3_REGION") or None
+S3_URL_SECONDS = int(os.environ.get("S3_URL_SECONDS", "3600"))
+# Files over the threshold go up and down as parallel ranged parts
+S3_MULTIPART_THRESHOLD = int(os.environ.get("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNK = int(os.environ.get("S3_MULTIPART_CHUNK", str(8 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.environ.get("S3_MAX_CONCURRENCY", "8"))
+
+
+def discard(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def local_path(key: str) -> Path:
+    """Where a key's file is written on this node before it is stored"""
+    return UPLOAD_DIR / key
+
+
+def content_disposition(filename: str) -> str:
+    """An attachment header value that survives non-ASCII file names"""
+    fallback = filename.encode("ascii", "replace").decode().replace('"', "'").replace("?", "_")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def _move_into_place(source: Path, destination: Path):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(source, destination)
+
+
+class LocalStorage:
+    """Files on this node's disk; ``root`` should be the same filesystem as
+    UPLOAD_DIR so storing a file is an atomic rename"""
+
+    def __init__(self, root: Path = UPLOAD_DIR):
+        self.root = root
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.root / key
+
+    def locator(self, key: str) -> str:
+        return str(self.root / key)
+
+    def url(self, key: str, filename: Optional[str] = None, content_type: Optional[str] = None) -> Optional[str]:
+        # Served by the app itself
+        return None
+
+    async def put(self, key: str, source: Path, content_type: Optional[str] = None):
+        """Store ``source`` (consumed) under ``key``, replacing any file there"""
+        destination = self.root / key
+        if source != destination:
+            await asyncio.to_thread(_move_into_place, source, destination)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread((self.root / key).exists)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(discard, self.root / key)
+
+    async def fetch(self, key: str, destination: Path):
+        """Copy the file under ``key`` to ``destination`` (LocalCopy reads
+        local files in place, so this is only for callers that need a copy)"""
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(shutil.copyfile, self.root / key, destination)
+
+
+class S3Storage:
+    """Files in an S3 bucket. boto3 blocks, so every call runs in a thread;
+    transfers above S3_MULTIPART_THRESHOLD are split into parts moved by
+    S3_MAX_CONCURRENCY threads at once."""
+
+    def __init__(
+        self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL, region: Optional[str] = S3_REGION
+    ):
+        if not bucket:
+            raise ValueError("S3_BUCKET must be set to use S3 storage")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(
+                signature_version="s3v4",
+                # MinIO and most other S3-compatible stores want path-style URLs
+                s3={"addressing_style": "path" if endpoint_url else "auto"},
+                max_pool_connections=S3_MAX_CONCURRENCY * 2,
+            ),
+        )
+        self.transfer = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNK,
+            max_concurrency=S3_MAX_CONCURRENCY,
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    def locator(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self._key(key)}"
+
+    def url(self, key: str, filename: Optional[str] = None, content_type: Optional[str] = None) -> Optional[str]:
+        """Presigned GET URL, valid for S3_URL_SECONDS (signed locally, no request)"""
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if filename:
+            params["ResponseContentDisposition"] = content_disposition(filename)
+        if content_type:
+            params["ResponseContentType"] = content_type
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=S3_URL_SECONDS)
+
+    async def put(self, key: str, source: Path, content_type: Optional[str] = None):
+        """Upload ``source`` under ``key`` and delete the local file"""
+        extra = {"ContentType": content_type} if content_type else None
+        await asyncio.to_thread(
+            self.client.upload_file, str(source), self.bucket, self._key(key), ExtraArgs=extra, Config=self.transfer
+        )
+        await asyncio.to_thread(discard, source)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self._key(key))
+
+    async def fetch(self, key: str, destination: Path):
+        """Download into ``destination``, which appears only once complete"""
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        temp = destination.with_name(f"{destination.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            await asyncio.to_thread(
+                self.client.download_file, self.bucket, self._key(key), str(temp), Config=self.transfer
+            )
+            os.replace(temp, destination)
+        except BaseException:
+            discard(temp)
+            raise
+
+
+class LocalCopy:
+    """A stored file as a local path for code that needs one (mesh loaders).
+
+    Fetched on the first ``await copy.path()`` only, so work that turns out
+    to be cached costs no download; a fetched copy is deleted on exit.
+    """
+
+    def __init__(self, backend, key: str):
+        self.backend = backend
+        self.key = key
+        self._path: Optional[Path] = None
+        self._fetched = False
+
+    async def path(self) -> Path:
+        if self._path is None:
+            in_place = self.backend.local_path(self.key)
+            if in_place is not None:
+                self._path = in_place
+            else:
+                destination = SCRATCH_DIR / uuid.uuid4().hex
+                await self.backend.fetch(self.key, destination)
+                self._path, self._fetched = destination, True
+        return self._path
+
+    async def __aenter__(self) -> "LocalCopy":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._fetched:
+            await asyncio.to_thread(discard, self._path)
+
+
+def create_storage():
+    if STORAGE_BACKEND == "local":
+        return LocalStorage()
+    if STORAGE_BACKEND == "s3":
+        return S3Storage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; use local or s3")
+
+
+storage = create_storage()
+
+
+async def storage_response(
+    request: Request, key: str, media_type: str, etag: str, cache_control: str = IMMUTABLE_CACHE_CONTROL,
+    headers: Optional[dict] = None, filename: Optional[str] = None
+) -> Optional[Response]:
+    """Serve a stored file: a redirect to a presigned URL if the backend has
+    them, else the file itself. None if a local file is missing."""
+    url = storage.url(key, filename, media_type)
+    if url:
+        # The URL expires, so the redirect may only be reused for a while
+        return RedirectResponse(
+            url, status_code=307, headers={"Cache-Control": f"private, max-age={S3_URL_SECONDS // 2}"}
+        )
+    path = storage.local_path(key)
+    if not await asyncio.to_thread(path.is_file):
+        return None
+    if filename:
+        headers = {**(headers or {}), "Content-Disposition": content_disposition(filename)}
+    return file_response(request, path, media_type, etag, cache_control, headers)
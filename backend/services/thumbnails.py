@@ -0,0 +1,155 @@
+from PIL import Image
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import io
+import os
+import numpy as np
+from services.mesh import load_mesh
+from services.storage import local_path
+
+# Thumbnails are rendered once per file content and stored under
+# thumbnails/ab/<sha256>-<view>-<size>.<format>. They are drawn by a small
+# CPU rasterizer: each triangle is covered with a lattice of points finer
+# than a pixel, and a z-buffer keeps the nearest point per pixel. Blocking
+# and CPU bound; the upload job runs it in its process pool.
+# Rendered at the largest size, then downscaled for the others
+THUMBNAIL_SIZES = (128, 256, 512)
+DEFAULT_THUMBNAIL_SIZE = 256
+THUMBNAIL_FORMATS = {"png": "image/png", "webp": "image/webp"}
+# Camera azimuth and elevation in degrees; models are Z-up
+THUMBNAIL_VIEWS = {"iso": (45.0, 30.0), "front": (0.0, 0.0), "side": (90.0, 0.0), "top": (0.0, 90.0)}
+DEFAULT_THUMBNAIL_VIEW = "iso"
+
+# Triangles projected per step, and points per step before triangles are
+# sampled more coarsely
+RENDER_CHUNK = 1_000_000
+MAX_POINTS = 8_000_000
+# Lattice spacing in pixels; below 1 so neighbouring points leave no gaps
+POINT_SPACING = 0.7
+MARGIN = 0.06
+BASE_COLOR = np.array([6, 182, 212], dtype=np.float32)  # the site's cyan
+AMBIENT = 0.35
+
+
+def thumbnail_key(sha256: str, view: str, size: int, fmt: str) -> str:
+    return f"thumbnails/{sha256[:2]}/{sha256}-{view}-{size}.{fmt}"
+
+
+def camera_basis(azimuth: float, elevation: float) -> np.ndarray:
+    """Rows: screen right, screen up, towards the camera"""
+    az, el = np.radians(azimuth), np.radians(elevation)
+    towards = np.array([np.cos(el) * np.sin(az), -np.cos(el) * np.cos(az), np.sin(el)])
+    up = np.array([0.0, 0.0, 1.0]) if abs(np.sin(el)) < 0.999 else np.array([-np.sin(az), np.cos(az), 0.0])
+    right = np.cross(up, towards)
+    right /= np.linalg.norm(right)
+    return np.stack([right, np.cross(towards, right), towards])
+
+
+def _lattice(m: int) -> np.ndarray:
+    """Barycentric weights of an m-subdivided triangle, (points, 3)"""
+    i, j = np.triu_indices(m + 1)
+    u, v = (j - i) / m, i / m
+    return np.stack([1 - u - v, u, v], axis=1)
+
+
+def _sample(screen: np.ndarray, shade: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Cover projected triangles (n, 3, 3: x, y, depth) with points; returns
+    (points (k, 3), shade per point)"""
+    x, y = screen[..., 0], screen[..., 1]
+    longest = np.sqrt(np.maximum.reduce([
+        (x[:, i] - x[:, i - 1]) ** 2 + (y[:, i] - y[:, i - 1]) ** 2 for i in range(3)
+    ]))
+    subdivisions = np.ceil(longest / POINT_SPACING).astype(np.int64)
+
+    # Triangles smaller than a pixel get one point at their centroid
+    counts = np.where(subdivisions <= 1, 1, (subdivisions + 1) * (subdivisions + 2) // 2)
+    if counts.sum() > MAX_POINTS:
+        coarsen = np.sqrt(counts.sum() / MAX_POINTS)
+        subdivisions = np.ceil(subdivisions / coarsen).astype(np.int64)
+
+    small = screen[subdivisions <= 1]
+    points = [(small[:, 0] + small[:, 1] + small[:, 2]) / 3]
+    shades = [shade[subdivisions <= 1]]
+    for m in np.unique(subdivisions[subdivisions > 1]):
+        selected = subdivisions == m
+        weights = _lattice(int(m))
+        points.append(np.einsum("pk,nkc->npc", weights, screen[selected]).reshape(-1, 3))
+        shades.append(np.repeat(shade[selected], len(weights)))
+    return np.concatenate(points), np.concatenate(shades)
+
+
+def rasterize(triangles: np.ndarray, azimuth: float, elevation: float, size: int) -> np.ndarray:
+    """Render triangles from one direction as an RGBA (size, size, 4) image
+    with a transparent background, flat shaded with two-sided lighting"""
+    basis = camera_basis(azimuth, elevation)
+    light = basis.T @ np.array([-0.35, 0.45, 0.82])  # from the upper left, in world space
+    light /= np.linalg.norm(light)
+
+    # Per-axis reductions over strided columns; much faster than axis=0
+    corners = triangles.reshape(-1, 3)
+    lower = np.array([corners[:, axis].min() for axis in range(3)], dtype=np.float64)
+    upper = np.array([corners[:, axis].max() for axis in range(3)], dtype=np.float64)
+    center = (lower + upper) / 2
+    radius = max(np.linalg.norm(upper - lower) / 2, 1e-9)
+    scale = size * (1 - 2 * MARGIN) / (2 * radius)
+
+    depth = np.full(size * size, -np.inf)
+    color = np.zeros(size * size, dtype=np.float32)
+    for start in range(0, len(triangles), RENDER_CHUNK):
+        chunk = np.asarray(triangles[start:start + RENDER_CHUNK], dtype=np.float64) - center
+        normals = np.cross(chunk[:, 1] - chunk[:, 0], chunk[:, 2] - chunk[:, 0])
+        lengths = np.sqrt(np.einsum("ij,ij->i", normals, normals))
+        shade = AMBIENT + (1 - AMBIENT) * np.abs(normals @ light) / np.where(lengths > 0, lengths, 1)
+
+        view = chunk @ basis.T
+        screen = np.empty_like(view)
+        screen[..., 0] = view[..., 0] * scale + size / 2
+        screen[..., 1] = size / 2 - view[..., 1] * scale
+        screen[..., 2] = view[..., 2]
+        points, point_shade = _sample(screen, shade)
+
+        x = np.floor(points[:, 0]).astype(np.int64)
+        y = np.floor(points[:, 1]).astype(np.int64)
+        inside = (x >= 0) & (x < size) & (y >= 0) & (y < size)
+        pixel = (y * size + x)[inside]
+        z = points[inside, 2]
+        point_shade = point_shade[inside]
+
+        # Z-buffer: keep the greatest depth (nearest the camera) per pixel,
+        # then colour each pixel from a point at that depth
+        np.maximum.at(depth, pixel, z)
+        front = z >= depth[pixel]
+        color[pixel[front]] = point_shade[front]
+
+    covered = np.isfinite(depth)
+    image = np.zeros((size * size, 4), dtype=np.uint8)
+    image[covered, :3] = np.clip(BASE_COLOR * color[covered, None], 0, 255).astype(np.uint8)
+    image[covered, 3] = 255
+    return image.reshape(size, size, 4)
+
+
+def _save_atomic(image: Image.Image, path: Path, fmt: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **({"quality": 85, "method": 4} if fmt == "webp" else {"optimize": True}))
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    temp.write_bytes(buffer.getvalue())
+    os.replace(temp, path)
+
+
+def render_thumbnails(file_path: str, file_name: str, sha256: str, views: Optional[Dict[str, tuple]] = None) -> List[str]:
+    """Render every view at every size and format into local files, ready
+    to be stored. Returns their storage keys."""
+    views = views or THUMBNAIL_VIEWS
+    largest = max(THUMBNAIL_SIZES)
+    triangles, _ = load_mesh(Path(file_path), file_name)
+    written = []
+    for view, (azimuth, elevation) in views.items():
+        image = Image.fromarray(rasterize(triangles, azimuth, elevation, largest))
+        for size in THUMBNAIL_SIZES:
+            resized = image if size == largest else image.resize((size, size), Image.LANCZOS)
+            for fmt in THUMBNAIL_FORMATS:
+                key = thumbnail_key(sha256, view, size, fmt)
+                _save_atomic(resized, local_path(key), fmt)
+                written.append(key)
+    return written
@@ -0,0 +1,394 @@
+from fastapi import HTTPException, UploadFile
+from pymongo.errors import DuplicateKeyError
+from pathlib import Path
+from typing import AsyncIterator, Callable, List, NamedTuple, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+from services.storage import UPLOAD_DIR, discard, storage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_SESSIONS_COLLECTION = "upload_sessions"
+UPLOAD_BLOBS_COLLECTION = "upload_blobs"
+
+# Uploads are written here first, then stored under their hash once it is
+# known. With local storage both live under UPLOAD_DIR, so that is a rename.
+# Partial files are local to the node receiving the upload, which sessions
+# record as UPLOAD_NODE; set it to something stable if hostnames are not.
+PARTIAL_DIR = UPLOAD_DIR / "partial"
+PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_NODE = os.environ.get("UPLOAD_NODE") or socket.gethostname()
+
+ALLOWED_EXTENSIONS = ['.stl', '.obj', '.3mf', '.step', '.stp']
+
+# Largest accepted file; checked while the bytes arrive, never after
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+# Bytes read, hashed and written per step. Memory per upload stays at
+# about one chunk regardless of the file size.
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Room for the other multipart form fields on top of the file itself
+FORM_OVERHEAD_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(HTTPException):
+    """413 raised as soon as an upload goes past its limit.
+
+    An HTTPException so it keeps its status when raised from inside
+    FastAPI's body parsing, which turns other errors into a 400.
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"File too large. Maximum size is {limit} bytes")
+
+
+class StoredUpload(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+
+
+def _write_chunk(buffer, digest, chunk: bytes):
+    # hashlib releases the GIL for large buffers, so both steps run off the loop
+    digest.update(chunk)
+    buffer.write(chunk)
+
+
+async def save_upload(
+    file: UploadFile, destination: Path, max_bytes: int = MAX_UPLOAD_BYTES,
+    validate: Optional[Callable[[Path, int], None]] = None
+) -> StoredUpload:
+    """Stream an upload to ``destination`` one chunk at a time, counting
+    and hashing as it goes. ``validate(path, size)`` then checks the written
+    file in a thread. The partial file is removed if the upload is too
+    large or invalid, the client goes away or anything else fails."""
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    digest = hashlib.sha256()
+    size = 0
+    buffer = await asyncio.to_thread(open, destination, "xb")
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            await asyncio.to_thread(_write_chunk, buffer, digest, chunk)
+        await asyncio.to_thread(buffer.close)
+        if validate:
+            await asyncio.to_thread(validate, destination, size)
+    except BaseException:
+        # Also covers cancellation when the client disconnects
+        buffer.close()
+        discard(destination)
+        raise
+    return StoredUpload(destination, size, digest.hexdigest())
+
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized request bodies on upload routes while they stream in.
+
+    Starlette spools multipart files to temporary files before the route
+    runs, so without this a huge upload would be read (and written to disk)
+    in full before ``save_upload`` could refuse it. A declared
+    Content-Length over the limit is refused before reading anything.
+    """
+
+    def __init__(self, app, path_prefixes: Tuple[str, ...], max_body_bytes: Optional[int] = None):
+        self.app = app
+        self.path_prefixes = path_prefixes
+        self.max_body_bytes = max_body_bytes or MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PUT", "PATCH")
+            or not scope["path"].startswith(self.path_prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        declared = headers.get(b"content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_body_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise UploadTooLarge(self.max_body_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": UploadTooLarge(self.max_body_bytes).detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# ---- Resumable uploads ----
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+UPLOAD_PURGE_SECONDS = float(os.environ.get("UPLOAD_PURGE_SECONDS", "3600"))
+# A session still "assembling" after this long belongs to a request that
+# died; completing it again (or the purge, once expired) takes it over
+UPLOAD_ASSEMBLE_STALE_SECONDS = float(os.environ.get("UPLOAD_ASSEMBLE_STALE_SECONDS", "600"))
+# Inline uploads are written to *.tmp files that only outlive their request
+# if the process dies mid-upload; the purge removes any older than this
+UPLOAD_TEMP_STALE_SECONDS = float(os.environ.get("UPLOAD_TEMP_STALE_SECONDS", str(24 * 3600)))
+
+
+def parse_content_range(value: Optional[str], size: int) -> Tuple[int, int]:
+    """Parse ``bytes start-end/total`` into a [start, end) range of a file
+    of ``size`` bytes. Raises ValueError if it is malformed or out of bounds."""
+    match = CONTENT_RANGE_RE.match(value or "")
+    if not match:
+        raise ValueError("Content-Range must look like 'bytes start-end/total'")
+    start, last, total = (int(group) for group in match.groups())
+    if total != size or start > last or last >= size:
+        raise ValueError(f"Content-Range {value} does not fit a file of {size} bytes")
+    return start, last + 1
+
+
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """Sort and coalesce overlapping or adjacent [start, end) ranges"""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def received_offset(ranges: List[List[int]]) -> int:
+    """Bytes received contiguously from the start of the file"""
+    merged = merge_ranges(ranges)
+    return merged[0][1] if merged and merged[0][0] == 0 else 0
+
+
+def unfinished_filter(now: datetime) -> dict:
+    """Sessions nobody is assembling: open ones and abandoned assemblies"""
+    return {"$or": [
+        {"status": "open"},
+        {
+            "status": "assembling",
+            "assembling_at": {"$lte": now - timedelta(seconds=UPLOAD_ASSEMBLE_STALE_SECONDS)},
+        },
+    ]}
+
+
+def partial_path(session_id: str) -> Path:
+    return PARTIAL_DIR / f"{session_id}.part"
+
+
+def create_partial(path: Path, size: int):
+    """Preallocate a (sparse) file so ranges can be written in any order"""
+    with open(path, "wb") as buffer:
+        buffer.truncate(size)
+
+
+async def write_range(stream: AsyncIterator[bytes], path: Path, start: int, end: int) -> int:
+    """Write a request body into ``path`` at ``start`` with pwrite, coalescing
+    the stream into chunk-sized writes made off the loop. Exactly
+    ``end - start`` bytes must arrive; returns the count written."""
+    fd = await asyncio.to_thread(os.open, path, os.O_WRONLY)
+    try:
+        offset = start
+        pending = bytearray()
+        async for data in stream:
+            if offset + len(pending) + len(data) > end:
+                raise ValueError("Request body is longer than its Content-Range")
+            pending += data
+            if len(pending) >= UPLOAD_CHUNK_SIZE:
+                offset += await asyncio.to_thread(os.pwrite, fd, bytes(pending), offset)
+                pending.clear()
+        if pending:
+            offset += await asyncio.to_thread(os.pwrite, fd, bytes(pending), offset)
+        if offset != end:
+            raise ValueError("Request body is shorter than its Content-Range")
+        return offset - start
+    finally:
+        os.close(fd)
+
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of a file, read in chunks (blocking; run it in a thread)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as buffer:
+        while chunk := buffer.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---- Content-addressed storage ----
+
+# Unreferenced blobs are kept this long before being deleted, so content
+# that is uploaded again soon after is not stored twice
+BLOB_GRACE_SECONDS = float(os.environ.get("BLOB_GRACE_SECONDS", "3600"))
+# A blob being deleted keeps its row, marked with deleting_at, until its
+# objects are gone; storing the same content waits for that. A mark older
+# than this belongs to a purge that died, and whoever finds it finishes it.
+BLOB_DELETE_STALE_SECONDS = float(os.environ.get("BLOB_DELETE_STALE_SECONDS", "60"))
+BLOB_DELETE_POLL_SECONDS = 0.5
+
+
+def temp_upload_path() -> Path:
+    return PARTIAL_DIR / f"{uuid.uuid4().hex}.tmp"
+
+
+def blob_key(sha256: str) -> str:
+    """Storage key of a blob, sharded two levels deep (objects/ab/cd/abcd...)
+    so no directory holds more than a few hundred entries per level"""
+    return f"objects/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+async def store_blob(db, source: Path, sha256: str, size: int) -> str:
+    """Store a fully written file under its hash and take a reference to it.
+    ``source`` is consumed if this succeeds and left to the caller if it
+    fails. Returns the blob's storage locator."""
+    key = blob_key(sha256)
+    blobs = db[UPLOAD_BLOBS_COLLECTION]
+    while True:
+        now = datetime.utcnow()
+        try:
+            # Count the reference before the file appears. A row being
+            # deleted doesn't match, so its upsert collides instead.
+            result = await blobs.update_one(
+                {"_id": sha256, "deleting_at": None},
+                {
+                    "$inc": {"refcount": 1},
+                    "$set": {"last_referenced_at": now},
+                    "$setOnInsert": {"size": size, "key": key, "created_at": now},
+                },
+                upsert=True,
+            )
+            break
+        except DuplicateKeyError:
+            # Store it afresh once the old copy is gone
+            stale = await blobs.find_one_and_update(
+                {"_id": sha256, "deleting_at": {"$lte": now - timedelta(seconds=BLOB_DELETE_STALE_SECONDS)}},
+                {"$set": {"deleting_at": now}},
+            )
+            if stale:
+                await _delete_blob(db, {**stale, "deleting_at": now})
+            else:
+                await asyncio.sleep(BLOB_DELETE_POLL_SECONDS)
+    try:
+        if result.upserted_id is None and await storage.exists(key):
+            # Same content is already stored
+            await asyncio.to_thread(discard, source)
+        else:
+            await storage.put(key, source)
+    except BaseException:
+        await release_blob(db, sha256)
+        raise
+    return storage.locator(key)
+
+
+async def release_blob(db, sha256: str):
+    """Drop one reference; the purge deletes blobs nobody references"""
+    await db[UPLOAD_BLOBS_COLLECTION].update_one({"_id": sha256}, {"$inc": {"refcount": -1}})
+
+
+def stored_keys(blob: dict) -> List[str]:
+    """Every storage key a blob document owns: the file and its rendered outputs"""
+    # Rows written before storage keys existed only have the local path,
+    # which is the same layout
+    keys = [blob.get("key") or blob_key(blob["_id"]), *blob.get("thumbnails", [])]
+    preview = blob.get("preview") or {}
+    if preview.get("key"):
+        keys.append(preview["key"])
+    return keys
+
+
+async def _delete_blob(db, blob: dict):
+    """Delete a blob marked with deleting_at: its objects, then its row, so
+    store_blob can't store the content again until the objects are gone"""
+    for key in stored_keys(blob):
+        await storage.delete(key)
+    await db[UPLOAD_BLOBS_COLLECTION].delete_one({"_id": blob["_id"], "deleting_at": blob["deleting_at"]})
+
+
+async def _purge_unreferenced_blobs(db):
+    now = datetime.utcnow()
+    query = {"$or": [
+        {
+            "refcount": {"$lte": 0},
+            "last_referenced_at": {"$lte": now - timedelta(seconds=BLOB_GRACE_SECONDS)},
+            "deleting_at": None,
+        },
+        {"deleting_at": {"$lte": now - timedelta(seconds=BLOB_DELETE_STALE_SECONDS)}},
+    ]}
+    async for blob in db[UPLOAD_BLOBS_COLLECTION].find(query, {"_id": 1}):
+        marked = await db[UPLOAD_BLOBS_COLLECTION].find_one_and_update(
+            {**query, "_id": blob["_id"]}, {"$set": {"deleting_at": now}}
+        )
+        if marked:
+            await _delete_blob(db, {**marked, "deleting_at": now})
+
+
+def _sweep_stale_temp_files():
+    cutoff = time.time() - UPLOAD_TEMP_STALE_SECONDS
+    for path in PARTIAL_DIR.glob("*.tmp"):
+        try:
+            if path.stat().st_mtime <= cutoff:
+                discard(path)
+        except FileNotFoundError:
+            pass
+
+
+async def purge_expired_uploads(db):
+    """Drop abandoned upload sessions, their partial files and blobs no
+    longer referenced by anything. Every node runs this; each one only
+    drops the unfinished sessions whose partial file it holds."""
+    sessions = db[UPLOAD_SESSIONS_COLLECTION]
+    now = datetime.utcnow()
+    # Sessions from before nodes were recorded have none
+    expired = {**unfinished_filter(now), "expires_at": {"$lte": now}, "node": {"$in": [UPLOAD_NODE, None]}}
+    async for session in sessions.find(expired, {"_id": 0, "id": 1}):
+        if await sessions.find_one_and_delete({**expired, "id": session["id"]}):
+            await asyncio.to_thread(discard, partial_path(session["id"]))
+
+    # Completed uploads never attached to a submission
+    async for session in sessions.find(
+        {"status": "complete", "submission_id": None, "expires_at": {"$lte": now}},
+        {"_id": 0, "id": 1, "sha256": 1}
+    ):
+        if await sessions.find_one_and_delete({"id": session["id"], "submission_id": None}):
+            await release_blob(db, session["sha256"])
+
+    await asyncio.to_thread(_sweep_stale_temp_files)
+    await _purge_unreferenced_blobs(db)
+
+
+async def purge_expired_uploads_forever(db):
+    """Background task running purge_expired_uploads every UPLOAD_PURGE_SECONDS"""
+    while True:
+        try:
+            await purge_expired_uploads(db)
+        except Exception as e:
+            logger.error(f"Could not purge expired uploads: {str(e)}")
+        await asyncio.sleep(UPLOAD_PURGE_SECONDS)
@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The backend is run from its own directory and imports its packages
+# (services, models, routes) top level
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Settings read at import time; keep uploads out of the deployed path
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="uploads-"))
+os.environ.setdefault("STORAGE_BACKEND", "local")
+# Admin routes trust the token claims, so tests need no user documents
+os.environ.setdefault("AUTH_MODE", "claims")
+
+import pytest
+from pymongo import ReturnDocument
+
+
+def _find_one_and_update_after(original):
+    """mongomock returns None from find_one_and_update(AFTER) when the update
+    changes a field the filter matched on (e.g. the If-Match version guard);
+    re-read the updated document by _id instead."""
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        if return_document != ReturnDocument.AFTER or upsert:
+            return original(self, filter, update, projection, sort, upsert, return_document, **kwargs)
+        before = original(self, filter, update, {"_id": 1}, sort, upsert, ReturnDocument.BEFORE, **kwargs)
+        return None if before is None else self.find_one({"_id": before["_id"]}, projection)
+
+    return find_one_and_update
+
+
+@pytest.fixture(scope="session")
+def server():
+    """The app on an in-memory database, with its background tasks disabled"""
+    import mongomock.collection
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "test")
+    mongomock.collection.Collection.find_one_and_update = _find_one_and_update_after(
+        mongomock.collection.Collection.find_one_and_update
+    )
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+    # server.py creates ./uploads on import, as when run from the backend
+    cwd = os.getcwd()
+    os.chdir(BACKEND_DIR)
+    try:
+        import server
+    finally:
+        os.chdir(cwd)
+    server.app.router.on_startup.clear()
+    server.app.router.on_shutdown.clear()
+    return server
+
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+    from services.auth import user_cache
+    from services.cache import catalog_cache
+
+    with TestClient(server.app) as test_client:
+        yield test_client
+        for name in test_client.portal.call(server.db.list_collection_names):
+            test_client.portal.call(server.db.drop_collection, name)
+    catalog_cache.clear()
+    user_cache.clear()
+
+
+@pytest.fixture
+def admin_headers():
+    from services.auth import create_access_token
+
+    token = create_access_token({"sub": "admin", "role": "admin", "id": "admin-id"})
+    return {"Authorization": f"Bearer {token}"}
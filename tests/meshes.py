@@ -0,0 +1,83 @@
+"""Small model files for the mesh, sniffing and preview tests"""
+import io
+import struct
+import zipfile
+
+import numpy as np
+
+# Corners of a cube and its faces as outward-wound triangles
+CUBE_CORNERS = np.array([
+    [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+    [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1],
+], dtype=np.float64)
+CUBE_FACES = np.array([
+    [0, 2, 1], [0, 3, 2],  # bottom
+    [4, 5, 6], [4, 6, 7],  # top
+    [0, 1, 5], [0, 5, 4],  # front
+    [2, 3, 7], [2, 7, 6],  # back
+    [1, 2, 6], [1, 6, 5],  # right
+    [3, 0, 4], [3, 4, 7],  # left
+])
+
+
+def cube(side: float = 1.0, offset=(0.0, 0.0, 0.0)) -> np.ndarray:
+    """A closed cube as (12, 3, 3) triangles"""
+    return (CUBE_CORNERS * side + np.asarray(offset))[CUBE_FACES]
+
+
+def binary_stl(triangles: np.ndarray, header: bytes = b"binary") -> bytes:
+    records = b"".join(
+        struct.pack("<12fH", 0, 0, 0, *np.asarray(triangle, dtype=np.float32).ravel(), 0) for triangle in triangles
+    )
+    return header.ljust(80, b" ") + struct.pack("<I", len(triangles)) + records
+
+
+def ascii_stl(triangles: np.ndarray) -> bytes:
+    facets = "".join(
+        "facet normal 0 0 0\n outer loop\n"
+        + "".join(f"  vertex {x} {y} {z}\n" for x, y, z in triangle)
+        + " endloop\nendfacet\n"
+        for triangle in triangles
+    )
+    return f"solid cube\n{facets}endsolid cube\n".encode()
+
+
+def obj(side: float = 1.0) -> bytes:
+    """The cube with quad faces, indexed from the end for the last one"""
+    vertices = "".join(f"v {x * side} {y * side} {z * side}\n" for x, y, z in CUBE_CORNERS)
+    quads = ["1 4 3 2", "5 6 7 8", "1 2 6 5", "3 4 8 7", "2 3 7 6", "-5 -8 -4 -1"]
+    return ("# cube\no cube\n" + vertices + "".join(f"f {quad}\n" for quad in quads)).encode()
+
+
+def threemf(side: float = 1.0, unit: str = "millimeter", transform: str = "1 0 0 0 1 0 0 0 1 0 0 0") -> bytes:
+    core = "http://schemas.microsoft.com/3dmanufacturing/core/2015/02"
+    vertices = "".join(f'<vertex x="{x * side}" y="{y * side}" z="{z * side}"/>' for x, y, z in CUBE_CORNERS)
+    triangles = "".join(f'<triangle v1="{a}" v2="{b}" v3="{c}"/>' for a, b, c in CUBE_FACES)
+    model = (
+        f'<?xml version="1.0" encoding="UTF-8"?><model unit="{unit}" xmlns="{core}">'
+        f'<resources><object id="1" type="model"><mesh><vertices>{vertices}</vertices>'
+        f'<triangles>{triangles}</triangles></mesh></object>'
+        f'<object id="2" type="model"><components><component objectid="1"/></components></object></resources>'
+        f'<build><item objectid="2" transform="{transform}"/></build></model>'
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+        'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/></Relationships>'
+    )
+    return zip_archive({"_rels/.rels": rels, "3D/3dmodel.model": model})
+
+
+def zip_archive(parts: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in parts.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+STEP = (
+    b"ISO-10303-21;\nHEADER;\nFILE_DESCRIPTION(('part'),'2;1');\nENDSEC;\n"
+    b"DATA;\n#1=CARTESIAN_POINT('',(0.,0.,0.));\nENDSEC;\nEND-ISO-10303-21;\n"
+)
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from services.auth import create_refresh_token, decode_token, revoke_token, user_claims
+
+USER = {"id": "u1", "username": "editor", "email": "editor@example.com", "role": "admin", "is_active": True}
+
+
+@pytest.fixture
+def refresh_token(client, server):
+    client.portal.call(server.db.users.insert_one, {**USER, "hashed_password": "unused"})
+    return create_refresh_token(data=user_claims(USER))
+
+
+def test_revoke_token_reports_whether_it_won():
+    db = AsyncMongoMockClient()["test"]
+    claims = decode_token(create_refresh_token(data=user_claims(USER)), token_type="refresh")
+
+    async def run():
+        return await revoke_token(db, claims), await revoke_token(db, claims)
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_refresh_rotates_the_token(client, refresh_token):
+    response = client.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == 200
+    rotated = response.json()["refresh_token"]
+    assert rotated != refresh_token
+
+    assert client.post("/api/auth/refresh", json={"refresh_token": refresh_token}).status_code == 401
+    assert client.post("/api/auth/refresh", json={"refresh_token": rotated}).status_code == 200
+
+
+def test_refresh_token_revoked_on_another_worker_is_rejected(client, server, refresh_token):
+    claims = decode_token(refresh_token, token_type="refresh")
+    # Revoked in the database only, as by a worker this one has not synced with yet
+    client.portal.call(server.db.revoked_tokens.insert_one, {"jti": claims["jti"], "expires_at": None})
+
+    assert client.post("/api/auth/refresh", json={"refresh_token": refresh_token}).status_code == 401
+
+
+def test_logout_revokes_both_tokens(client, refresh_token):
+    access = client.post("/api/auth/refresh", json={"refresh_token": refresh_token}).json()
+    headers = {"Authorization": f"Bearer {access['access_token']}"}
+
+    response = client.post("/api/auth/logout", json={"refresh_token": access["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+    assert client.post("/api/auth/refresh", json={"refresh_token": access["refresh_token"]}).status_code == 401
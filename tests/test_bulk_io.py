@@ -0,0 +1,46 @@
+import io
+
+from models.product import ProductImportRow
+from services.bulk_io import detect_format, iter_models, iter_rows, next_batch
+
+
+def _file(text):
+    return io.BytesIO(text.encode())
+
+
+def test_detect_format():
+    assert detect_format("products.CSV", None) == "csv"
+    assert detect_format("dump.jsonl", None) == "ndjson"
+    assert detect_format(None, "application/x-ndjson") == "ndjson"
+    assert detect_format("products.xlsx", "application/octet-stream") is None
+
+
+def test_csv_rows_drop_empty_cells_and_split_categories():
+    rows = list(iter_rows(_file("\ufeffname,price,category_ids,image_url\nBolt,1.5,a|b,\n"), "csv"))
+    assert rows == [(1, {"name": "Bolt", "price": "1.5", "category_ids": ["a", "b"]}, None)]
+
+
+def test_ndjson_reports_bad_lines_and_keeps_going():
+    rows = list(iter_rows(_file('{"name": "a"}\nnot json\n\n[1]\n{"name": "b"}\n'), "ndjson"))
+    assert [(number, error is None) for number, _, error in rows] == [(1, True), (2, False), (4, False), (5, True)]
+
+
+def test_models_only_mark_columns_present_as_set():
+    text = "id,name,description,price,image_url\np1,Bolt,M3,1.5,/bolt.png\n"
+    [(_, row, error)] = iter_models(_file(text), "csv", ProductImportRow)
+    assert error is None
+    assert row.model_dump(exclude={"id"}, exclude_unset=True).keys() == {"name", "description", "price", "image_url"}
+
+
+def test_models_report_validation_errors():
+    [(number, row, error)] = iter_models(_file('{"name": "Bolt", "price": "cheap"}\n'), "ndjson", ProductImportRow)
+    assert number == 1 and row is None
+    assert "price" in error and "description: Field required" in error
+
+
+def test_next_batch_splits_rows():
+    rows = iter(range(5))
+    assert next_batch(rows, 2) == [0, 1]
+    assert next_batch(rows, 2) == [2, 3]
+    assert next_batch(rows, 2) == [4]
+    assert next_batch(rows, 2) == []
@@ -0,0 +1,87 @@
+import asyncio
+
+from services.cache import MISSING, TTLCache, catalog_cache
+from services.conditional import VERSIONS_COLLECTION, get_versions
+
+PRODUCT = {"name": "Bracket", "description": "PLA bracket", "price": 4.5, "image_url": "/img/bracket.png"}
+
+
+def test_set_skips_values_read_before_an_invalidation():
+    cache = TTLCache()
+    generation = cache.generation
+    cache.invalidate("product:1")
+
+    assert not cache.set(("product", 1), "stale", tags=["product:1"], since=generation)
+    assert cache.get(("product", 1)) is MISSING
+    # Other tags were not written in the meantime
+    assert cache.set(("product", 2), "fresh", tags=["product:2"], since=generation)
+    assert cache.get(("product", 2)) == "fresh"
+
+
+def test_set_skips_everything_read_before_a_clear_or_a_forgotten_tag():
+    cache = TTLCache(maxsize=2)
+    generation = cache.generation
+    cache.clear()
+    assert not cache.set("a", 1, tags=["a"], since=generation)
+
+    generation = cache.generation
+    cache.invalidate("x")
+    cache.invalidate("y")
+    cache.invalidate("z")
+    assert not cache.set("a", 1, tags=["a"], since=generation)
+    assert cache.set("a", 1, tags=["a"], since=cache.generation)
+
+
+class _VersionsWrittenDuringRead:
+    """A versions collection whose write lands while a read is in flight"""
+
+    def __init__(self):
+        self.version = 1
+
+    async def find(self, query):
+        doc = {"_id": "products", "version": self.version, "updated_at": None}
+        self.version += 1
+        catalog_cache.invalidate("products")
+        yield doc
+
+
+def test_versions_read_during_a_bump_are_not_cached():
+    db = {VERSIONS_COLLECTION: _VersionsWrittenDuringRead()}
+    catalog_cache.clear()
+
+    async def run():
+        await get_versions(db, ["products"])
+        return await get_versions(db, ["products"])
+
+    try:
+        assert asyncio.run(run())["products"]["version"] == 2
+    finally:
+        catalog_cache.clear()
+
+
+def test_writes_invalidate_cached_product_pages(client, admin_headers):
+    product = client.post("/api/products", json=PRODUCT, headers=admin_headers).json()
+    first = client.get("/api/products")
+    assert [p["price"] for p in first.json()] == [4.5]
+    assert client.get(f"/api/products/{product['id']}").json()["price"] == 4.5
+
+    client.put(f"/api/products/{product['id']}", json={"price": 6.0}, headers=admin_headers)
+
+    second = client.get("/api/products")
+    assert [p["price"] for p in second.json()] == [6.0]
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert client.get(f"/api/products/{product['id']}").json()["price"] == 6.0
+    assert client.get("/api/products", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+
+
+def test_category_rename_invalidates_products_that_embed_it(client, admin_headers):
+    category = client.post("/api/categories", json={"name": "Brackets"}, headers=admin_headers).json()
+    product = client.post(
+        "/api/products", json={**PRODUCT, "category_ids": [category["id"]]}, headers=admin_headers
+    ).json()
+    assert client.get(f"/api/products/{product['id']}").json()["categories"][0]["name"] == "Brackets"
+
+    client.put(f"/api/categories/{category['id']}", json={"name": "Clips"}, headers=admin_headers)
+
+    assert client.get(f"/api/products/{product['id']}").json()["categories"][0]["name"] == "Clips"
+    assert client.get("/api/products").json()[0]["categories"][0]["name"] == "Clips"
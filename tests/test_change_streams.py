@@ -0,0 +1,31 @@
+from services.auth import cache_user, user_cache
+from services.cache import MISSING, TTLCache
+from services.change_streams import apply_change
+
+
+def _user_change(operation, doc=None):
+    change = {"operationType": operation, "ns": {"coll": "users"}, "documentKey": {"_id": "mongo-id"}}
+    if doc is not None:
+        change["fullDocument"] = doc
+    return change
+
+
+def test_user_update_invalidates_only_that_user():
+    catalog = TTLCache()
+    catalog.set(("products",), [], tags=["products"])
+    cache_user({"id": "u1", "username": "admin", "role": "admin"})
+    cache_user({"id": "u2", "username": "other", "role": "user"})
+
+    apply_change(catalog, _user_change("update", {"id": "u1", "username": "admin", "role": "user"}))
+
+    assert user_cache.get(("user", "u1")) is MISSING
+    assert user_cache.get(("user", "u2")) is not MISSING
+    assert catalog.get(("products",)) == []
+
+
+def test_user_delete_clears_the_user_cache():
+    cache_user({"id": "u3", "username": "gone", "role": "admin"})
+
+    apply_change(TTLCache(), _user_change("delete"))
+
+    assert user_cache.get(("user", "u3")) is MISSING
@@ -0,0 +1,36 @@
+import pytest
+
+from services.conditional import parse_if_match, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("BYTES=5-5", (5, 5)),
+    (" bytes=1-2 ", (1, 2)),
+])
+def test_single_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [None, "", "items=0-1", "bytes=0-1,5-6", "bytes=-", "bytes=a-b"])
+def test_headers_that_mean_the_whole_file(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1005", "bytes=50-10", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+
+def test_if_match():
+    assert parse_if_match(None) is None
+    assert parse_if_match(" * ") is None
+    assert [parse_if_match(value) for value in ('3', '"3"', 'W/"3"')] == [3, 3, 3]
+    with pytest.raises(ValueError):
+        parse_if_match('"abc"')
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import pytest
+
+from routes.contact import email_search
+
+
+def _submission(submission_id, email, message):
+    return {
+        "id": submission_id, "name": "Ana", "email": email, "service_type": "printing", "message": message,
+        "status": "pending", "created_at": datetime.utcnow(),
+    }
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("ana@example.com", "ana@example.com"),
+    (" Ana@Example.COM ", "Ana@example.com"),
+    ("ana", None),
+    ("example.com", None),
+    ("ana@localhost", None),
+    ("ana @example.com", None),
+])
+def test_email_search(q, expected):
+    assert email_search(q) == expected
+
+
+def test_inbox_matches_a_searched_address_exactly(client, server, admin_headers):
+    client.portal.call(server.db.contact_submissions.insert_many, [
+        _submission("s1", "ana@example.com", "Quote for a bracket"),
+        _submission("s2", "ana.maria@example.com", "Mail ana@example.com too"),
+        _submission("s3", "bob@example.com", "Ana referred me"),
+    ])
+
+    response = client.get("/api/contact/inbox", params={"q": "ana@EXAMPLE.com"}, headers=admin_headers)
+
+    assert response.status_code == 200
+    assert [entry["id"] for entry in response.json()] == ["s1"]
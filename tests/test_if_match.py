@@ -0,0 +1,50 @@
+import pytest
+
+PRODUCT = {"name": "Bracket", "description": "PLA bracket", "price": 4.5, "image_url": "/img/bracket.png"}
+
+
+@pytest.fixture
+def product(client, admin_headers):
+    return client.post("/api/products", json=PRODUCT, headers=admin_headers).json()
+
+
+@pytest.fixture
+def category(client, admin_headers):
+    return client.post("/api/categories", json={"name": "Brackets"}, headers=admin_headers).json()
+
+
+def test_matching_version_updates_and_bumps_it(client, admin_headers, product):
+    response = client.put(
+        f"/api/products/{product['id']}", json={"price": 5.0},
+        headers={**admin_headers, "If-Match": f'"{product["version"]}"'}
+    )
+    assert response.status_code == 200
+    assert response.json()["price"] == 5.0
+    assert response.json()["version"] == product["version"] + 1
+
+
+@pytest.mark.parametrize("method, kwargs", [("put", {"json": {"price": 5.0}}), ("delete", {})])
+def test_stale_version_is_412_and_missing_product_is_404(client, admin_headers, product, method, kwargs):
+    stale = {**admin_headers, "If-Match": f'"{product["version"] + 1}"'}
+
+    assert getattr(client, method)(f"/api/products/{product['id']}", headers=stale, **kwargs).status_code == 412
+    assert getattr(client, method)("/api/products/missing", headers=stale, **kwargs).status_code == 404
+    assert client.get(f"/api/products/{product['id']}").json()["price"] == PRODUCT["price"]
+
+
+@pytest.mark.parametrize("method, kwargs", [("put", {"json": {"name": "Clips"}}), ("delete", {})])
+def test_category_stale_version_is_412_and_missing_category_is_404(
+    client, admin_headers, category, method, kwargs
+):
+    stale = {**admin_headers, "If-Match": f'"{category["version"] + 1}"'}
+
+    assert getattr(client, method)(f"/api/categories/{category['id']}", headers=stale, **kwargs).status_code == 412
+    assert getattr(client, method)("/api/categories/missing", headers=stale, **kwargs).status_code == 404
+    assert client.get(f"/api/categories/{category['id']}").json()["name"] == "Brackets"
+
+
+def test_malformed_if_match_is_400(client, admin_headers, product):
+    response = client.put(
+        f"/api/products/{product['id']}", json={"price": 5.0}, headers={**admin_headers, "If-Match": '"abc"'}
+    )
+    assert response.status_code == 400
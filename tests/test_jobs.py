@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from services.jobs import JOB_FAILURE_HOOKS, JOBS_COLLECTION, claim_job, enqueue_job, fail_lapsed_jobs
+
+
+def _lapse(db, job_id, attempts):
+    return db[JOBS_COLLECTION].update_one({"id": job_id}, {"$set": {
+        "status": "running", "worker": "dead-worker", "attempts": attempts,
+        "lease_until": datetime.utcnow() - timedelta(seconds=1),
+    }})
+
+
+def test_lapsed_job_with_attempts_left_is_claimed_again():
+    db = AsyncMongoMockClient()["test"]
+
+    async def run():
+        job_id = await enqueue_job(db, "test", {}, max_attempts=3)
+        await _lapse(db, job_id, attempts=2)
+        await claim_job(db, "worker")
+        # Read back rather than use claim_job's result: mongomock returns None
+        # from find_one_and_update(AFTER) once the update unmatches the filter
+        return await db[JOBS_COLLECTION].find_one({"id": job_id})
+
+    job = asyncio.run(run())
+    assert job["worker"] == "worker" and job["attempts"] == 3
+
+
+def test_lapsed_job_out_of_attempts_fails():
+    db = AsyncMongoMockClient()["test"]
+    failures = []
+
+    async def on_failure(db, job, error):
+        failures.append((job["id"], error))
+
+    async def run():
+        JOB_FAILURE_HOOKS["test-lapsed"] = on_failure
+        try:
+            job_id = await enqueue_job(db, "test-lapsed", {}, max_attempts=3)
+            await _lapse(db, job_id, attempts=3)
+            await claim_job(db, "worker")
+            claimed = await db[JOBS_COLLECTION].find_one({"id": job_id, "worker": "worker"})
+            await fail_lapsed_jobs(db)
+            return job_id, claimed, await db[JOBS_COLLECTION].find_one({"id": job_id})
+        finally:
+            del JOB_FAILURE_HOOKS["test-lapsed"]
+
+    job_id, claimed, job = asyncio.run(run())
+    assert claimed is None
+    assert job["status"] == "failed" and "Lease expired" in job["error"]
+    assert failures == [(job_id, job["error"])]
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from services.mesh import MeshError, analyze_mesh, load_mesh, measure
+from tests.meshes import ascii_stl, binary_stl, cube, obj, threemf
+
+
+def test_measure_unit_cube():
+    stats = measure(cube())
+    assert stats["triangle_count"] == 12
+    assert stats["volume"] == pytest.approx(1.0)
+    assert stats["surface_area"] == pytest.approx(6.0)
+    assert stats["bbox_min"] == [0, 0, 0] and stats["dimensions"] == [1, 1, 1]
+
+
+def test_measure_is_exact_far_from_the_origin():
+    stats = measure(cube(2.0, offset=(1e6, -1e6, 5e5)))
+    assert stats["volume"] == pytest.approx(8.0)
+    assert stats["surface_area"] == pytest.approx(24.0)
+    assert stats["bbox_min"] == [1e6, -1e6, 5e5]
+
+
+def test_inward_winding_gives_a_negative_volume():
+    assert measure(cube()[:, ::-1])["volume"] == pytest.approx(-1.0)
+
+
+def test_measure_rejects_empty_and_non_finite_meshes():
+    with pytest.raises(MeshError):
+        measure(np.empty((0, 3, 3)))
+    triangles = cube()
+    triangles[0, 0, 0] = np.nan
+    with pytest.raises(MeshError):
+        measure(triangles)
+
+
+@pytest.mark.parametrize("name, content", [
+    ("cube.stl", binary_stl(cube(10))),
+    ("cube.stl", ascii_stl(cube(10))),
+    ("cube.obj", obj(10)),
+    ("cube.3mf", threemf(10)),
+])
+def test_every_format_measures_the_same_cube(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    stats = analyze_mesh(path)
+    assert stats["unit"] == "millimeter"
+    assert stats["triangle_count"] == 12
+    assert stats["volume"] == pytest.approx(1000.0)
+    assert stats["surface_area"] == pytest.approx(600.0)
+
+
+def test_binary_stl_whose_header_starts_with_solid(tmp_path):
+    path = tmp_path / "cube.stl"
+    path.write_bytes(binary_stl(cube(), header=b"solid exported by a CAD tool"))
+    triangles, _ = load_mesh(path)
+    assert measure(triangles)["volume"] == pytest.approx(1.0)
+
+
+def test_3mf_applies_build_transforms_and_reports_its_unit(tmp_path):
+    path = tmp_path / "cube.3mf"
+    path.write_bytes(threemf(unit="inch", transform="2 0 0 0 2 0 0 0 2 5 0 0"))
+    stats = analyze_mesh(path)
+    assert stats["unit"] == "inch"
+    assert stats["volume"] == pytest.approx(8.0)
+    assert stats["bbox_min"] == [5, 0, 0] and stats["bbox_max"] == [7, 2, 2]
+
+
+def test_upload_name_picks_the_parser(tmp_path):
+    path = tmp_path / "upload.bin"
+    path.write_bytes(obj())
+    triangles, _ = load_mesh(path, "model.OBJ")
+    assert len(triangles) == 12
+
+
+@pytest.mark.parametrize("name, content", [
+    ("bad.obj", b"v 0 0 0\nv 1 0 0\nf 1 2 3\n"),
+    ("bad.obj", b"v 0 0 0\n"),
+    ("bad.stl", b"solid x\nfacet normal 0 0 0\nouter loop\nvertex 0 0 0\nvertex 1 0 0\nendloop\nendfacet\n"),
+    ("bad.3mf", b"not a zip"),
+    ("bad.step", b"ISO-10303-21;"),
+])
+def test_unreadable_meshes_raise_mesh_error(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    with pytest.raises(MeshError):
+        load_mesh(path)
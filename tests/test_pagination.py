@@ -0,0 +1,107 @@
+import asyncio
+import base64
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from services.pagination import (
+    CREATED_ASC, CREATED_DESC, InvalidCursor, apply_after, csv_text, csv_value, decode_cursor, encode_cursor,
+    fetch_page, keyset_filter, stream_csv
+)
+
+
+def test_cursor_round_trip_keeps_types():
+    created = datetime(2026, 3, 1, 12, 30, 15, 123000)
+    cursor = encode_cursor({"created_at": created, "id": "p-7", "name": "ignored"}, CREATED_DESC)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, CREATED_DESC) == [created, "p-7"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"{not json").decode(),
+    base64.urlsafe_b64encode(b'{"created_at": 1}').decode(),
+    # A cursor for a sort on one field, given to a sort on two
+    encode_cursor({"name": "a"}, [("name", 1)]),
+])
+def test_tampered_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, CREATED_ASC)
+
+
+def test_keyset_filter_breaks_ties_on_later_fields():
+    assert keyset_filter(CREATED_DESC, ["t", "x"]) == {"$or": [
+        {"created_at": {"$lt": "t"}},
+        {"created_at": "t", "id": {"$lt": "x"}},
+    ]}
+
+
+def test_apply_after_keeps_the_query():
+    cursor = encode_cursor({"created_at": 1, "id": "a"}, CREATED_ASC)
+    assert apply_after({"status": "new"}, CREATED_ASC, None) == {"status": "new"}
+    assert apply_after({}, CREATED_ASC, cursor) == keyset_filter(CREATED_ASC, [1, "a"])
+    assert apply_after({"status": "new"}, CREATED_ASC, cursor)["$and"][0] == {"status": "new"}
+
+
+def test_fetch_page_walks_every_document_once_despite_ties():
+    db = AsyncMongoMockClient()["test"]
+    start = datetime(2026, 1, 1)
+    # Pairs of documents share a timestamp, so the id has to break the tie
+    docs = [{"id": f"d{i:02}", "created_at": start + timedelta(minutes=i // 2)} for i in range(11)]
+
+    async def walk():
+        await db.items.insert_many([dict(doc) for doc in docs])
+        seen, after, pages = [], None, 0
+        while True:
+            page, after = await fetch_page(db.items, {}, CREATED_DESC, 3, after)
+            seen += [doc["id"] for doc in page]
+            pages += 1
+            if not after:
+                return seen, pages
+
+    seen, pages = asyncio.run(walk())
+    assert seen == [doc["id"] for doc in reversed(docs)]
+    assert pages == 4
+
+
+def test_csv_values():
+    assert csv_value(["a", "b"]) == "a|b"
+    assert csv_value(datetime(2026, 1, 2, 3, 4)) == "2026-01-02T03:04:00"
+    assert csv_value(1.5) == 1.5
+
+
+def test_stream_csv_writes_a_header_and_one_row_per_document():
+    db = AsyncMongoMockClient()["test"]
+
+    async def export():
+        await db.items.insert_many([{"id": "a", "tags": ["x", "y"]}, {"id": "b", "extra": 1}])
+        cursor = db.items.find({}, {"_id": 0}).sort("id", 1)
+        return b"".join([chunk async for chunk in stream_csv(cursor, ["id", "tags"], batch_size=1)])
+
+    rows = list(csv.reader(io.StringIO(asyncio.run(export()).decode())))
+    assert rows == [["id", "tags"], ["a", "x|y"], ["b", ""]]
+
+
+@pytest.mark.parametrize("text", ["=1+1", "+1", "-1", "@SUM(A1)", "\tx", "\rx"])
+def test_csv_text_defuses_formulas(text):
+    assert csv_text(text) == "'" + text
+
+
+def test_csv_text_leaves_other_values_alone():
+    assert csv_text("hello = world") == "hello = world"
+    assert csv_text(-1) == -1
+
+
+def test_stream_csv_escapes_public_text():
+    db = AsyncMongoMockClient()["test"]
+
+    async def export():
+        await db.items.insert_many([{"id": "a", "message": "=cmd()"}, {"id": "b", "message": "hi"}])
+        cursor = db.items.find({}, {"_id": 0}).sort("id", 1)
+        return b"".join([chunk async for chunk in stream_csv(cursor, ["id", "message"], to_cell=csv_text)])
+
+    rows = list(csv.reader(io.StringIO(asyncio.run(export()).decode())))
+    assert rows == [["id", "message"], ["a", "'=cmd()"], ["b", "hi"]]
@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+import services.passwords as passwords
+from services.passwords import HashingOverloaded, build_crypt_context, hash_password, verify_and_update_password
+
+
+def test_hash_then_verify():
+    async def run():
+        hashed = await hash_password("s3cret")
+        return await verify_and_update_password("s3cret", hashed), await verify_and_update_password("wrong", hashed)
+
+    assert asyncio.run(run()) == ((True, None), (False, None))
+
+
+def test_hash_from_an_older_policy_is_replaced():
+    old_hash = build_crypt_context(["bcrypt"], bcrypt_rounds=4).hash("s3cret")
+
+    valid, new_hash = asyncio.run(verify_and_update_password("s3cret", old_hash))
+
+    assert valid and new_hash and passwords.pwd_context.verify("s3cret", new_hash)
+
+
+def test_saturated_pool_rejects_instead_of_queueing(monkeypatch):
+    monkeypatch.setattr(passwords, "_pending", passwords.HASH_QUEUE_LIMIT)
+    with pytest.raises(HashingOverloaded):
+        asyncio.run(hash_password("s3cret"))
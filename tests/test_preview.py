@@ -0,0 +1,99 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from services.mesh import MeshError
+from services.preview import (
+    GL_UNSIGNED_INT, GL_UNSIGNED_SHORT, QUANTIZE_STEPS, Z_UP_TO_Y_UP, decimate, encode_glb, weld
+)
+from tests.meshes import cube
+
+
+def _read_glb(content: bytes):
+    magic, version, length = struct.unpack_from("<4sII", content)
+    assert (magic, version, length) == (b"glTF", 2, len(content))
+    json_length, json_type = struct.unpack_from("<I4s", content, 12)
+    assert json_type == b"JSON" and json_length % 4 == 0
+    document = json.loads(content[20:20 + json_length])
+    bin_length, bin_type = struct.unpack_from("<I4s", content, 20 + json_length)
+    assert bin_type == b"BIN\x00" and bin_length % 4 == 0
+    binary = content[28 + json_length:28 + json_length + bin_length]
+    assert 28 + json_length + bin_length == len(content)
+    return document, binary
+
+
+def _decode(document, binary):
+    """World positions (metres, Y-up) of each face's corners"""
+    positions, indices = document["accessors"]
+    vertex_view, index_view = document["bufferViews"][0], document["bufferViews"][1]
+    stride = vertex_view["byteStride"]
+    quantized = np.ndarray(
+        (positions["count"], 3), dtype="<u2", buffer=binary, offset=vertex_view["byteOffset"], strides=(stride, 2)
+    )
+    index_type = "<u2" if indices["componentType"] == GL_UNSIGNED_SHORT else "<u4"
+    faces = np.frombuffer(binary, dtype=index_type, count=indices["count"], offset=index_view["byteOffset"])
+    matrix = np.array(document["nodes"][0]["matrix"]).reshape(4, 4).T  # stored column-major
+    world = quantized @ matrix[:3, :3].T + matrix[:3, 3]
+    return world[faces.reshape(-1, 3)], quantized
+
+
+def test_weld_merges_shared_corners():
+    triangles = cube(10)
+    positions, faces = weld(triangles, np.zeros(3), np.full(3, 10.0))
+    assert len(positions) == 8 and len(faces) == 12
+    assert np.allclose(positions[faces], triangles)
+
+
+def test_small_meshes_are_kept_whole():
+    origin, positions, faces = decimate(cube(10, offset=(5, 6, 7)))
+    assert origin.tolist() == [5, 6, 7]
+    assert len(faces) == 12
+
+
+def test_dense_meshes_are_reduced_to_the_budget():
+    # A 100 x 100 grid of quads: 20,000 triangles
+    steps = np.linspace(0, 99, 100)
+    x, y = np.meshgrid(steps, steps)
+    corners = np.stack([x, y, np.sin(x / 10) * 5], axis=-1)
+    a, b, c, d = corners[:-1, :-1], corners[:-1, 1:], corners[1:, 1:], corners[1:, :-1]
+    triangles = np.concatenate([np.stack([a, b, c], -2), np.stack([a, c, d], -2)]).reshape(-1, 3, 3)
+
+    _, positions, faces = decimate(triangles, max_triangles=2000)
+    assert 0 < len(faces) <= 2000
+    assert faces.max() < len(positions)
+
+
+def test_degenerate_soups_raise_mesh_error():
+    flat = np.zeros((4, 3, 3))
+    with pytest.raises(MeshError):
+        decimate(flat)
+
+
+def test_glb_layout_and_positions_round_trip():
+    triangles = cube(20, offset=(100, 200, 300))
+    origin, positions, faces = decimate(triangles)
+    document, binary = _read_glb(encode_glb(origin, positions, faces, "millimeter"))
+
+    assert document["extensionsRequired"] == ["KHR_mesh_quantization"]
+    positions_accessor, index_accessor = document["accessors"]
+    assert positions_accessor["componentType"] == GL_UNSIGNED_SHORT and positions_accessor["count"] == 8
+    assert index_accessor["componentType"] == GL_UNSIGNED_SHORT and index_accessor["count"] == 36
+    for view in document["bufferViews"]:
+        assert view["byteOffset"] % 4 == 0 and view["byteOffset"] + view["byteLength"] <= len(binary)
+    assert document["buffers"] == [{"byteLength": len(binary)}]
+
+    world, quantized = _decode(document, binary)
+    assert positions_accessor["min"] == quantized.min(axis=0).tolist() == [0, 0, 0]
+    assert positions_accessor["max"] == quantized.max(axis=0).tolist() == [QUANTIZE_STEPS] * 3
+    # Millimetres, Z-up in the file; metres, Y-up once the node transform is applied
+    expected = triangles / 1000.0 @ Z_UP_TO_Y_UP.T
+    assert np.allclose(world, expected, atol=1e-6)
+
+
+def test_glb_uses_32_bit_indices_for_large_meshes():
+    positions = np.random.default_rng(0).random((70000, 3))
+    faces = np.arange(70000 - 70000 % 3).reshape(-1, 3)
+    document, _ = _read_glb(encode_glb(np.zeros(3), positions, faces))
+    assert document["accessors"][1]["componentType"] == GL_UNSIGNED_INT
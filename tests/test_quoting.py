@@ -0,0 +1,55 @@
+import pytest
+
+from services.quoting import DEFAULT_RATES, quote_meshes, rates_fingerprint
+
+# Round numbers so the expected quote can be worked out by hand
+RATES = {
+    "currency": "EUR",
+    "setup_fee": 1.0,
+    "minimum_price": 0.0,
+    "materials": {
+        "test": {
+            "density": 1.0, "price_per_kg": 1000.0, "infill": 0.5, "shell_thickness": 0.1,
+            "layer_height": 1.0, "flow_rate": 10.0, "layer_seconds": 36.0, "hourly_rate": 3600.0,
+        },
+    },
+}
+# A 10 mm cube
+CUBE = {"volume": 1000.0, "surface_area": 600.0, "dimensions": [10.0, 10.0, 10.0], "unit": "millimeter"}
+
+
+def test_quote_arithmetic():
+    [quote] = quote_meshes([CUBE], RATES)
+    # shell 600 * 0.1 = 60 mm³, plus half of the other 940 mm³ = 530 mm³ = 0.53 g;
+    # 53 s of extrusion and 10 layers * 36 s; price 1 + 0.53 + 413 s at 1/s
+    assert quote["currency"] == "EUR"
+    assert quote["rates"] == rates_fingerprint(RATES)
+    assert quote["options"] == [{"material": "test", "weight_grams": 0.5, "print_hours": 0.11, "price": 414.53}]
+
+
+def test_units_and_winding_do_not_change_the_quote():
+    in_cm = {"volume": -1.0, "surface_area": 6.0, "dimensions": [1.0, 1.0, 1.0], "unit": "centimeter"}
+    mm_quote, cm_quote = quote_meshes([CUBE, in_cm], RATES)
+    assert cm_quote["options"] == mm_quote["options"]
+
+
+def test_thin_parts_are_solid_and_cheap_parts_cost_the_minimum():
+    sheet = {"volume": 10.0, "surface_area": 200.0, "dimensions": [10.0, 10.0, 0.1]}
+    rates = {**RATES, "minimum_price": 500.0}
+    [quote] = quote_meshes([sheet], rates)
+    # The shell would be 20 mm³, more than the whole part
+    assert quote["options"][0]["weight_grams"] == pytest.approx(0.0, abs=0.05)
+    assert quote["options"][0]["price"] == 500.0
+
+
+def test_every_material_is_quoted_for_every_mesh():
+    quotes = quote_meshes([CUBE, CUBE, CUBE], DEFAULT_RATES)
+    assert len(quotes) == 3
+    assert [option["material"] for option in quotes[0]["options"]] == list(DEFAULT_RATES["materials"])
+    assert all(option["price"] >= DEFAULT_RATES["minimum_price"] for quote in quotes for option in quote["options"])
+
+
+def test_fingerprint_follows_the_rates():
+    changed = {**RATES, "setup_fee": 2.0}
+    assert rates_fingerprint(RATES) == rates_fingerprint(dict(reversed(list(RATES.items()))))
+    assert rates_fingerprint(RATES) != rates_fingerprint(changed)
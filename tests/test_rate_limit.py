@@ -0,0 +1,38 @@
+import ipaddress
+
+import pytest
+from starlette.requests import Request
+
+from services import rate_limit
+from services.rate_limit import RateLimiter, client_address
+
+
+def _request(peer, forwarded_for=None):
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request({"type": "http", "client": (peer, 1234), "headers": headers})
+
+
+@pytest.fixture
+def behind_ingress(monkeypatch):
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+
+
+def test_untrusted_peers_are_the_client(behind_ingress):
+    assert client_address(_request("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+
+
+def test_trusted_proxies_are_looked_through(behind_ingress):
+    assert client_address(_request("10.0.0.2", "198.51.100.1")) == "198.51.100.1"
+    # The leftmost entry is whatever the client sent; the ingress appended the real one
+    assert client_address(_request("10.0.0.2", "1.2.3.4, 198.51.100.1, 10.0.0.9")) == "198.51.100.1"
+    assert client_address(_request("10.0.0.2")) == "10.0.0.2"
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies():
+    assert client_address(_request("10.0.0.2", "198.51.100.1")) == "10.0.0.2"
+
+
+def test_limiter_counts_per_key_within_the_window():
+    limiter = RateLimiter(2, 60)
+    assert [limiter.hit("a"), limiter.hit("a"), limiter.hit("b")] == [0, 0, 0]
+    assert limiter.hit("a") > 0
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from services.sniffing import SNIFF_BYTES, InvalidUpload, check_file, check_prefix, sniff_stream
+from tests.meshes import STEP, ascii_stl, binary_stl, cube, obj, threemf, zip_archive
+
+
+def _check_file(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    check_file(name, path, len(content))
+
+
+@pytest.mark.parametrize("name, content", [
+    ("cube.stl", binary_stl(cube())),
+    ("cube.stl", binary_stl(cube(), header=b"solid but binary")),
+    ("cube.stl", ascii_stl(cube())),
+    ("cube.obj", obj()),
+    ("cube.3mf", threemf()),
+    ("part.step", STEP),
+    ("part.stp", b"\xef\xbb\xbf" + STEP),
+], ids=["binary-stl", "solid-header-binary-stl", "ascii-stl", "obj", "3mf", "step", "step-with-bom"])
+def test_valid_files_pass(tmp_path, name, content):
+    _check_file(tmp_path, name, content)
+
+
+@pytest.mark.parametrize("name, content, reason", [
+    ("cube.stl", zip_archive({"a.txt": "x" * 1000}), "binary STL"),
+    ("cube.stl", binary_stl(cube())[:-10], "but the file is"),
+    ("cube.stl", ascii_stl(cube())[:-20], "no endsolid"),
+    ("cube.stl", b"solid x\n" + b" " * SNIFF_BYTES, "no facets"),
+    ("cube.obj", b"v 0 0 0\n\x00\x01\x02", "binary data"),
+    ("cube.obj", b"<html><body>v 0 0 0</body></html>\n", "unknown statement"),
+    ("cube.3mf", zip_archive({"3D/other.model": "<model/>"}), "no model part 3D/3dmodel.model"),
+    ("cube.3mf", binary_stl(cube()), "not a ZIP package"),
+    ("part.step", b"PK\x03\x04" + STEP, "missing the ISO-10303-21 header"),
+    ("part.step", STEP[:-20], "truncated"),
+], ids=[
+    "renamed-zip-stl", "short-binary-stl", "truncated-ascii-stl", "facetless-ascii-stl", "binary-obj", "html-obj",
+    "3mf-without-model", "stl-as-3mf", "zip-as-step", "truncated-step",
+])
+def test_invalid_files_are_rejected(tmp_path, name, content, reason):
+    with pytest.raises(InvalidUpload) as rejected:
+        _check_file(tmp_path, name, content)
+    assert rejected.value.status_code == 422
+    assert reason in rejected.value.detail
+
+
+def test_prefix_check_waits_for_the_size_before_judging_a_binary_stl():
+    header = binary_stl(cube())[:84]
+    check_prefix("cube.stl", header)
+    with pytest.raises(InvalidUpload):
+        check_prefix("cube.stl", header, size=84)
+
+
+def test_prefix_check_ignores_a_cut_off_last_obj_line():
+    check_prefix("cube.obj", b"v 0 0 0\nv 1 0 0\nvertex-cut-he")
+    with pytest.raises(InvalidUpload):
+        check_prefix("cube.obj", b"v 0 0 0\nvertex-cut-he", size=21)
+
+
+def test_unchecked_extensions_pass():
+    check_prefix("notes.txt", b"\x00\x01")
+
+
+def test_sniff_stream_holds_the_body_until_the_prefix_is_checked():
+    checked = []
+
+    async def body(chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def read(chunks, check):
+        return b"".join([data async for data in sniff_stream(body(chunks), check, prefix_bytes=8)])
+
+    content = asyncio.run(read([b"abc", b"defgh", b"ijk"], checked.append))
+    assert content == b"abcdefghijk"
+    assert checked == [b"abcdefgh"]
+
+    def reject(prefix):
+        raise InvalidUpload("cube.stl", "nope")
+
+    with pytest.raises(InvalidUpload):
+        asyncio.run(read([b"abc", b"defgh", b"ijk"], reject))
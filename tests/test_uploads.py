@@ -0,0 +1,210 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from services.storage import local_path, storage
+from services.uploads import (
+    BLOB_DELETE_STALE_SECONDS, PARTIAL_DIR, UPLOAD_ASSEMBLE_STALE_SECONDS, UPLOAD_BLOBS_COLLECTION,
+    UPLOAD_SESSIONS_COLLECTION, UPLOAD_TEMP_STALE_SECONDS, _delete_blob, blob_key, merge_ranges, parse_content_range,
+    partial_path, purge_expired_uploads, received_offset, store_blob
+)
+from tests.meshes import binary_stl, cube
+
+
+def test_content_range_is_half_open():
+    assert parse_content_range("bytes 0-99/1000", 1000) == (0, 100)
+    assert parse_content_range("bytes 999-999/1000", 1000) == (999, 1000)
+
+
+@pytest.mark.parametrize("value", [
+    None, "bytes 0-99/*", "bytes */1000", "bytes 0-99/999", "bytes 50-10/1000", "bytes 0-1000/1000",
+])
+def test_content_range_rejects_malformed_or_out_of_bounds(value):
+    with pytest.raises(ValueError):
+        parse_content_range(value, 1000)
+
+
+def test_merge_ranges_coalesces_overlapping_and_adjacent():
+    assert merge_ranges([[50, 60], [0, 10], [10, 20], [15, 30], [70, 80], [75, 76]]) == [[0, 30], [50, 60], [70, 80]]
+    assert merge_ranges([]) == []
+
+
+def test_received_offset_counts_only_from_the_start():
+    assert received_offset([[10, 20], [0, 5], [5, 10]]) == 20
+    assert received_offset([[10, 20]]) == 0
+    assert received_offset([]) == 0
+
+
+def _write(path, content=b"data"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def test_purge_drops_expired_sessions_and_unreferenced_blobs():
+    db = AsyncMongoMockClient()["test"]
+    long_ago = datetime.utcnow() - timedelta(days=2)
+    sha256 = "ab" * 32
+    thumbnail, preview = f"thumbnails/ab/{sha256}-iso-256.png", f"previews/ab/{sha256}.glb"
+    for key in (blob_key(sha256), thumbnail, preview):
+        _write(local_path(key))
+    partial = _write(partial_path("expired-session"))
+
+    async def run():
+        await db[UPLOAD_SESSIONS_COLLECTION].insert_one(
+            {"id": "expired-session", "status": "open", "expires_at": long_ago}
+        )
+        await db[UPLOAD_BLOBS_COLLECTION].insert_one({
+            "_id": sha256, "refcount": 0, "last_referenced_at": long_ago, "key": blob_key(sha256),
+            "thumbnails": [thumbnail], "preview": {"key": preview},
+        })
+        await purge_expired_uploads(db)
+        return (
+            await db[UPLOAD_SESSIONS_COLLECTION].count_documents({}),
+            await db[UPLOAD_BLOBS_COLLECTION].count_documents({}),
+        )
+
+    assert asyncio.run(run()) == (0, 0)
+    assert not partial.exists()
+    for key in (blob_key(sha256), thumbnail, preview):
+        assert not local_path(key).exists()
+
+
+def test_purge_keeps_referenced_blobs():
+    db = AsyncMongoMockClient()["test"]
+    sha256 = "cd" * 32
+    stored = _write(local_path(blob_key(sha256)))
+
+    async def run():
+        await db[UPLOAD_BLOBS_COLLECTION].insert_one({
+            "_id": sha256, "refcount": 1, "key": blob_key(sha256),
+            "last_referenced_at": datetime.utcnow() - timedelta(days=2),
+        })
+        await purge_expired_uploads(db)
+        return await db[UPLOAD_BLOBS_COLLECTION].count_documents({})
+
+    assert asyncio.run(run()) == 1
+    assert stored.exists()
+
+
+def test_store_blob_waits_for_a_deletion_in_progress(tmp_path):
+    db = AsyncMongoMockClient()["test"]
+    sha256 = "ef" * 32
+    key = blob_key(sha256)
+    _write(local_path(key), b"old")
+    source = _write(tmp_path / "upload", b"new")
+
+    async def run():
+        marked = {"_id": sha256, "refcount": 0, "key": key, "deleting_at": datetime.utcnow()}
+        await db[UPLOAD_BLOBS_COLLECTION].insert_one(marked)
+        storing = asyncio.create_task(store_blob(db, source, sha256, 3))
+        await asyncio.sleep(0.1)
+        assert not storing.done()
+        # The purge finishes deleting the old copy; the new one must survive it
+        await _delete_blob(db, marked)
+        await storing
+        return await db[UPLOAD_BLOBS_COLLECTION].find_one({"_id": sha256})
+
+    blob = asyncio.run(run())
+    assert blob["refcount"] == 1 and blob["deleting_at"] is None
+    assert local_path(key).read_bytes() == b"new"
+
+
+def test_store_blob_finishes_an_abandoned_deletion(tmp_path):
+    db = AsyncMongoMockClient()["test"]
+    sha256 = "0f" * 32
+    key = blob_key(sha256)
+    source = _write(tmp_path / "upload", b"new")
+
+    async def run():
+        await db[UPLOAD_BLOBS_COLLECTION].insert_one({
+            "_id": sha256, "refcount": 0, "key": key,
+            "deleting_at": datetime.utcnow() - timedelta(seconds=BLOB_DELETE_STALE_SECONDS + 1),
+        })
+        await asyncio.wait_for(store_blob(db, source, sha256, 3), timeout=5)
+        return await db[UPLOAD_BLOBS_COLLECTION].find_one({"_id": sha256})
+
+    assert asyncio.run(run())["refcount"] == 1
+    assert local_path(key).read_bytes() == b"new"
+
+
+def test_purge_leaves_partial_files_of_other_nodes_alone():
+    db = AsyncMongoMockClient()["test"]
+    long_ago = datetime.utcnow() - timedelta(days=2)
+    partial = _write(partial_path("elsewhere"))
+
+    async def run():
+        await db[UPLOAD_SESSIONS_COLLECTION].insert_one(
+            {"id": "elsewhere", "status": "open", "node": "another-node", "expires_at": long_ago}
+        )
+        await purge_expired_uploads(db)
+        return await db[UPLOAD_SESSIONS_COLLECTION].count_documents({})
+
+    assert asyncio.run(run()) == 1
+    assert partial.exists()
+
+
+def test_local_fetch_copies_the_file(tmp_path):
+    key = "objects/12/34/1234"
+    _write(local_path(key), b"stored")
+
+    asyncio.run(storage.fetch(key, tmp_path / "copy" / "model.stl"))
+
+    assert (tmp_path / "copy" / "model.stl").read_bytes() == b"stored"
+    assert local_path(key).exists()
+
+
+def test_purge_drops_expired_sessions_left_assembling():
+    db = AsyncMongoMockClient()["test"]
+    long_ago = datetime.utcnow() - timedelta(days=2)
+    partial = _write(partial_path("crashed"))
+
+    async def run():
+        await db[UPLOAD_SESSIONS_COLLECTION].insert_many([
+            {"id": "crashed", "status": "assembling", "assembling_at": long_ago, "expires_at": long_ago},
+            {"id": "busy", "status": "assembling", "assembling_at": datetime.utcnow(), "expires_at": long_ago},
+        ])
+        await purge_expired_uploads(db)
+        return [session["id"] async for session in db[UPLOAD_SESSIONS_COLLECTION].find()]
+
+    assert asyncio.run(run()) == ["busy"]
+    assert not partial.exists()
+
+
+def test_complete_takes_over_an_abandoned_assembly(client, server):
+    content = binary_stl(cube())
+    session = client.post("/api/uploads", json={"filename": "cube.stl", "size": len(content)}).json()
+    response = client.put(
+        f"/api/uploads/{session['id']}", content=content,
+        headers={"Content-Range": f"bytes 0-{len(content) - 1}/{len(content)}"}
+    )
+    assert response.status_code == 200
+
+    def assembling_since(moment):
+        client.portal.call(
+            server.db[UPLOAD_SESSIONS_COLLECTION].update_one,
+            {"id": session["id"]}, {"$set": {"status": "assembling", "assembling_at": moment}}
+        )
+
+    assembling_since(datetime.utcnow())
+    assert client.post(f"/api/uploads/{session['id']}/complete").status_code == 409
+
+    assembling_since(datetime.utcnow() - timedelta(seconds=UPLOAD_ASSEMBLE_STALE_SECONDS + 1))
+    response = client.post(f"/api/uploads/{session['id']}/complete")
+    assert response.status_code == 200
+    assert response.json()["status"] == "complete"
+
+
+def test_purge_sweeps_stale_temp_files():
+    stale, fresh = _write(PARTIAL_DIR / "stale.tmp"), _write(PARTIAL_DIR / "fresh.tmp")
+    long_ago = time.time() - UPLOAD_TEMP_STALE_SECONDS - 1
+    os.utime(stale, (long_ago, long_ago))
+
+    asyncio.run(purge_expired_uploads(AsyncMongoMockClient()["test"]))
+
+    assert not stale.exists()
+    assert fresh.exists()